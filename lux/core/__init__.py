@@ -15,10 +15,23 @@
    :members:
    :member-order: bysource
 
+.. automodule:: lux.core.compiler
+   :members:
+   :member-order: bysource
+
+.. automodule:: lux.core.cache
+   :members:
+   :member-order: bysource
+
 '''
 from .commands import *
 from .extension import *
 from .app import *
 from .wrappers import *
 from .engines import *
+from .context import *
+from .document import *
+from .compiler import *
+from .cache import *
+from .fragments import *
 from .mail import EmailBackend
@@ -1,22 +1,34 @@
+import re
 import sys
 import os
-import json
-from inspect import isclass, getfile
-from collections import OrderedDict
+from inspect import isclass
+from itertools import chain
+from types import MappingProxyType
+from collections import OrderedDict, deque
 from importlib import import_module
+from timeit import default_timer
 
 import pulsar
-from pulsar import ImproperlyConfigured
+from pulsar import ImproperlyConfigured, Future, chain_future
 from pulsar.utils.httpurl import remove_double_slash
-from pulsar.apps.wsgi import (WsgiHandler, HtmlDocument, test_wsgi_environ,
-                              LazyWsgi, wait_for_body_middleware)
+from pulsar.apps.wsgi import (WsgiHandler, HtmlDocument, Links,
+                              test_wsgi_environ, LazyWsgi, WsgiResponse,
+                              wait_for_body_middleware)
 from pulsar.utils.log import lazyproperty
 from pulsar.utils.importer import module_attribute
 
+from lux.utils.stats import Stats, LatencyStats
+
 from .commands import ConsoleParser, CommandError
 from .extension import Extension, Parameter, EventHandler, EventMixin
-from .wrappers import wsgi_request, HeadMeta, error_handler
+from .wrappers import wsgi_request, HeadMeta, error_handler, error_page
 from .engines import template_engine
+from .loader import TemplateLoader
+from .context import TemplateContext
+from .document import clone_document, JsContext
+from .handler import LuxHandler, ProfilingHandler
+from .manifest import CommandManifest
+from .cache import create_cache
 from .cms import CMS
 
 
@@ -134,6 +146,13 @@ class Application(ConsoleParser, Extension, EventMixin):
         method of this :class:`.Application` is accessed by the WSGI
         server.
 
+    .. attribute:: wsgi_handler
+
+        The :class:`.LuxHandler` dispatching requests to the wsgi middleware.
+        It is the same as :attr:`handler` unless the :setting:`GREEN_POOL`
+        parameter is set, in which case :attr:`handler` runs it in the
+        green pool.
+
     .. attribute:: auth_backend
 
         Used by the sessions extension
@@ -144,9 +163,11 @@ class Application(ConsoleParser, Extension, EventMixin):
     logger = None
     admin = None
     handler = None
+    wsgi_handler = None
     auth_backend = None
     _worker = None
-    _WsgiHandler = WsgiHandler
+    _warm_pid = None
+    _WsgiHandler = LuxHandler
     _config = [
         Parameter('EXTENSIONS', [],
                   'List of extension names to use in your application. '
@@ -159,6 +180,20 @@ class Application(ConsoleParser, Extension, EventMixin):
                   'Default encoding for text.'),
         Parameter('ERROR_HANDLER', error_handler,
                   'Handler of Http exceptions'),
+        Parameter('ERROR_PAGES', [404, 500],
+                  'Status codes of html error pages rendered when the '
+                  'application starts, other pages are rendered the first '
+                  'time they are needed. Error pages are built from the html '
+                  'prototype, the on_html_document event is not fired'),
+        Parameter('ERROR_404_FAST_PATHS', None,
+                  'Regular expression for paths of requests, usually from '
+                  'scanners, which receive a plain text 404 response rather '
+                  'than the html error page. For example '
+                  '"\\.(php|asp|cgi)$|^/wp-"'),
+        Parameter('ERROR_404_FAST_AGENTS', None,
+                  'Regular expression for User-Agent headers of clients, '
+                  'such as crawlers, which receive a plain text 404 '
+                  'response rather than the html error page'),
         Parameter('HTML_TITLE', 'Lux',
                   'Default HTML Title'),
         Parameter('MEDIA_URL', '/media/',
@@ -202,10 +237,12 @@ class Application(ConsoleParser, Extension, EventMixin):
                    'lux': 'https://github.com/quantmind/lux',
                    'pulsar': 'http://pythonhosted.org/pulsar'},
                   'Links used throughout the web site'),
-        Parameter('CACHE_SERVER', None,
-                  ('Cache server, can be a connection string to a valid '
-                   'datastore which support the cache protocol or an object '
-                   'supporting the cache protocol')),
+        Parameter('CACHE_SERVER', 'memory://',
+                  ('Cache server, can be a connection string (memory://, '
+                   'file:///path or shm://name) or an object '
+                   'supporting the cache protocol. The memory:// cache is '
+                   'private to each process, use shm:// or file:// when '
+                   'serving with several workers')),
         Parameter('DEFAULT_FROM_EMAIL', '',
                   'Default email address to send email from'),
         Parameter('LOCALE', 'en_GB', 'Default locale', True),
@@ -222,7 +259,33 @@ class Application(ConsoleParser, Extension, EventMixin):
         Parameter('MD_EXTENSIONS', ['extra', 'meta', 'toc'],
                   'List/tuple of markdown extensions'),
         Parameter('GREEN_POOL', 0,
-                  'Run the WSGI handle in a pool of greenlet')
+                  'Run the WSGI handle in a pool of greenlet'),
+        Parameter('HTML_STREAMING', False,
+                  'Stream html responses, the head of the document is sent '
+                  'before the body is rendered so that browsers can fetch '
+                  'stylesheets and scripts early. Streamed responses are '
+                  'compressed when GZIP_STREAMS is set'),
+        Parameter('GREEN_POOL_MAX', 0,
+                  'If larger than GREEN_POOL, the limit of requests served '
+                  'concurrently by the green pool grows up to this value '
+                  'when requests wait and shrinks back to GREEN_POOL when '
+                  'the pool is underused. This is a concurrency limit, '
+                  'greenlets are created on demand by the pool up to the '
+                  'highest limit reached and are not destroyed when the '
+                  'limit shrinks'),
+        Parameter('GREEN_POOL_QUEUE', 0,
+                  'If a positive integer, requests waiting for a free '
+                  'greenlet beyond this number are rejected with a 503 '
+                  'response'),
+        Parameter('EVENT_STATS', False,
+                  'Record number of calls and latency of event handlers. '
+                  'Statistics are available in the application stats'),
+        Parameter('MIDDLEWARE_STATS', False,
+                  'Record latency of wsgi middleware and response '
+                  'middleware by extension and route over a rolling window '
+                  'of STATS_WINDOW seconds'),
+        Parameter('STATS_WINDOW', 600,
+                  'Rolling window in seconds for middleware statistics')
         ]
 
     def __init__(self, callable, handler=True):
@@ -271,15 +334,53 @@ class Application(ConsoleParser, Extension, EventMixin):
         if self.handler is None:
             self._worker = pulsar.get_actor()
             self.cms = CMS(self)
-            self.handler = self._build_handler()
+            self.handler = self.wsgi_handler = self._build_handler()
+            self.template_loader.build()
             self.fire('on_loaded')
+            # build the html document prototype once the handler is ready
+            self.html_prototype
+            if not self.debug:
+                self._render_error_pages()
+            self.compile_events(self.stats if self.config['EVENT_STATS']
+                                else None)
+            if isinstance(self.handler, LuxHandler):
+                self.handler.build_index()
             if self.green_pool:
-                green = WsgiGreen(self.handler, self.green_pool)
                 self.logger.info('Setup green Wsgi handler')
-                self.handler = WsgiHandler((wait_for_body_middleware, green),
-                                           async=True)
+                self.handler = self._green_handler()
         return self.handler
 
+    def warm(self):
+        '''Build the wsgi handler and fire the ``on_warm`` event.
+
+        Used by the ``serve --warm`` command to prepare the application in
+        the arbiter process so that forked workers share it rather than
+        building it on their first request.
+        '''
+        self.get_handler()
+        self.fire('on_warm')
+        self._warm_pid = os.getpid()
+        return self
+
+    def post_fork(self, worker=None):
+        '''Reset process specific resources of a warmed application.
+
+        Invoked after a worker process is forked, it is a no-op if the
+        application was not warmed or it was warmed in the current process.
+        Fires the ``on_fork`` event so that extensions can re-create
+        connection pools.
+        '''
+        pid = os.getpid()
+        if self._warm_pid in (None, pid):
+            return
+        self._warm_pid = pid
+        self._worker = worker or pulsar.get_actor()
+        # the green pool is bound to the event loop of the parent process
+        self.__dict__.pop('_lazy_green_pool', None)
+        if self.green_pool:
+            self.handler = self._green_handler()
+        self.fire('on_fork')
+
     def get_version(self):
         '''Get version of this :class:`App`. Required by
         :class:`.ConsoleParser`.'''
@@ -307,17 +408,37 @@ class Application(ConsoleParser, Extension, EventMixin):
         request.cache.app = self
         return request
 
-    def html_document(self, request):
+    def html_document(self, request, event=True):
         '''Build the HTML document.
 
         Usually there is no need to call directly this method.
         Instead one can use the :attr:`.WsgiRequest.html_document`.
+
+        The document is a clone of the :attr:`html_prototype` on which the
+        ``on_html_document`` event is fired, unless ``event`` is ``False``.
+        '''
+        doc = clone_document(self.html_prototype)
+        if event:
+            self.fire('on_html_document', request, doc)
+        #
+        # Add links last
+        children = doc.head.links.children
+        for link in self._html_links:
+            if link not in children:
+                children.append(link)
+        return doc
+
+    @lazyproperty
+    def html_prototype(self):
+        '''The :class:`.HtmlDocument` prototype used by
+        :meth:`html_document`.
+
+        It is built once, when first accessed, and it contains all the parts of
+        the document which don't depend on a request. Extensions can add to
+        it via the ``on_html_prototype`` event.
         '''
         cfg = self.config
-        site_url = cfg['SITE_URL']
-        media_path = cfg['MEDIA_URL']
-        if site_url:
-            media_path = site_url + media_path
+        media_path = self._media_path
         doc = HtmlDocument(title=cfg['HTML_TITLE'],
                            media_path=media_path,
                            minified=cfg['MINIFIED_MEDIA'],
@@ -325,9 +446,9 @@ class Application(ConsoleParser, Extension, EventMixin):
                            charset=cfg['ENCODING'],
                            asset_protocol=cfg['ASSET_PROTOCOL'])
         doc.meta = HeadMeta(doc.head)
-        doc.jscontext = dict(((p.name, cfg[p.name])
-                              for p in cfg['_parameters'].values()
-                              if p.jscontext))
+        doc.jscontext = JsContext(((p.name, cfg[p.name])
+                                   for p in cfg['_parameters'].values()
+                                   if p.jscontext))
         # Locale
         lang = cfg['LOCALE'][:2]
         doc.attr('lang', lang)
@@ -345,38 +466,96 @@ class Application(ConsoleParser, Extension, EventMixin):
         for entry in cfg['HTML_META'] or ():
             head.add_meta(**entry)
 
-        self.fire('on_html_document', request, doc)
-        #
-        # Add links last
-        links = head.links
+        self.fire('on_html_prototype', doc)
+        doc.jscontext.freeze()
+        return doc
+
+    @lazyproperty
+    def _media_path(self):
+        cfg = self.config
+        site_url = cfg['SITE_URL']
+        media_path = cfg['MEDIA_URL']
+        if site_url:
+            media_path = site_url + media_path
+        return media_path
+
+    @lazyproperty
+    def _html_links(self):
+        cfg = self.config
+        links = Links(self._media_path, minified=cfg['MINIFIED_MEDIA'],
+                      asset_protocol=cfg['ASSET_PROTOCOL'])
         for link in cfg['HTML_LINKS']:
             if isinstance(link, dict):
                 links.append(**link)
             else:
                 links.append(link)
-        return doc
+        return tuple(links.children)
 
     @lazyproperty
     def commands(self):
-        '''Load all commands from installed applications'''
-        cmnds = OrderedDict()
-        for e in self.config['EXTENSIONS']:
-            try:
-                modname = e + ('.core' if e == 'lux' else '') + '.commands'
-                mod = import_module(modname)
-                if hasattr(mod, '__path__'):
-                    path = os.path.dirname(getfile(mod))
-                    try:
-                        commands = tuple((f[:-3] for f in os.listdir(path)
-                                          if not f.startswith('_') and
-                                          f.endswith('.py')))
-                        if commands:
-                            cmnds[e] = commands
-                    except OSError:
-                        continue
-            except ImportError:
-                pass    # No management module
-        return cmnds
+        '''Load all commands from installed applications.
+
+        Commands are discovered without importing the ``commands`` packages
+        and cached in a :class:`.CommandManifest`, which is used without
+        checking the ``commands`` directories while the settings file and
+        the versions of extensions do not change.
+        '''
+        manifest = CommandManifest(self.config_module,
+                                   self.config['EXTENSIONS'],
+                                   stamp=self._commands_stamp())
+        return manifest.commands()
+
+    @lazyproperty
+    def cache_server(self):
+        '''The :class:`.Cache` server of this application, created from
+        the :setting:`CACHE_SERVER` parameter
+        '''
+        return create_cache(self, self.config['CACHE_SERVER'])
+
+    @lazyproperty
+    def error_pages(self):
+        '''Dictionary of rendered html error pages by status code
+        '''
+        return {}
+
+    def fast_404(self, environ):
+        '''Check if a request resulting in a 404 should receive a plain
+        text response, see :setting:`ERROR_404_FAST_PATHS` and
+        :setting:`ERROR_404_FAST_AGENTS`
+        '''
+        paths, agents = self._fast_404
+        return bool((paths and paths.search(environ.get('PATH_INFO', ''))) or
+                    (agents and agents.search(
+                        environ.get('HTTP_USER_AGENT', ''))))
+
+    @lazyproperty
+    def stats(self):
+        '''Runtime :class:`.Stats` of this application
+        '''
+        return Stats()
+
+    @lazyproperty
+    def _fast_404(self):
+        return tuple((re.compile(value, re.IGNORECASE) if value else None
+                      for value in (self.config['ERROR_404_FAST_PATHS'],
+                                    self.config['ERROR_404_FAST_AGENTS'])))
+
+    @lazyproperty
+    def _config_proxy(self):
+        return MappingProxyType(self.config)
+
+    @lazyproperty
+    def _context_extensions(self):
+        providers = {}
+        extensions = []
+        for ext in self.extensions.values():
+            if hasattr(ext, 'context'):
+                if ext.context_keys:
+                    for key in ext.context_keys:
+                        providers[key] = ext
+                else:
+                    extensions.append(ext)
+        return providers, tuple(extensions)
 
     @lazyproperty
     def email_backend(self):
@@ -456,23 +635,28 @@ class Application(ConsoleParser, Extension, EventMixin):
         return dte.strftime(self.config['DATETIME_FORMAT'])
 
     # Template redering
+    @lazyproperty
+    def template_loader(self):
+        '''The :class:`.TemplateLoader` for this application.
+
+        The index of templates is built once, when the wsgi handler
+        is loaded.
+        '''
+        dirs = [os.path.join(ext.meta.path, 'templates')
+                for ext in reversed(tuple(self.extensions.values()))]
+        dirs.append(os.path.join(LUX_CORE, 'templates'))
+        return TemplateLoader(self, (d for d in dirs if os.path.isdir(d)))
+
     def template_full_path(self, names):
         '''Return the template full path or None.
 
-        Loops through all :attr:`extensions` in reversed order and
-        check for ``name`` within the ``templates`` directory
-        '''
-        if not isinstance(names, (list, tuple)):
-            names = (names,)
-        for name in names:
-            for ext in reversed(tuple(self.extensions.values())):
-                filename = os.path.join(ext.meta.path, 'templates', name)
-                if os.path.exists(filename):
-                    return filename
-            filename = os.path.join(LUX_CORE, 'templates', name)
-            if os.path.exists(filename):
-                return filename
-        self.logger.error('Template %s not found' % name)
+        The lookup uses the :attr:`template_loader` index, built from the
+        ``templates`` directory of all :attr:`extensions` in reversed order.
+        '''
+        filename = self.template_loader.full_path(names)
+        if not filename:
+            self.logger.error('Template %s not found' % (names,))
+        return filename
 
     def template(self, name):
         '''Load a template from the file system.
@@ -484,11 +668,7 @@ class Application(ConsoleParser, Extension, EventMixin):
 
         If the file is not found an empty string is returned.
         '''
-        filename = self.template_full_path(name)
-        if filename:
-            with open(filename, 'r') as file:
-                return file.read()
-        return ''
+        return self.template_loader.source(name)
 
     def context(self, request, context=None):
         '''Load the ``context`` dictionary for a ``request``.
@@ -497,14 +677,19 @@ class Application(ConsoleParser, Extension, EventMixin):
         :meth:`render_template` method is used and a the wsgi ``request``
         is passed as key-valued parameter.
 
-        The initial ``context`` is updated with contribution from
-        all :setting:`EXTENSIONS` which expose the ``context`` method.
+        The returned :class:`.TemplateContext` layers the initial ``context``
+        over a read-only view of the application config. Extensions declaring
+        :attr:`~.Extension.context_keys` are asked for their contribution
+        only when one of those keys is looked up, all other
+        :setting:`EXTENSIONS` exposing the ``context`` method are invoked
+        straight away.
         '''
-        context = context if context is not None else {}
-        context.update(request.app.config)
-        for ext in self.extensions.values():
-            if hasattr(ext, 'context'):
-                context = ext.context(request, context) or context
+        providers, extensions = self._context_extensions
+        context = TemplateContext(request,
+                                  context if context is not None else {},
+                                  self._config_proxy, providers)
+        for ext in extensions:
+            context = ext.context(request, context) or context
         return context
 
     def render_template(self, name, context=None, request=None, engine=None):
@@ -512,21 +697,33 @@ class Application(ConsoleParser, Extension, EventMixin):
         '''
         if request:
             context = self.context(request, context)
-        template = self.template(name)
-        rnd = self.template_engine(engine)
-        return rnd(template, context)
+        template = self.template_loader.get(name, self.template_engine(engine))
+        return template(context)
 
     def template_engine(self, engine=None):
         engine = engine or self.config['DEFAULT_TEMPLATE_ENGINE']
         return template_engine(engine)
 
     def html_response(self, request, template_name, context=None,
-                      jscontext=None, title=None, status_code=None):
+                      jscontext=None, title=None, status_code=None,
+                      stream=None):
         '''Html response via a template.
 
         :param request: the :class:`.WsgiRequest`
         :param template_name: the template file name to load
-        :param context: optional context dictionary
+        :param context: optional context dictionary or a callable
+            returning the context dictionary
+        :param stream: stream the response, the head of the document is
+            sent as the first chunk and the body follows once the template
+            is rendered. If not given the :setting:`HTML_STREAMING`
+            parameter is used.
+
+        The context is resolved before the response is returned, so that
+        errors raised while building it, such as :class:`.Http404`, and
+        cookies it sets are part of the response even when streaming.
+        When streaming, the head and the attributes of the body are sent
+        before the template is rendered, changes to them while rendering
+        are not sent, with the exception of the javascript context.
         '''
         if 'text/html' in request.content_types:
             request.response.content_type = 'text/html'
@@ -538,9 +735,19 @@ class Application(ConsoleParser, Extension, EventMixin):
                 head.title = title % head.title
             if status_code:
                 request.response.status_code = status_code
+            if callable(context):
+                context = context()
             context = self.context(request, context)
+            if stream is None:
+                stream = self.config['HTML_STREAMING']
+            if stream and not request.cache.building_static:
+                response = request.response
+                response.encoding = doc.charset
+                response.content = self._html_stream(request, doc,
+                                                     template_name, context)
+                return response
             if doc.jscontext:
-                jscontext = json.dumps(doc.jscontext)
+                jscontext = doc.jscontext.dumps()
                 doc.head.embedded_js.insert(
                     0, 'var lux = {context: %s};\n' % jscontext)
             body = self.render_template(template_name, context)
@@ -582,7 +789,9 @@ class Application(ConsoleParser, Extension, EventMixin):
     def green_pool(self):
         if self.config['GREEN_POOL']:
             from pulsar.apps.greenio import GreenPool
-            return GreenPool(self.config['GREEN_POOL'])
+            # an upper bound, greenlets are created when tasks are submitted
+            return GreenPool(max(self.config['GREEN_POOL'],
+                                 self.config['GREEN_POOL_MAX']))
 
     # INTERNALS
     def _build_config(self, module_name):
@@ -616,13 +825,21 @@ class Application(ConsoleParser, Extension, EventMixin):
             config['MEDIA_URL'] = remove_double_slash('/%s/' % media_url)
         config['EXTENSIONS'] = tuple(apps)
         config['EXTENSION_HANDLERS'] = extensions = OrderedDict()
+        profile = [] if opts.startup_profile else None
         for name in config['EXTENSIONS'][1:]:
+            start = default_timer()
             Ext = self.load_extension(name)
+            loaded = default_timer()
             if Ext:
                 extension = Ext()
                 extensions[extension.meta.name] = extension
                 self.bind_events(extension)
                 extension.setup(config, config_module, self.params)
+            if profile is not None:
+                setup = default_timer() - loaded
+                profile.append((name, loaded - start, setup))
+        if profile is not None:
+            self._startup_profile(profile)
         return config
 
     def _build_handler(self):
@@ -635,17 +852,110 @@ class Application(ConsoleParser, Extension, EventMixin):
         extensions = list(self.extensions.values())
         middleware = []
         rmiddleware = []
+        owners = {}
         for extension in extensions:
             _middleware = extension.middleware(self)
             if _middleware:
                 middleware.extend(_middleware)
-            _middleware = extension.response_middleware(self)
-            if _middleware:
-                rmiddleware.extend(_middleware)
+            _rmiddleware = extension.response_middleware(self)
+            if _rmiddleware:
+                rmiddleware.extend(_rmiddleware)
+            for m in chain(_middleware or (), _rmiddleware or ()):
+                owners[id(m)] = extension.meta.name
         # Response middleware executed in reversed order
         rmiddleware = list(reversed(rmiddleware))
+        if self.config['MIDDLEWARE_STATS']:
+            window = self.config['STATS_WINDOW']
+            return ProfilingHandler(middleware,
+                                    response_middleware=rmiddleware,
+                                    stats=self.stats,
+                                    extensions=owners,
+                                    interval=window/10)
         return self._WsgiHandler(middleware, response_middleware=rmiddleware)
 
+    def _render_error_pages(self):
+        '''Pre-render error pages, pages which fail are rendered when
+        first served
+        '''
+        try:
+            request = self.wsgi_request()
+        except Exception:
+            self.logger.exception('Could not pre-render error pages')
+            return
+        for status_code in self.config['ERROR_PAGES']:
+            if status_code not in self.error_pages:
+                try:
+                    error_page(self, request, status_code)
+                except Exception:
+                    self.logger.exception('Could not pre-render the %s '
+                                          'error page', status_code)
+
+    def _html_stream(self, request, doc, template_name, context):
+        '''Stream the html document, the head first
+        '''
+        jscontext = None
+        if doc.jscontext:
+            jscontext = doc.jscontext.dumps()
+            doc.head.embedded_js.insert(
+                0, 'var lux = {context: %s};\n' % jscontext)
+        yield ('<!DOCTYPE html>\n<html%s>\n%s<body%s>\n' %
+               (doc.flatatt(), doc.head.render(request), doc.body.flatatt()))
+        yield self._html_body(request, doc, template_name, context,
+                              jscontext)
+        yield '</body>\n</html>'
+
+    def _html_body(self, request, doc, template_name, context, jscontext):
+        '''The inner html of the body of a streamed document
+        '''
+        doc.body.append(self.render_template(template_name, context))
+        body = doc.body.render(request)
+        body = body[body.index('>') + 1:body.rindex('</body>')]
+        if doc.jscontext:
+            current = doc.jscontext.dumps()
+            if current != jscontext:
+                # the javascript context changed once the head was sent
+                body += ('<script>var lux = lux || {context: {}};'
+                         '(function (c) {for (var k in c) lux.context[k] = '
+                         'c[k];}(%s));</script>\n' % current)
+        return body
+
+    def _green_handler(self):
+        cfg = self.config
+        green = WsgiGreen(self.wsgi_handler, self.green_pool,
+                          cfg['GREEN_POOL'], cfg['GREEN_POOL_MAX'],
+                          cfg['GREEN_POOL_QUEUE'])
+        self.stats['green_pool'] = green
+        return WsgiHandler((wait_for_body_middleware, green), async=True)
+
+    def _commands_stamp(self):
+        '''Modification time of the settings file and versions of the
+        extensions, ``None`` if not available
+        '''
+        module = sys.modules.get(self.config_module)
+        try:
+            mtime = os.stat(module.__file__).st_mtime
+        except (AttributeError, TypeError, OSError):
+            return
+        versions = ['%s=%s' % (name, ext.meta.version)
+                    for name, ext in self.extensions.items()]
+        return '%s:%s:%s' % (mtime, self.meta.version, ','.join(versions))
+
+    def _startup_profile(self, profile):
+        '''Write the import and setup time of extensions into stderr'''
+        width = max([9] + [len(p[0]) for p in profile])
+        row = '%-' + str(width) + 's  %9s  %9s'
+        lines = ['', 'Startup profile (milliseconds)',
+                 row % ('extension', 'import', 'setup')]
+        total_import = total_setup = 0
+        for name, imported, setup in profile:
+            total_import += imported
+            total_setup += setup
+            lines.append(row % (name, '%.2f' % (1000*imported),
+                                '%.2f' % (1000*setup)))
+        lines.append(row % ('total', '%.2f' % (1000*total_import),
+                            '%.2f' % (1000*total_setup)))
+        self.write_err('\n'.join(lines))
+
     def _setup_logger(self, config, module, opts):
         debug = opts.debug or self.params.get('debug', False)
         cfg = pulsar.Config()
@@ -657,19 +967,101 @@ class Application(ConsoleParser, Extension, EventMixin):
 
 
 class WsgiGreen:
-    '''Wraps a Wsgi application to be executed on a pool of greenlet
+    '''Wraps a Wsgi application to be executed on a pool of greenlet.
+
+    At most :attr:`size` requests are executed at the same time, other
+    requests wait in a queue. When ``max_size`` is larger than ``size``,
+    the limit grows when requests would have to wait and shrinks back
+    when less than half of it is in use. :attr:`size` is a concurrency
+    limit rather than the size of the ``pool``, which creates greenlets on
+    demand, never more than the limit, and keeps them when it shrinks.
+    When ``max_queue`` is positive, requests are rejected with a 503
+    response once the queue is full.
+
+    The time requests wait for a greenlet and the state of the pool are
+    available, via :meth:`tojson`, in the application
+    :attr:`~.Application.stats` as ``green_pool``.
     '''
-    def __init__(self, wsgi, pool):
+    shrink_interval = 1
+
+    def __init__(self, wsgi, pool, size, max_size=0, max_queue=0):
         from pulsar.apps.greenio import wait
         self.wsgi = wsgi
         self.pool = pool
         self.wait = wait
+        self.size = self.min_size = size
+        self.max_size = max(size, max_size)
+        self.max_queue = max_queue
+        self.active = 0
+        self.rejected = 0
+        self.queue = deque()
+        self.waits = LatencyStats()
+        self._resized = default_timer()
 
     def __call__(self, environ, start_response):
-        return self.pool.submit(self._green_handler, environ, start_response)
+        if self.active >= self.size and self.size < self.max_size:
+            self.size += 1
+            self._resized = default_timer()
+        if self.active < self.size:
+            return self._submit(environ, start_response, default_timer())
+        if self.max_queue and len(self.queue) >= self.max_queue:
+            self.rejected += 1
+            return self.overload(environ)
+        waiter = Future()
+        self.queue.append((waiter, environ, start_response, default_timer()))
+        return waiter
 
-    def _green_handler(self, environ, start_response):
+    @property
+    def saturation(self):
+        '''Fraction of greenlets executing requests
+        '''
+        return self.active / self.size
+
+    def overload(self, environ):
+        '''The response when the queue is full
+        '''
+        return WsgiResponse(503, b'Service Unavailable',
+                            content_type='text/plain',
+                            response_headers=[('Retry-After', '1')],
+                            environ=environ)
+
+    def tojson(self):
+        data = self.waits.tojson()
+        data.update({'size': self.size,
+                     'active': self.active,
+                     'queued': len(self.queue),
+                     'saturation': self.saturation,
+                     'rejected': self.rejected})
+        return data
+
+    def reset(self):
+        self.waits.reset()
+        self.rejected = 0
+
+    def _submit(self, environ, start_response, queued):
+        self.active += 1
+        future = self.pool.submit(self._green_handler, environ,
+                                  start_response, queued)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        self.active -= 1
+        while self.queue and self.active < self.size:
+            waiter, environ, start_response, queued = self.queue.popleft()
+            if not waiter.done():
+                chain_future(self._submit(environ, start_response, queued),
+                             next=waiter)
+        if (not self.queue and self.size > self.min_size and
+                self.active < self.size // 2):
+            now = default_timer()
+            if now - self._resized > self.shrink_interval:
+                self.size -= 1
+                self._resized = now
+
+    def _green_handler(self, environ, start_response, queued):
         # Running on a greenlet worker
+        self.waits.add(default_timer() - queued)
         return self.wait(self.wsgi(environ, start_response))
 
 
@@ -0,0 +1,509 @@
+'''Cache servers for lux applications.
+
+The cache server of an :class:`.Application` is created from the
+:setting:`CACHE_SERVER` parameter, a connection string whose scheme selects
+the cache implementation:
+
+* ``memory://`` an in-process LRU dictionary
+* ``file:///path/to/directory`` one pickle file per key
+* ``shm://name`` a sqlite database in shared memory (``/dev/shm`` where
+  available) shared by all processes running the application
+
+The ``memory://`` cache, the default, is private to each process. When an
+application is served by several worker processes, purging the response
+cache, invalidating fragments and revoking tokens only affect the process
+handling the request; use ``shm://`` or ``file://`` to share them.
+
+The ``file://`` and ``shm://`` caches store pickled values, they are kept
+in directories accessible by the current user only.
+
+Query parameters configure the cache, for example
+``memory://?max_entries=5000&timeout=60``:
+
+* ``timeout`` default time to live in seconds (``0`` for no expiry)
+* ``max_entries`` maximum number of keys, least recently used keys are
+  evicted once the limit is reached
+
+Additional schemes are added via :func:`register_cache`.
+'''
+import os
+import time
+import pickle
+import sqlite3
+import tempfile
+from hashlib import md5
+from threading import Lock
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from pulsar import ImproperlyConfigured
+from pulsar.utils.httpurl import urlparse, parse_qsl
+
+from lux.utils.files import private_directory
+
+
+__all__ = ['Cache', 'MemoryCache', 'FileCache', 'SharedMemoryCache',
+           'create_cache', 'register_cache']
+
+
+cache_stores = {}
+
+
+def register_cache(scheme, factory):
+    '''Register a cache ``factory`` for a connection string ``scheme``.
+
+    The factory is called with the application, the path and the
+    dictionary of query parameters of the connection string.
+    '''
+    cache_stores[scheme] = factory
+
+
+def create_cache(app, url):
+    '''Create a :class:`.Cache` from a connection string ``url``.
+
+    If ``url`` is not a string it is returned as it is.
+    '''
+    if not isinstance(url, str):
+        return url
+    p = urlparse(url)
+    factory = cache_stores.get(p.scheme)
+    if factory is None:
+        raise ImproperlyConfigured('Cache server "%s" not available' % url)
+    params = dict(parse_qsl(p.query))
+    path = p.netloc + p.path
+    return factory(app, path, **params)
+
+
+class Cache:
+    '''Base class for cache servers.
+
+    .. attribute:: timeout
+
+        Default time to live, in seconds, of keys. ``0`` for no expiry.
+
+    .. attribute:: max_entries
+
+        Maximum number of keys stored.
+    '''
+    def __init__(self, app, name, timeout=300, max_entries=1000):
+        self.app = app
+        self.name = name
+        self.timeout = float(timeout)
+        self.max_entries = int(max_entries)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.name)
+    __str__ = __repr__
+
+    def get(self, key, default=None):
+        '''Get the value at ``key`` or ``default`` if not available'''
+        raise NotImplementedError
+
+    def set(self, key, value, timeout=None):
+        '''Set ``value`` at ``key``.
+
+        :param timeout: optional time to live in seconds, if not given
+            the default :attr:`timeout` is used.
+        '''
+        raise NotImplementedError
+
+    def add(self, key, value, timeout=None):
+        '''Set ``value`` at ``key`` only if ``key`` is not available.
+
+        :return: ``True`` if the value was set
+        '''
+        raise NotImplementedError
+
+    def delete(self, key):
+        '''Delete ``key``, return ``True`` if the key was available'''
+        raise NotImplementedError
+
+    def incr(self, key, delta=1, timeout=None):
+        '''Increment the integer at ``key`` by ``delta``.
+
+        If ``key`` is not available it is set to ``delta``.
+        :return: the new value
+        '''
+        raise NotImplementedError
+
+    def clear(self):
+        '''Remove all keys'''
+        raise NotImplementedError
+
+    def stats(self):
+        '''Dictionary of hit and miss statistics'''
+        total = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+                'evictions': self.evictions}
+
+    def _expiry(self, timeout):
+        if timeout is None:
+            timeout = self.timeout
+        return time.time() + timeout if timeout else 0
+
+    def _hit(self, value):
+        self.hits += 1
+        return value
+
+    def _miss(self, default):
+        self.misses += 1
+        return default
+
+
+class MemoryCache(Cache):
+    '''A least recently used cache in the memory of the current process.
+
+    Values are stored as they are, they are not copied.
+    '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return self._miss(default)
+            if entry[0] and entry[0] < time.time():
+                self._data.pop(key)
+                return self._miss(default)
+            self._data.move_to_end(key)
+            return self._hit(entry[1])
+
+    def set(self, key, value, timeout=None):
+        with self._lock:
+            self._set(key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and not (entry[0] and
+                                          entry[0] < time.time()):
+                return False
+            self._set(key, value, timeout)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def incr(self, key, delta=1, timeout=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or (entry[0] and entry[0] < time.time()):
+                value = delta
+                self._set(key, value, timeout)
+            else:
+                value = entry[1] + delta
+                self._data[key] = (entry[0], value)
+                self._data.move_to_end(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def _set(self, key, value, timeout):
+        data = self._data
+        data[key] = (self._expiry(timeout), value)
+        data.move_to_end(key)
+        while len(data) > self.max_entries:
+            data.popitem(last=False)
+            self.evictions += 1
+
+
+class FileCache(Cache):
+    '''A cache storing each key in a pickle file of a directory.
+
+    The file modification time is updated when a key is read, so that least
+    recently used keys are evicted first. Keys are evicted in batches of a
+    tenth of :attr:`max_entries` once the number of files, counted by each
+    process, exceeds it.
+
+    The directory is created with mode ``0o700`` if it does not exist.
+    Without a path, a directory private to the current user is created in
+    the temporary directory.
+    '''
+    def __init__(self, app, name, **kwargs):
+        super().__init__(app, name, **kwargs)
+        if name:
+            self.directory = os.path.abspath(name)
+            os.makedirs(self.directory, 0o700, exist_ok=True)
+        else:
+            self.directory = private_directory('lux-cache')
+        self._lock = Lock()
+        self._count = len(self._files())
+
+    def __len__(self):
+        return len(self._files())
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        entry = self._read(path)
+        if entry is None:
+            return self._miss(default)
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return self._hit(entry[1])
+
+    def set(self, key, value, timeout=None):
+        self._write(key, value, self._expiry(timeout))
+
+    def add(self, key, value, timeout=None):
+        with self._lock:
+            if self._read(self._path(key)) is not None:
+                return False
+            self.set(key, value, timeout)
+            return True
+
+    def delete(self, key):
+        return self._remove(self._path(key))
+
+    def incr(self, key, delta=1, timeout=None):
+        with self._lock:
+            entry = self._read(self._path(key))
+            if entry is None:
+                value = delta
+                expiry = self._expiry(timeout)
+            else:
+                value = entry[1] + delta
+                expiry = entry[0]
+            self._write(key, value, expiry)
+            return value
+
+    def clear(self):
+        for path in self._files():
+            self._remove(path)
+        self._count = 0
+
+    def _path(self, key):
+        name = md5(pickle.dumps(key)).hexdigest()
+        return os.path.join(self.directory, '%s.cache' % name)
+
+    def _files(self):
+        try:
+            return [os.path.join(self.directory, name)
+                    for name in os.listdir(self.directory)
+                    if name.endswith('.cache')]
+        except OSError:
+            return []
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as fp:
+                entry = pickle.load(fp)
+        except (OSError, EOFError, pickle.PickleError):
+            return
+        if entry[0] and entry[0] < time.time():
+            self._remove(path)
+            return
+        return entry
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            return False
+        self._count -= 1
+        return True
+
+    def _write(self, key, value, expiry):
+        path = self._path(key)
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as fp:
+            pickle.dump((expiry, value), fp, pickle.HIGHEST_PROTOCOL)
+        if not os.path.exists(path):
+            self._count += 1
+        os.replace(tmp, path)
+        if self._count > self.max_entries:
+            self._cull()
+
+    def _cull(self):
+        files = self._files()
+        self._count = len(files)
+        excess = self._count - self.max_entries
+        if excess > 0:
+            excess += self.max_entries // 10
+            files = sorted(files, key=_mtime)
+            for path in files[:excess]:
+                if self._remove(path):
+                    self.evictions += 1
+
+
+class SharedMemoryCache(Cache):
+    '''A cache shared by all processes of an application.
+
+    Keys are stored in a sqlite database located in a directory of the
+    current user in ``/dev/shm`` when available, otherwise in the temporary
+    directory. A connection is opened for each process. Hit and miss
+    statistics are per process.
+
+    Reads do not write to the database, access times are recorded with the
+    next write of the process. The number of keys is maintained by
+    triggers.
+    '''
+    def __init__(self, app, name, **kwargs):
+        super().__init__(app, name, **kwargs)
+        base = '/dev/shm' if os.path.isdir('/dev/shm') else None
+        self.path = os.path.join(private_directory('lux', base),
+                                 '%s.sqlite' % (name or 'cache'))
+        self._lock = Lock()
+        self._pid = None
+        self._connection = None
+        self._accessed = {}
+
+    def __len__(self):
+        with self._lock:
+            return self._size(self.connection)
+
+    def get(self, key, default=None):
+        key = self._key(key)
+        with self._lock:
+            row = self._get(self.connection, key)
+            if row is not None:
+                self._accessed[key] = time.time()
+                if len(self._accessed) > self.max_entries:
+                    with self._transaction(False) as db:
+                        self._touch(db)
+        if row is None:
+            return self._miss(default)
+        return self._hit(pickle.loads(row[1]))
+
+    def set(self, key, value, timeout=None):
+        with self._transaction() as db:
+            self._set(db, self._key(key), value, self._expiry(timeout))
+
+    def add(self, key, value, timeout=None):
+        key = self._key(key)
+        with self._transaction() as db:
+            if self._get(db, key) is not None:
+                return False
+            self._set(db, key, value, self._expiry(timeout))
+            return True
+
+    def delete(self, key):
+        with self._transaction() as db:
+            cursor = db.execute('DELETE FROM cache WHERE key=?',
+                                (self._key(key),))
+            return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, timeout=None):
+        key = self._key(key)
+        with self._transaction() as db:
+            row = self._get(db, key)
+            if row is None:
+                value, expiry = delta, self._expiry(timeout)
+            else:
+                value, expiry = pickle.loads(row[1]) + delta, row[0]
+            self._set(db, key, value, expiry)
+        return value
+
+    def clear(self):
+        with self._transaction() as db:
+            db.execute('DELETE FROM cache')
+            self._accessed.clear()
+
+    @property
+    def connection(self):
+        '''The sqlite connection of the current process'''
+        pid = os.getpid()
+        if self._pid != pid:
+            connection = sqlite3.connect(self.path, timeout=10,
+                                         isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            # fire the delete trigger on INSERT OR REPLACE
+            connection.execute('PRAGMA recursive_triggers=ON')
+            connection.executescript(SCHEMA)
+            self._connection = connection
+            self._pid = pid
+            self._accessed = {}
+        return self._connection
+
+    @contextmanager
+    def _transaction(self, lock=True):
+        if lock:
+            with self._lock:
+                with self._transaction(False) as db:
+                    yield db
+        else:
+            db = self.connection
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                yield db
+            except Exception:
+                db.execute('ROLLBACK')
+                raise
+            else:
+                db.execute('COMMIT')
+
+    def _key(self, key):
+        return key if isinstance(key, str) else repr(key)
+
+    def _get(self, db, key):
+        row = db.execute('SELECT expiry, value FROM cache WHERE key=?',
+                         (key,)).fetchone()
+        if row is not None and row[0] and row[0] < time.time():
+            db.execute('DELETE FROM cache WHERE key=?', (key,))
+            row = None
+        return row
+
+    def _set(self, db, key, value, expiry):
+        self._touch(db)
+        value = sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        db.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)',
+                   (key, expiry, time.time(), value))
+        excess = self._size(db) - self.max_entries
+        if excess > 0:
+            db.execute('DELETE FROM cache WHERE key IN (SELECT key FROM '
+                       'cache ORDER BY accessed LIMIT ?)', (excess,))
+            self.evictions += excess
+
+    def _size(self, db):
+        return db.execute('SELECT entries FROM cache_size').fetchone()[0]
+
+    def _touch(self, db):
+        '''Record access times of keys read since the last write'''
+        if self._accessed:
+            accessed, self._accessed = self._accessed, {}
+            db.executemany('UPDATE cache SET accessed=? WHERE key=?',
+                           ((t, key) for key, t in accessed.items()))
+
+
+SCHEMA = '''
+BEGIN IMMEDIATE;
+CREATE TABLE IF NOT EXISTS cache
+    (key TEXT PRIMARY KEY, expiry REAL, accessed REAL, value BLOB);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE TABLE IF NOT EXISTS cache_size (entries INTEGER);
+INSERT INTO cache_size SELECT COUNT(*) FROM cache
+    WHERE NOT EXISTS (SELECT 1 FROM cache_size);
+CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache
+    BEGIN UPDATE cache_size SET entries = entries + 1; END;
+CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache
+    BEGIN UPDATE cache_size SET entries = entries - 1; END;
+COMMIT;
+'''
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return 0
+
+
+register_cache('memory', MemoryCache)
+register_cache('file', FileCache)
+register_cache('shm', SharedMemoryCache)
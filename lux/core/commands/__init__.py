@@ -10,7 +10,8 @@ import logging
 
 from pulsar import (Setting, get_event_loop, Application, ImproperlyConfigured,
                     asyncio, Config, get_actor, is_async)
-from pulsar.utils.config import Loglevel, Debug, LogHandlers
+from pulsar.utils.config import (Loglevel, Debug, LogHandlers, Global,
+                                 validate_bool)
 
 from lux import __version__
 
@@ -24,6 +25,15 @@ class CommandError(ImproperlyConfigured):
     pass
 
 
+class StartupProfile(Global):
+    name = 'startup_profile'
+    flags = ['--startup-profile']
+    action = 'store_true'
+    default = False
+    validator = validate_bool
+    desc = '''Report the time taken to import and setup each extension'''
+
+
 class ConsoleParser(object):
     '''A class for parsing the console inputs.
 
@@ -33,7 +43,8 @@ class ConsoleParser(object):
     option_list = ()
     default_option_list = (Loglevel(),
                            LogHandlers(default=['console']),
-                           Debug())
+                           Debug(),
+                           StartupProfile())
 
     @property
     def config_module(self):
@@ -63,7 +74,8 @@ class ConsoleParser(object):
 
 class LuxApp(Application):
     name = 'lux'
-    cfg = Config(include=('loglevel', 'loghandlers', 'debug', 'config'))
+    cfg = Config(include=('loglevel', 'loghandlers', 'debug', 'config',
+                          'startup_profile'))
 
     def __call__(self, actor=None):
         try:
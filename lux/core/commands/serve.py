@@ -1,21 +1,41 @@
 import logging
 
 import pulsar
+from pulsar import Setting
 from pulsar.apps import wsgi
 from pulsar.utils.log import clear_logger
 
 import lux
 
 
+def post_fork(actor):
+    '''Reset a warmed application in a forked worker'''
+    app = getattr(actor.cfg, 'callable', None)
+    if isinstance(app, lux.App):
+        application = app.local.handler
+        if isinstance(application, lux.Application):
+            application.post_fork(actor)
+
+
 class Command(lux.Command):
     help = "Starts a fully-functional Web server using pulsar"
+    option_list = (
+        Setting('warm',
+                ('--warm',),
+                action='store_true',
+                default=False,
+                desc=('Build and warm the wsgi handler before forking '
+                      'workers, so that workers share it')),
+    )
 
     def __call__(self, argv, start=True):
         app = self.app
-        server = self.pulsar_app(argv, wsgi.WSGIServer)
+        server = self.pulsar_app(argv, wsgi.WSGIServer, post_fork=post_fork)
         if start and not server.logger:   # pragma    nocover
             if not pulsar.get_actor():
                 clear_logger()
+            if server.cfg.warm:
+                app.callable.local.handler = app.warm()
             app._started = server()
             app.on_start(server)
             arbiter = pulsar.arbiter()
@@ -0,0 +1,50 @@
+from pulsar import Setting
+from pulsar.utils.httpurl import urllibr
+from pulsar.utils.system import json
+
+import lux
+
+
+class Command(lux.Command):
+    help = "Show the runtime statistics of a running application."
+    option_list = (
+        Setting('url', ('--url',),
+                desc=('Url of the statistics endpoint. By default it is '
+                      'built from the SITE_URL and STATS_URL parameters')),
+        Setting('prefix', ('--prefix',),
+                desc=('Show only statistics with names starting with prefix, '
+                      'for example "route:" or "extension:"')),
+        Setting('reset', ('--reset',),
+                default=False,
+                action='store_true',
+                desc=('Reset statistics')),
+    )
+
+    def run(self, options, **params):
+        url = options.url
+        if not url:
+            path = self.app.config.get('STATS_URL')
+            if not path:
+                raise lux.CommandError('STATS_URL not available')
+            url = self.app.site_url(path)
+        if options.reset:
+            request = urllibr.Request(url, method='DELETE')
+            urllibr.urlopen(request)
+            self.write('Statistics reset')
+            return
+        response = urllibr.urlopen(url)
+        stats = json.loads(response.read().decode('utf-8'))
+        if options.prefix:
+            stats = dict(((name, data) for name, data in stats.items()
+                          if name.startswith(options.prefix)))
+        self.write_stats(stats)
+        return stats
+
+    def write_stats(self, stats):
+        self.write('%-60s %8s %10s %9s %9s %9s' % ('name', 'calls', 'total',
+                                                   'p50', 'p90', 'p99'))
+        for name, data in sorted(stats.items(),
+                                 key=lambda s: s[1]['total'], reverse=True):
+            self.write('%-60s %8d %10.4f %9.5f %9.5f %9.5f' % (
+                name, data['count'], data['total'], data['p50'],
+                data['p90'], data['p99']))
@@ -0,0 +1,513 @@
+'''The ``lux`` template engine.
+
+Templates are compiled once into python code objects and cached by the
+:class:`.TemplateLoader` of the application. The syntax supports::
+
+    {{ expression|filter|filter(arg) }}
+    {% extends "base.html" %}
+    {% block name %}...{% endblock %}
+    {% include "partials/nav.html" %}
+    {% for item in items %}...{% else %}...{% endfor %}
+    {% if condition %}...{% elif other %}...{% else %}...{% endif %}
+    {% set name = expression %}
+    {# comment #}
+
+Expressions are python expressions evaluated against the context
+dictionary. Attribute access falls back to item access, so that
+``{{ user.name }}`` works for both objects and dictionaries, and undefined
+names render as an empty string. Templates can use a subset of the
+python builtins, names and attributes starting with an underscore are not
+available and the ``format`` methods of strings are blocked, since they
+give access to attributes too. Templates are not sandboxed and output is
+not escaped automatically, use the ``escape`` (or ``e``) filter for
+untrusted values. The ``|`` operator is reserved for filters. Tags can
+strip whitespace from the adjacent text by adding a dash, for example
+``{%- if ok -%}``.
+'''
+import re
+import ast
+import builtins
+from html import escape
+from collections import OrderedDict
+
+from .engines import TemplateEngine, register_template_engine
+
+
+__all__ = ['LuxEngine', 'TemplateError', 'register_filter']
+
+
+TOKEN_RE = re.compile(r'(\{\{.*?\}\}|\{%.*?%\}|\{#.*?#\})', re.DOTALL)
+TAG_RE = re.compile(r'^(\w+)(?:\s+(.*))?$', re.DOTALL)
+FILTER_RE = re.compile(r'^(\w+)(?:\((.*)\))?$', re.DOTALL)
+STRING_RE = re.compile(r'^(\'[^\']+\'|"[^"]+")$')
+
+filters = {}
+
+
+class TemplateError(Exception):
+    '''Raised when a template cannot be compiled or rendered'''
+
+
+def register_filter(name, filter=None):
+    '''Register a ``filter`` function with ``name``.
+
+    Can be used as a decorator::
+
+        @register_filter('money')
+        def money(value, currency='$'):
+            return '%s%.2f' % (currency, value)
+    '''
+    if filter is None:
+        return lambda f: register_filter(name, f)
+    filters[name] = filter
+    return filter
+
+
+class Undefined:
+    '''Value of undefined names and attributes'''
+    __slots__ = ()
+
+    def __str__(self):
+        return ''
+
+    def __repr__(self):
+        return ''
+
+    def __bool__(self):
+        return False
+
+    def __iter__(self):
+        return iter(())
+
+    def __len__(self):
+        return 0
+
+    def __getattr__(self, name):
+        return self
+
+    def __getitem__(self, key):
+        return self
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+
+undefined = Undefined()
+
+
+BLOCKED_ATTRIBUTES = frozenset(('format', 'format_map'))
+
+
+def _attr(obj, name):
+    if name.startswith('_') or (name in BLOCKED_ATTRIBUTES and
+                                isinstance(obj, str)):
+        return undefined
+    try:
+        return getattr(obj, name)
+    except AttributeError:
+        try:
+            return obj[name]
+        except (KeyError, IndexError, TypeError):
+            return undefined
+
+
+def _str(value):
+    if value is None or value is undefined:
+        return ''
+    return value if isinstance(value, str) else str(value)
+
+
+def _iter(value):
+    return () if value is None else value
+
+
+BUILTINS = dict(((name, getattr(builtins, name)) for name in (
+    'abs', 'all', 'any', 'bool', 'dict', 'divmod', 'enumerate', 'filter',
+    'float', 'format', 'int', 'isinstance', 'len', 'list', 'map', 'max',
+    'min', 'range', 'repr', 'reversed', 'round', 'set', 'sorted', 'str',
+    'sum', 'tuple', 'zip')))
+
+
+HELPERS = {'_attr': _attr,
+           '_str': _str,
+           '_iter': _iter,
+           '_filters': filters}
+
+
+class Scope(dict):
+    '''Variables available to a template while rendering.
+
+    The scope is the globals dictionary of the compiled code, so that
+    comprehensions see the context too. Names set by the template (loop
+    variables and ``set`` tags) are stored in the scope itself, all other
+    names are looked up in the ``context`` without copying it.
+    '''
+    __slots__ = ('context',)
+
+    def __init__(self, context=None):
+        super().__init__(__builtins__=BUILTINS)
+        self.context = context if context is not None else {}
+
+    def __missing__(self, key):
+        try:
+            return self.context[key]
+        except KeyError:
+            pass
+        try:
+            return HELPERS[key]
+        except KeyError:
+            return BUILTINS.get(key, undefined)
+
+
+if hasattr(ast, 'Constant'):   # pragma    nocover
+    def _const(value):
+        return ast.Constant(value=value)
+else:   # pragma    nocover
+    def _const(value):
+        return ast.Str(s=value)
+
+
+class AttributeLookup(ast.NodeTransformer):
+    '''Replace attribute access with the ``_attr`` helper'''
+
+    def visit_Attribute(self, node):
+        self.generic_visit(node)
+        if isinstance(node.ctx, ast.Load):
+            call = ast.Call(func=ast.Name(id='_attr', ctx=ast.Load()),
+                            args=[node.value, _const(node.attr)],
+                            keywords=[])
+            return ast.copy_location(call, node)
+        return node
+
+
+class Template:
+    '''A compiled template.
+
+    Instances are callable with a ``context`` dictionary and return the
+    rendered text.
+    '''
+    def __init__(self, engine, name, code, blocks, parent=None, loader=None):
+        self.engine = engine
+        self.name = name
+        self.code = code
+        self.blocks = blocks
+        self.parent = parent
+        self.loader = loader
+
+    def __repr__(self):
+        return 'Template(%s)' % (self.name or '')
+    __str__ = __repr__
+
+    def __call__(self, context=None):
+        buffer = []
+        self.render_into(Scope(context), buffer.append)
+        return ''.join(buffer)
+
+    def render_into(self, scope, write, blocks=None):
+        '''Render this template into ``scope`` using the ``write`` function.
+
+        :param blocks: dictionary of blocks overriding the blocks of this
+            template, used by child templates.
+        '''
+        blocks = dict(blocks or ())
+        for name, code in self.blocks.items():
+            blocks.setdefault(name, code)
+        if self.parent:
+            parent = self.get_template(self.parent)
+            return parent.render_into(scope, write, blocks)
+        previous = (scope.get('_w'), scope.get('_block'),
+                    scope.get('_include'))
+
+        def block(name):
+            exec(blocks[name], scope)
+
+        def include(name):
+            self.get_template(name).render_into(scope, write)
+            scope['_w'], scope['_block'], scope['_include'] = (write, block,
+                                                               include)
+
+        scope['_w'], scope['_block'], scope['_include'] = (write, block,
+                                                           include)
+        try:
+            exec(self.code, scope)
+        finally:
+            scope['_w'], scope['_block'], scope['_include'] = previous
+
+    def get_template(self, name):
+        if not self.loader:
+            raise TemplateError('Cannot load "%s" from %s, no loader' %
+                                (name, self))
+        return self.loader.get(name, self.engine, parent=self.name)
+
+
+class Compiler:
+    '''Compile a template text into a :class:`.Template`
+    '''
+    def __init__(self, engine, text, name=None):
+        self.engine = engine
+        self.text = text
+        self.name = name or '<template>'
+        self.blocks = OrderedDict()
+        self.parent = None
+        self.counter = 0
+
+    def __call__(self, loader=None):
+        nodes = self.parse()
+        code = self.compile_nodes(nodes)
+        return Template(self.engine, self.name, code, self.blocks,
+                        self.parent, loader)
+
+    # PARSING
+    def tokens(self):
+        strip = False
+        lineno = 1
+        for bit in TOKEN_RE.split(self.text):
+            if bit[:2] in ('{{', '{%', '{#'):
+                inner = bit[2:-2]
+                lstrip = inner.startswith('-')
+                rstrip = inner.endswith('-')
+                inner = inner[1 if lstrip else 0:-1 if rstrip else None]
+                yield bit[:2], inner.strip(), lstrip, lineno
+                strip = rstrip
+            else:
+                if strip:
+                    bit = bit.lstrip()
+                yield 'text', bit, False, lineno
+                strip = False
+            lineno += bit.count('\n')
+
+    def parse(self):
+        root = []
+        stack = [('root', None, root, 0)]
+        previous = None
+        for kind, value, lstrip, lineno in self.tokens():
+            if lstrip and previous and previous[0] == 'text':
+                previous[1] = previous[1].rstrip()
+            body = stack[-1][2]
+            if kind == 'text':
+                if value:
+                    previous = ['text', value]
+                    body.append(previous)
+                continue
+            previous = None
+            if kind == '{#':
+                continue
+            elif kind == '{{':
+                body.append(['expr', self.expression(value, lineno)])
+                continue
+            match = TAG_RE.match(value)
+            if not match:
+                self.error('Malformed tag "%s"' % value, lineno)
+            tag, args = match.group(1), (match.group(2) or '').strip()
+            if tag in ('if', 'for', 'block'):
+                node = [tag, args, [], [], lineno, False]
+                if tag == 'if':
+                    node[1] = [(self.expression(args, lineno), node[2])]
+                elif tag == 'for':
+                    node[1] = self.loop(args, lineno)
+                elif not re.match(r'^\w+$', args):
+                    self.error('Block requires a name', lineno)
+                body.append(node)
+                stack.append((tag, node, node[2], lineno))
+            elif tag == 'elif' or tag == 'else':
+                current, node = stack[-1][:2]
+                if current in ('if', 'for') and node[5]:
+                    self.error('Unexpected "%s" after "else"' % tag, lineno)
+                if tag == 'else' and current in ('if', 'for'):
+                    node[5] = True
+                if current == 'if':
+                    body = []
+                    if tag == 'elif':
+                        node[1].append((self.expression(args, lineno), body))
+                    else:
+                        node[3] = body
+                elif current == 'for' and tag == 'else':
+                    body = node[3]
+                else:
+                    self.error('Unexpected "%s"' % tag, lineno)
+                stack[-1] = (current, node, body, stack[-1][3])
+            elif tag.startswith('end'):
+                current = stack[-1][0]
+                if tag[3:] != current:
+                    self.error('Unexpected "%s"' % tag, lineno)
+                stack.pop()
+            elif tag == 'extends':
+                if not STRING_RE.match(args):
+                    self.error('extends requires a template name', lineno)
+                self.parent = args[1:-1]
+            elif tag == 'include':
+                if not STRING_RE.match(args):
+                    self.error('include requires a template name', lineno)
+                body.append(['include', args[1:-1]])
+            elif tag == 'set':
+                name, _, expr = args.partition('=')
+                name = name.strip()
+                if not re.match(r'^[^\W_]\w*$', name):
+                    self.error('Invalid set tag "%s"' % args, lineno)
+                body.append(['set', name, self.expression(expr, lineno)])
+            else:
+                self.error('Unknown tag "%s"' % tag, lineno)
+        if len(stack) > 1:
+            self.error('Unclosed "%s" tag' % stack[-1][0], stack[-1][3])
+        return root
+
+    def loop(self, args, lineno):
+        target, sep, expr = args.partition(' in ')
+        target = target.strip()
+        if not sep or not re.match(r'^[^\W_]\w*(\s*,\s*[^\W_]\w*)*$',
+                                   target):
+            self.error('Invalid for tag "%s"' % args, lineno)
+        return target, self.expression(expr, lineno)
+
+    def expression(self, text, lineno):
+        '''Convert ``expression|filter|filter(args)`` into python source
+        '''
+        bits = self.split_filters(text)
+        source = bits[0].strip()
+        if not source:
+            self.error('Empty expression', lineno)
+        self.check_names(source, text, lineno)
+        source = '(%s)' % source
+        for bit in bits[1:]:
+            match = FILTER_RE.match(bit.strip())
+            if not match:
+                self.error('Invalid filter "%s"' % bit, lineno)
+            name, args = match.groups()
+            if name not in filters:
+                self.error('Unknown filter "%s"' % name, lineno)
+            if args and args.strip():
+                self.check_names('f(%s)' % args, text, lineno)
+                args = ', %s' % args
+            else:
+                args = ''
+            source = '_filters[%r](%s%s)' % (name, source, args)
+        return source
+
+    def check_names(self, source, text, lineno):
+        '''Parse the python ``source`` of the expression ``text`` and check
+        it does not use names starting with an underscore
+        '''
+        try:
+            tree = ast.parse(source.strip(), mode='eval')
+        except SyntaxError:
+            self.error('Invalid expression "%s"' % text, lineno)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and node.id.startswith('_'):
+                self.error('Name "%s" is not available in "%s"' %
+                           (node.id, text), lineno)
+
+    def split_filters(self, text):
+        bits, depth, quote, start = [], 0, None, 0
+        for i, c in enumerate(text):
+            if quote:
+                if c == quote:
+                    quote = None
+            elif c in '\'"':
+                quote = c
+            elif c in '([{':
+                depth += 1
+            elif c in ')]}':
+                depth -= 1
+            elif c == '|' and not depth:
+                bits.append(text[start:i])
+                start = i + 1
+        bits.append(text[start:])
+        return bits
+
+    # CODE GENERATION
+    def compile_nodes(self, nodes):
+        lines = []
+        self.generate(nodes, lines, 0)
+        if not lines:
+            lines.append('pass')
+        tree = ast.parse('\n'.join(lines), self.name)
+        tree = ast.fix_missing_locations(AttributeLookup().visit(tree))
+        return compile(tree, self.name, 'exec')
+
+    def generate(self, nodes, lines, indent):
+        pad = '    ' * indent
+        start = len(lines)
+        for node in nodes:
+            kind = node[0]
+            if kind == 'text':
+                lines.append('%s_w(%r)' % (pad, node[1]))
+            elif kind == 'expr':
+                lines.append('%s_w(_str(%s))' % (pad, node[1]))
+            elif kind == 'set':
+                lines.append('%s%s = %s' % (pad, node[1], node[2]))
+            elif kind == 'include':
+                lines.append('%s_include(%r)' % (pad, node[1]))
+            elif kind == 'block':
+                self.blocks[node[1]] = self.compile_nodes(node[2])
+                lines.append('%s_block(%r)' % (pad, node[1]))
+            elif kind == 'if':
+                for index, (expr, body) in enumerate(node[1]):
+                    lines.append('%s%s %s:' % (pad, 'elif' if index else 'if',
+                                               expr))
+                    self.generate(body, lines, indent + 1)
+                if node[3]:
+                    lines.append('%selse:' % pad)
+                    self.generate(node[3], lines, indent + 1)
+            elif kind == 'for':
+                target, expr = node[1]
+                self.counter += 1
+                flag = '_loop%s' % self.counter
+                if node[3]:
+                    lines.append('%s%s = False' % (pad, flag))
+                lines.append('%sfor %s in _iter(%s):' % (pad, target, expr))
+                if node[3]:
+                    lines.append('%s    %s = True' % (pad, flag))
+                self.generate(node[2], lines, indent + 1)
+                if node[3]:
+                    lines.append('%sif not %s:' % (pad, flag))
+                    self.generate(node[3], lines, indent + 1)
+        if indent and len(lines) == start:
+            lines.append('%spass' % pad)
+
+    def error(self, msg, lineno):
+        raise TemplateError('%s, line %s: %s' % (self.name, lineno, msg))
+
+
+class LuxEngine(TemplateEngine):
+    '''Template engine compiling templates into python code objects.
+
+    Templates rendered from text, rather than loaded by the
+    :class:`.TemplateLoader`, are cached by text.
+    '''
+    cache_size = 500
+
+    def __init__(self):
+        self._cache = OrderedDict()
+
+    def __call__(self, text, context):
+        template = self._cache.get(text)
+        if template is None:
+            template = self.compile(text)
+            if len(self._cache) >= self.cache_size:
+                self._cache.popitem(last=False)
+            self._cache[text] = template
+        return template(context)
+
+    def compile(self, text, name=None, loader=None):
+        return Compiler(self, text, name)(loader)
+
+
+# FILTERS
+register_filter('escape', lambda v: escape(_str(v)))
+register_filter('e', filters['escape'])
+register_filter('safe', lambda v: v)
+register_filter('upper', lambda v: _str(v).upper())
+register_filter('lower', lambda v: _str(v).lower())
+register_filter('title', lambda v: _str(v).title())
+register_filter('capitalize', lambda v: _str(v).capitalize())
+register_filter('trim', lambda v: _str(v).strip())
+register_filter('length', lambda v: len(v) if v is not None else 0)
+register_filter('default', lambda v, d='': v if v else d)
+register_filter('join', lambda v, sep='': sep.join(_str(b) for b in _iter(v)))
+register_filter('first', lambda v: next(iter(_iter(v)), undefined))
+register_filter('last', lambda v: list(_iter(v))[-1] if v else undefined)
+register_filter('replace', lambda v, old, new: _str(v).replace(old, new))
+register_filter('format', lambda v, *args: _str(v) % args)
+
+
+register_template_engine('lux', LuxEngine())
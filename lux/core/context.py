@@ -0,0 +1,95 @@
+from collections import ChainMap
+
+
+__all__ = ['TemplateContext']
+
+
+class TemplateContext(ChainMap):
+    '''The context dictionary used to render templates during a request.
+
+    It is a layered mapping which avoids copying the application
+    configuration for every template rendered:
+
+    * the first layer is a small dictionary specific to the request, all
+      writes go to this layer;
+    * a layer for each extension declaring its
+      :attr:`~.Extension.context_keys`, the extension ``context`` method is
+      called the first time one of those keys is looked up;
+    * a read-only view of the application config shared by all requests.
+
+    :meth:`new_child`, :attr:`parents` and :meth:`copy` return contexts
+    for the same request, sharing the lazy layers already loaded.
+    '''
+    def __init__(self, request, context, config, providers=None):
+        super().__init__(context, config)
+        self.request = request
+        self._providers = providers or {}
+        self._loaded = set()
+
+    def __missing__(self, key):
+        extension = self._providers.get(key)
+        if extension is None or extension in self._loaded:
+            raise KeyError(key)
+        self._load(extension)
+        return self[key]
+
+    def __contains__(self, key):
+        if super().__contains__(key):
+            return True
+        extension = self._providers.get(key)
+        return extension is not None and extension not in self._loaded
+
+    def __iter__(self):
+        self._load_all()
+        return super().__iter__()
+
+    def __len__(self):
+        self._load_all()
+        return super().__len__()
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.maps[0])
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    @classmethod
+    def fromkeys(cls, iterable, *args):
+        '''A context without request from ``iterable`` keys'''
+        return cls(None, dict.fromkeys(iterable, *args), {})
+
+    def copy(self):
+        '''A copy of this context sharing all layers but the first one'''
+        return self._derive([self.maps[0].copy()] + self.maps[1:])
+    __copy__ = copy
+
+    def new_child(self, m=None):
+        '''A context with a new first layer ``m``, followed by all the
+        layers of this context
+        '''
+        return self._derive([{} if m is None else m] + self.maps)
+
+    @property
+    def parents(self):
+        '''A context with all the layers of this context but the first'''
+        return self._derive(self.maps[1:])
+
+    def _derive(self, maps):
+        context = self.__class__(self.request, {}, {}, self._providers)
+        context.maps = maps or [{}]
+        context._loaded.update(self._loaded)
+        return context
+
+    def _load(self, extension):
+        self._loaded.add(extension)
+        layer = {}
+        layer = extension.context(self.request, layer) or layer
+        self.maps.insert(len(self.maps) - 1, layer)
+
+    def _load_all(self):
+        for extension in set(self._providers.values()):
+            if extension not in self._loaded:
+                self._load(extension)
@@ -0,0 +1,174 @@
+import json
+from copy import copy, deepcopy
+
+from pulsar.apps.wsgi import AsyncString, Scripts
+
+
+__all__ = ['clone_document', 'JsContext']
+
+
+COPY_TYPES = (dict, list, set)
+
+
+def clone_document(doc):
+    '''Clone an :class:`.HtmlDocument` prototype.
+
+    Only the mutable parts of the document (children, attributes, the
+    ``require`` list of scripts and the ``jscontext`` dictionary) are copied,
+    strings and rendered links and scripts are shared with the prototype.
+    '''
+    clone = clone_element(doc)
+    clone.head = clone_element(doc.head)
+    clone.body = clone_element(doc.body)
+    meta = getattr(doc, 'meta', None)
+    if meta is not None:
+        clone.meta = copy_attributes(meta)
+        clone.meta.head = clone.head
+    jscontext = getattr(doc, 'jscontext', None)
+    if isinstance(jscontext, JsContext):
+        clone.jscontext = jscontext.copy()
+    elif jscontext is not None:
+        clone.jscontext = copy_values(jscontext)
+    return clone
+
+
+def clone_element(element, parent=None):
+    if not isinstance(element, AsyncString):
+        return element
+    clone = copy(element)
+    clone._parent = parent
+    if element._children is not None:
+        clone._children = [clone_element(child, clone)
+                           for child in element._children]
+    if element._before_stream:
+        clone._before_stream = list(element._before_stream)
+    extra = getattr(element, '_extra', None)
+    if extra:
+        clone._extra = copy_values(extra)
+    if isinstance(element, Scripts):
+        clone.require = list(element.require)
+        clone.paths = dict(element.paths)
+    elif hasattr(element, '_child_kwargs'):
+        # embedded css and javascript
+        clone._child_kwargs = dict(element._child_kwargs)
+    return clone
+
+
+def copy_attributes(obj):
+    clone = copy(obj)
+    for name, value in vars(obj).items():
+        if isinstance(value, COPY_TYPES):
+            setattr(clone, name, copy(value))
+    return clone
+
+
+def copy_values(data):
+    return dict(((key, copy(value) if isinstance(value, COPY_TYPES)
+                  else value) for key, value in data.items()))
+
+
+class JsContext(dict):
+    '''The javascript context of an :class:`.HtmlDocument`.
+
+    Values added before :meth:`freeze` is called, or via
+    :meth:`update_encoded`, are encoded into JSON once. When the context is
+    serialised with :meth:`dumps`, only values added or replaced since then
+    are encoded again.
+
+    Mutable values of the encoded part are shared by all copies of the
+    context, they are deep copied the first time they are accessed so that
+    changes to them are not shared with other documents.
+    '''
+    __slots__ = ('_encoded',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._encoded = {}
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if self._shared(key, value):
+            value = deepcopy(value)
+            super().__setitem__(key, value)
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def items(self):
+        self._thaw()
+        return super().items()
+
+    def values(self):
+        self._thaw()
+        return super().values()
+
+    def pop(self, *args):
+        self._thaw()
+        return super().pop(*args)
+
+    def popitem(self):
+        self._thaw()
+        return super().popitem()
+
+    def copy(self):
+        '''A copy of this context sharing the encoded part'''
+        context = self.__class__(self)
+        context._encoded = self._encoded
+        return context
+
+    def freeze(self):
+        '''Encode all values
+        '''
+        self._encoded = self.encode(self)
+        return self
+
+    def update_encoded(self, encoded):
+        '''Update with a dictionary returned by :meth:`encode`
+        '''
+        self._encoded = dict(self._encoded)
+        self._encoded.update(encoded)
+        for key, entry in encoded.items():
+            super().__setitem__(key, entry[0])
+
+    def dumps(self):
+        '''Serialise into a JSON string
+        '''
+        encoded = self._encoded
+        bits = []
+        for key, value in dict.items(self):
+            entry = encoded.get(key)
+            if entry is not None and entry[0] is value:
+                bits.append(entry[1])
+            else:
+                bits.append('%s: %s' % (json.dumps(key), json.dumps(value)))
+        return '{%s}' % ', '.join(bits)
+
+    def _shared(self, key, value):
+        entry = self._encoded.get(key)
+        return (entry is not None and entry[0] is value and
+                isinstance(value, COPY_TYPES))
+
+    def _thaw(self):
+        for key, value in dict.items(self):
+            if self._shared(key, value):
+                super().__setitem__(key, deepcopy(value))
+
+    @classmethod
+    def encode(cls, data):
+        '''Encode a dictionary ``data`` into JSON fragments
+
+        :return: a dictionary mapping keys into a two-elements tuple
+            containing the value and the encoded ``"key": value`` fragment
+        '''
+        return dict(((key, (value, '%s: %s' % (json.dumps(key),
+                                               json.dumps(value))))
+                     for key, value in data.items()))
@@ -1,8 +1,9 @@
 from string import Template
+from functools import partial
 
 from pulsar import ImproperlyConfigured
 
-__all__ = ['register_template_engine', 'template_engine']
+__all__ = ['register_template_engine', 'template_engine', 'TemplateEngine']
 
 default_engine = 'python'
 template_engines = {}
@@ -21,8 +22,48 @@ def register_template_engine(name, engine):
     template_engines[name] = engine
 
 
-def render(text, context):
-    return Template(text).safe_substitute(context) if context else text
+def compile_template(engine, text, name=None, loader=None):
+    '''Compile ``text`` with ``engine`` into a callable accepting a context
+    dictionary.
+
+    Engines which don't implement the ``compile`` method are plain callables
+    accepting the template ``text`` and the ``context``.
+    '''
+    compile = getattr(engine, 'compile', None)
+    if compile:
+        return compile(text, name=name, loader=loader)
+    return partial(engine, text)
+
+
+class TemplateEngine:
+    '''Base class for template engines which can compile templates.
+
+    Compiled templates are stored by the :class:`.TemplateLoader` of the
+    application so that templates are parsed once only.
+    '''
+    def __call__(self, text, context):
+        return self.compile(text)(context)
+
+    def compile(self, text, name=None, loader=None):
+        '''Compile ``text`` into a callable accepting a ``context``
+        dictionary as only argument.
+        '''
+        raise NotImplementedError
+
+
+class PythonEngine(TemplateEngine):
+    '''Template engine based on python :class:`string.Template`
+    '''
+    def compile(self, text, name=None, loader=None):
+        template = Template(text)
+
+        def render(context):
+            return template.safe_substitute(context) if context else text
+
+        return render
+
+
+render = PythonEngine()
 
 
 register_template_engine(default_engine, render)
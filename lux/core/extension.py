@@ -7,6 +7,7 @@ from inspect import getfile, getmodule
 from pulsar import HttpException
 
 from lux import __version__
+from lux.utils.stats import timed
 
 
 __all__ = ['Extension', 'Parameter']
@@ -16,8 +17,11 @@ ALL_EVENTS = ('on_config',  # Config ready.
               'on_loaded',  # Wsgi handler ready.
               'on_start',  # Wsgi server starts. Extra args: server
               'on_request',  # Fired when a new request arrives
+              'on_html_prototype',  # Html doc prototype. Extra args: html
               'on_html_document',  # Html doc built. Extra args: request, html
               'on_form',  # Form constructed. Extra args: form
+              'on_warm',  # Handler built before forking workers
+              'on_fork',  # Worker forked from a warmed application
               )
 
 
@@ -149,8 +153,16 @@ class Extension(metaclass=ExtensionType):
     .. attribute:: logger
 
         The logger instance for this :class:`Extension`.
+
+    .. attribute:: context_keys
+
+        Optional tuple of template context keys provided by the ``context``
+        method of this extension. When set, ``context`` is called with an
+        empty dictionary the first time one of these keys is looked up
+        while rendering a template rather than for every template rendered.
     '''
     abstract = True
+    context_keys = None
     stdout = None
     stderr = None
 
@@ -237,6 +249,8 @@ class EventHandler:
 
 class EventMixin:
     events = None
+    _dispatch = None
+    _dispatch_stats = None
 
     def bind_events(self, extension, all_events=None, exclude=None):
         '''Bind ``all_events`` to an ``extension``.
@@ -259,14 +273,40 @@ class EventMixin:
             handlers = events[name]
             if hasattr(extension, name):
                 handlers.append(EventHandler(extension, name))
+        if self._dispatch is not None:
+            self.compile_events(self._dispatch_stats)
+
+    def compile_events(self, stats=None):
+        '''Resolve event handlers into bound methods so that :meth:`fire`
+        does not need to look them up at every call.
+
+        :param stats: optional :class:`.Stats` where to record the latency
+            of each handler, keyed by ``event:handler``.
+        '''
+        dispatch = {}
+        for event, handlers in (self.events or {}).items():
+            methods = []
+            for handler in handlers:
+                method = getattr(handler.extension, handler.name)
+                if stats is not None:
+                    method = timed(stats['%s:%s' % (event, handler)], method)
+                methods.append((handler, method))
+            dispatch[event] = tuple(methods)
+        self._dispatch = dispatch
+        self._dispatch_stats = stats
 
     def fire(self, event, *args):
         '''Fire an ``event``.'''
-        handlers = self.events.get(event) if self.events else None
+        if self._dispatch is not None:
+            handlers = self._dispatch.get(event)
+        else:
+            handlers = self.events.get(event) if self.events else None
+            if handlers:
+                handlers = [(handler, handler) for handler in handlers]
         if handlers:
-            for handler in handlers:
+            for handler, method in handlers:
                 try:
-                    handler(self, *args)
+                    method(self, *args)
                 except HttpException:
                     raise
                 except Exception:
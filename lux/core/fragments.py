@@ -0,0 +1,109 @@
+'''Cache of rendered html fragments.
+
+The inner html of an :class:`.HtmlRouter`, returned by its ``get_html``
+method, is used both by full page responses and by the ``?template=ui``
+requests of angular applications. It can be cached, per route and url
+arguments, either by setting the ``fragment_cache`` router parameter::
+
+    class BlogRouter(lux.HtmlRouter):
+        fragment_cache = 600
+        fragment_tags = ('blog',)
+
+or by decorating ``get_html`` with :func:`cache_fragment`::
+
+    class PostRouter(lux.HtmlRouter):
+
+        @lux.cache_fragment(600, tags=('blog', 'post:{slug}'))
+        def get_html(self, request):
+            ...
+
+Tags are formatted with the url arguments of the request and cached
+fragments are invalidated by tag via :func:`invalidate_fragments`::
+
+    lux.invalidate_fragments(app, 'blog')
+
+The html of cached fragments must not depend on the user making the
+request.
+
+Invalidating a tag records the invalidation time, with no expiry, in the
+cache server and fragments stored before it are rendered again. A tag
+without an invalidation time, never invalidated or evicted, is given the
+current time, so that evicted invalidations never serve stale fragments.
+'''
+import time
+from functools import wraps
+
+from pulsar.apps.wsgi import Html
+
+
+__all__ = ['cache_fragment', 'invalidate_fragments']
+
+
+def cache_fragment(timeout=None, tags=()):
+    '''Decorator for caching the html returned by ``get_html`` methods of
+    :class:`.HtmlRouter`.
+
+    :param timeout: time to live in seconds, if not given the default
+        timeout of the cache server is used.
+    :param tags: sequence of tags used to invalidate the fragment
+    '''
+    def _(get_html):
+
+        @wraps(get_html)
+        def __(self, request):
+            return fragment(self, request, lambda: get_html(self, request),
+                            timeout, tags)
+
+        return __
+
+    return _
+
+
+def invalidate_fragments(app, *tags):
+    '''Invalidate all fragments cached with any of ``tags``
+    '''
+    cache = app.cache_server
+    now = time.time()
+    for tag in tags:
+        cache.set(tag_key(app, tag), now, timeout=0)
+
+
+def fragment(router, request, render, timeout=None, tags=()):
+    '''Return the html rendered by ``render``, a callable with no
+    arguments, from the cache or render it and store it in the cache
+    '''
+    app = request.app
+    cache = app.cache_server
+    urlargs = request.urlargs or {}
+    key = 'lux:fragment:%s:%s:%s' % (app.config_module,
+                                     router.full_route.rule,
+                                     sorted(urlargs.items()))
+    now = time.time()
+    invalidated = max((invalidated_at(app, tag.format(**urlargs), now)
+                       for tag in tags), default=0)
+    entry = cache.get(key)
+    if entry is not None and entry[0] >= invalidated:
+        return entry[1]
+    html = render()
+    if isinstance(html, Html):
+        html = html.render(request)
+    if isinstance(html, str):
+        cache.set(key, (now, html), timeout)
+    return html
+
+
+def invalidated_at(app, tag, now):
+    '''Time ``tag`` was last invalidated, set to ``now`` if not available
+    '''
+    cache = app.cache_server
+    key = tag_key(app, tag)
+    value = cache.get(key)
+    if value is None:
+        value = now
+        if not cache.add(key, value, timeout=0):
+            value = cache.get(key, value)
+    return value
+
+
+def tag_key(app, tag):
+    return 'lux:fragment-tag:%s:%s' % (app.config_module, tag)
@@ -0,0 +1,223 @@
+import re
+from timeit import default_timer
+
+from pulsar import Http404
+from pulsar.apps.wsgi import (WsgiHandler, WsgiResponse, Router,
+                              handle_wsgi_error)
+
+from lux.utils.stats import RollingStats, Stats
+
+
+__all__ = ['LuxHandler', 'ProfilingHandler', 'RouteIndex']
+
+
+def middleware_name(middleware):
+    if isinstance(middleware, Router):
+        return middleware.rule
+    name = getattr(middleware, '__name__', None)
+    if name:
+        return name
+    return middleware.__class__.__name__
+
+
+def static_prefix(middleware):
+    '''The leading static segments of the route of a ``middleware``.
+
+    Return ``None`` if the middleware is not a :class:`.Router` or it is a
+    router with a custom ``__call__`` or ``resolve`` method, since in these
+    cases there is no guarantee it serves only paths starting with its route.
+    '''
+    cls = type(middleware)
+    if (not isinstance(middleware, Router) or
+            cls.__call__ is not Router.__call__ or
+            cls.resolve is not Router.resolve):
+        return
+    route = middleware.full_route
+    prefix = []
+    for dynamic, bit in route.breadcrumbs:
+        if dynamic:
+            break
+        prefix.append(bit)
+    # routes with regular expressions bits can't be indexed
+    regex = '/'.join((re.escape(bit) for bit in prefix))
+    if not route.regex[1:].startswith(regex):
+        return
+    return tuple(prefix)
+
+
+class RouteIndex:
+    '''Index of wsgi middleware by the static segments of their routes.
+
+    :meth:`candidates` returns, in their original order, the middleware
+    which can serve a given path: all :class:`.Router` whose leading static
+    segments match the leading segments of the path and all middleware which
+    are not indexable (plain functions, routers without static segments or
+    routers overriding ``__call__`` or ``resolve``).
+    '''
+    def __init__(self, middleware):
+        self.source = middleware
+        self.size = len(middleware)
+        self.middleware = tuple(middleware)
+        self._ids = tuple(map(id, self.middleware))
+        self._always = []
+        self._trie = {}
+        for index, m in enumerate(self.middleware):
+            prefix = static_prefix(m)
+            if not prefix:
+                self._always.append(index)
+            else:
+                node = self._trie
+                for bit in prefix:
+                    node = node.setdefault(bit, {})
+                node.setdefault(None, []).append(index)
+
+    def __len__(self):
+        return self.size
+
+    def valid(self, middleware):
+        '''Check if the index is still valid for the ``middleware`` list
+
+        The index is valid only if ``middleware`` is the list it was built
+        from and its entries have not been added, removed or replaced since.
+        '''
+        return (middleware is self.source and
+                len(middleware) == self.size and
+                tuple(map(id, middleware)) == self._ids)
+
+    def candidates(self, path):
+        '''List of middleware which may serve ``path``
+        '''
+        indexes = None
+        node = self._trie
+        for bit in path[1:].split('/'):
+            node = node.get(bit)
+            if node is None:
+                break
+            if None in node:
+                if indexes is None:
+                    indexes = list(self._always)
+                indexes.extend(node[None])
+        middleware = self.middleware
+        if indexes is None:
+            return [middleware[i] for i in self._always]
+        return [middleware[i] for i in sorted(indexes)]
+
+
+class LuxHandler(WsgiHandler):
+    '''The :class:`.WsgiHandler` of an :class:`.Application`.
+
+    Once :meth:`build_index` is called, requests are dispatched to the
+    middleware returned by a :class:`.RouteIndex` rather than to the full
+    middleware list. The index is rebuilt if the middleware list changes.
+    '''
+    route_index = None
+
+    def __call__(self, environ, start_response):
+        response = None
+        try:
+            for middleware in self.get_middleware(environ):
+                response = middleware(environ, start_response)
+                if response is not None:
+                    break
+            if response is None:
+                raise Http404
+
+        except Exception as exc:
+            response = handle_wsgi_error(environ, exc)
+
+        if isinstance(response, WsgiResponse) and not response.started:
+            for middleware in self.response_middleware:
+                response = middleware(environ, response) or response
+            response.start(start_response)
+        return response
+
+    def build_index(self):
+        self.route_index = RouteIndex(self.middleware)
+        return self.route_index
+
+    def get_middleware(self, environ):
+        index = self.route_index
+        if index is None:
+            return self.middleware
+        if not index.valid(self.middleware):
+            index = self.build_index()
+        return index.candidates(environ.get('PATH_INFO') or '/')
+
+
+class ProfilingHandler(LuxHandler):
+    '''A :class:`.WsgiHandler` recording the latency of each middleware
+    and response middleware.
+
+    Latencies are stored in :class:`.RollingStats` keyed by:
+
+    * ``extension:<name>`` time spent in middleware of an extension
+    * ``middleware:<extension>:<name>`` time spent in a middleware
+    * ``response:<extension>:<name>`` time spent in a response middleware
+    * ``route:<rule>`` time spent by the middleware serving a request, by
+      matched route
+
+    .. attribute:: extensions
+
+        Dictionary mapping the ``id`` of middleware to the name of the
+        extension which provided it.
+    '''
+    def __init__(self, middleware=None, response_middleware=None,
+                 stats=None, extensions=None, interval=60, windows=10,
+                 **kwargs):
+        super().__init__(middleware, response_middleware, **kwargs)
+        self.stats = stats if stats is not None else Stats()
+        self.extensions = extensions or {}
+        self.interval = interval
+        self.windows = windows
+        self._entries = {}
+
+    def __call__(self, environ, start_response):
+        timer = default_timer
+        response = None
+        try:
+            for middleware in self.get_middleware(environ):
+                start = timer()
+                try:
+                    response = middleware(environ, start_response)
+                finally:
+                    self._record(middleware, 'middleware', timer() - start,
+                                 environ if response is not None else None)
+                if response is not None:
+                    break
+            if response is None:
+                raise Http404
+
+        except Exception as exc:
+            response = handle_wsgi_error(environ, exc)
+
+        if isinstance(response, WsgiResponse) and not response.started:
+            for middleware in self.response_middleware:
+                start = timer()
+                response = middleware(environ, response) or response
+                self._record(middleware, 'response', timer() - start)
+            response.start(start_response)
+        return response
+
+    def get_stats(self, name):
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = RollingStats(self.interval, self.windows)
+            self.stats[name] = stats
+        return stats
+
+    def _record(self, middleware, kind, elapsed, environ=None):
+        key = (kind, id(middleware))
+        entry = self._entries.get(key)
+        if entry is None:
+            extension = self.extensions.get(id(middleware), 'unknown')
+            name = middleware_name(middleware)
+            entry = (self.get_stats('extension:%s' % extension),
+                     self.get_stats('%s:%s:%s' % (kind, extension, name)))
+            self._entries[key] = entry
+        entry[0].add(elapsed)
+        entry[1].add(elapsed)
+        if environ is not None:
+            cache = environ.get('pulsar.cache')
+            router = cache.app_handler if cache is not None else None
+            if isinstance(router, Router):
+                self.get_stats('route:%s' % router.rule).add(elapsed)
@@ -0,0 +1,170 @@
+import os
+
+from .engines import compile_template
+
+
+__all__ = ['TemplateLoader']
+
+
+class TemplateLoader:
+    '''Index of templates available to an :class:`.Application`.
+
+    The index maps template names (paths relative to a ``templates``
+    directory) to their full path on the file system and it is built once,
+    when the application handler is loaded, by walking the ``templates``
+    directory of all :setting:`EXTENSIONS` in reversed order, so that
+    templates in extensions further down the list override templates with
+    the same name in extensions higher up.
+
+    Sources and compiled templates are kept in memory. When the application
+    runs in ``debug`` mode, templates are revalidated using the modification
+    time of their file and of the files they depend on, parent and included
+    templates loaded via :meth:`get` with the ``parent`` argument, so that
+    changes are picked up without restarting the server.
+    '''
+    def __init__(self, app, directories):
+        self.app = app
+        self.debug = app.debug
+        self.directories = tuple(directories)
+        self._paths = None
+        self._templates = {}
+        self._sources = {}
+        self._dependencies = {}
+
+    def __repr__(self):
+        return '%s%s' % (self.__class__.__name__, self.directories)
+    __str__ = __repr__
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __contains__(self, name):
+        return self.full_path(name) is not None
+
+    @property
+    def paths(self):
+        '''Dictionary mapping template names to full paths'''
+        if self._paths is None:
+            self.build()
+        return self._paths
+
+    def build(self):
+        '''Build the template index by walking all template
+        :attr:`directories`.
+        '''
+        paths = {}
+        for directory in self.directories:
+            for dirpath, _, filenames in os.walk(directory):
+                rel = os.path.relpath(dirpath, directory)
+                for filename in filenames:
+                    name = filename if rel == '.' else '/'.join(
+                        rel.split(os.sep) + [filename])
+                    if name not in paths:
+                        paths[name] = os.path.join(dirpath, filename)
+        self._paths = paths
+        self._templates.clear()
+        self._sources.clear()
+        self._dependencies.clear()
+        return self
+
+    def full_path(self, names):
+        '''Return the full path of the first template found in ``names``
+        or ``None``.
+
+        :param names: a template name or a list/tuple of names to try in order
+        '''
+        if not isinstance(names, (list, tuple)):
+            names = (names,)
+        paths = self.paths
+        for name in names:
+            filename = paths.get(name)
+            if filename is None and self.debug:
+                filename = self._scan(name)
+            if filename:
+                return filename
+
+    def source(self, names):
+        '''Return the template source of the first template found in
+        ``names``. If no template is available, an empty string is returned.
+        '''
+        filename = self.full_path(names)
+        if filename:
+            return self._load(filename)
+        return ''
+
+    def get(self, names, engine, parent=None):
+        '''Return a compiled template for the first available template in
+        ``names``.
+
+        :param engine: the template engine used to compile the template. It
+            must be a registered template engine.
+        :param parent: optional file name of the template loading this one,
+            as parent or include, which is recompiled when this one
+            changes in debug mode.
+        :return: a callable accepting the ``context`` dictionary as only
+            argument and returning the rendered text.
+        '''
+        filename = self.full_path(names)
+        if parent and filename and self.debug:
+            dependencies = self._dependencies.setdefault(parent, {})
+            dependencies[filename] = self._mtime(filename)
+        key = (filename, engine)
+        entry = self._templates.get(key)
+        if entry is not None and self.debug and filename:
+            if self._changed(filename, entry[0]):
+                entry = None
+        if entry is None:
+            if filename:
+                mtime = self._mtime(filename)
+                text = self._load(filename)
+            else:
+                self.app.logger.error('Template %s not found', names)
+                text, mtime = '', None
+            # dependencies are recorded again while compiling and rendering
+            self._dependencies.pop(filename, None)
+            entry = (mtime, compile_template(engine, text, name=filename,
+                                             loader=self))
+            self._templates[key] = entry
+        return entry[1]
+
+    # INTERNALS
+    def _load(self, filename):
+        entry = self._sources.get(filename)
+        if entry is not None and self.debug:
+            if entry[0] != self._mtime(filename):
+                entry = None
+        if entry is None:
+            mtime = self._mtime(filename)
+            with open(filename, 'r') as file:
+                entry = (mtime, file.read())
+            self._sources[filename] = entry
+        return entry[1]
+
+    def _changed(self, filename, mtime, seen=None):
+        '''Check if ``filename``, compiled when modified at ``mtime``, or
+        any of its dependencies changed
+        '''
+        if mtime != self._mtime(filename):
+            return True
+        seen = seen or set()
+        seen.add(filename)
+        dependencies = self._dependencies.get(filename, {})
+        for dependency, dependency_mtime in tuple(dependencies.items()):
+            if (dependency not in seen and
+                    self._changed(dependency, dependency_mtime, seen)):
+                return True
+        return False
+
+    def _mtime(self, filename):
+        try:
+            return os.stat(filename).st_mtime
+        except OSError:
+            return None
+
+    def _scan(self, name):
+        # debug only, template added after the index was built
+        for directory in self.directories:
+            filename = os.path.join(directory, name)
+            if os.path.isfile(filename):
+                self._paths[name] = filename
+                return filename
@@ -0,0 +1,145 @@
+import os
+import json
+import tempfile
+from hashlib import md5
+from collections import OrderedDict
+from importlib.util import find_spec
+
+from lux.utils.files import private_directory
+
+
+__all__ = ['CommandManifest', 'commands_location']
+
+
+def commands_location(extension):
+    '''Directory of the ``commands`` package of ``extension``.
+
+    The package is located without being imported. Return ``None`` if the
+    extension does not provide commands.
+    '''
+    modname = extension + ('.core' if extension == 'lux' else '') + '.commands'
+    try:
+        spec = find_spec(modname)
+    except (ImportError, ValueError):
+        return
+    if spec is not None and spec.submodule_search_locations:
+        return list(spec.submodule_search_locations)[0]
+
+
+class CommandManifest:
+    '''A JSON file caching the commands provided by a list of extensions.
+
+    The manifest is stored in ``directory``, by default a directory of the
+    current user in the system temporary directory. It is used without
+    further checks while ``stamp`` does not change, for example the
+    modification time of the settings and the versions of the extensions.
+    Otherwise it is valid as long as the modification times of the
+    extensions ``commands`` directories do not change.
+    '''
+    def __init__(self, key, extensions, directory=None, stamp=None):
+        self.extensions = tuple(extensions)
+        self.stamp = stamp
+        key = '%s:%s' % (key, ','.join(self.extensions))
+        name = 'lux-commands-%s.json' % md5(key.encode('utf-8')).hexdigest()
+        try:
+            directory = directory or private_directory('lux')
+        except OSError:
+            self.path = None
+        else:
+            self.path = os.path.join(directory, name)
+
+    def __repr__(self):
+        return self.path
+    __str__ = __repr__
+
+    def commands(self):
+        '''Ordered dictionary mapping extension names to the tuple of
+        commands they provide
+        '''
+        data = self.read()
+        if data and self.stamp is not None and data.get('stamp') == self.stamp:
+            return self.commands_from(data)
+        locations = self.locations()
+        commands = self.load(locations, data)
+        if commands is None:
+            commands = self.scan(locations)
+            self.save(locations, commands)
+        elif self.stamp is not None:
+            self.save(locations, commands)
+        return commands
+
+    def locations(self):
+        locations = []
+        for name in self.extensions:
+            path = commands_location(name)
+            try:
+                mtime = os.stat(path).st_mtime if path else None
+            except OSError:
+                path, mtime = None, None
+            locations.append([name, path, mtime])
+        return locations
+
+    def read(self):
+        '''The content of the manifest file, ``None`` if not available'''
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'r') as fp:
+                data = json.load(fp)
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict):
+            return data
+
+    def load(self, locations, data=None):
+        '''Load commands from the manifest file.
+
+        Return ``None`` if the file is not available or it is stale.
+        '''
+        if data is None:
+            data = self.read()
+        if not data or data.get('locations') != locations:
+            return
+        return self.commands_from(data)
+
+    def commands_from(self, data):
+        return OrderedDict(((name, tuple(commands))
+                            for name, commands in data.get('commands', ())))
+
+    def scan(self, locations):
+        '''Scan the ``commands`` directories for commands
+        '''
+        cmnds = OrderedDict()
+        for name, path, _ in locations:
+            if not path:
+                continue
+            try:
+                commands = tuple((f[:-3] for f in sorted(os.listdir(path))
+                                  if not f.startswith('_') and
+                                  f.endswith('.py')))
+            except OSError:
+                continue
+            if commands:
+                cmnds[name] = commands
+        return cmnds
+
+    def save(self, locations, commands):
+        if not self.path:
+            return
+        data = {'locations': locations,
+                'stamp': self.stamp,
+                'commands': [[name, list(cmnds)]
+                             for name, cmnds in commands.items()]}
+        try:
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path))
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(data, fp)
+            os.replace(tmp, self.path)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
@@ -5,10 +5,12 @@ from pulsar.apps.wsgi import (route, wsgi_request, cached_property,
 from pulsar.apps import wsgi
 from pulsar.apps.wsgi import RouterParam, Router, render_error_debug
 from pulsar.apps.wsgi.utils import error_messages
-from pulsar.utils.httpurl import JSON_CONTENT_TYPES
+from pulsar.utils.httpurl import JSON_CONTENT_TYPES, responses
 from pulsar.utils.structures import mapping_iterator
 
 from lux.utils import unique_tuple
+from lux.utils.http import weak_etag, etag_match
+from .fragments import fragment
 from pulsar.utils.exceptions import MethodNotAllowed
 
 __all__ = ['Html', 'WsgiRequest', 'Router', 'HtmlRouter',
@@ -50,12 +52,25 @@ class WsgiRequest(wsgi.WsgiRequest):
         '''The HTML document for this request.'''
         return self.app.html_document(self)
 
-    @cached_property
+    @property
     def cache_server(self):
-        cache = self.config['CACHE_SERVER']
-        if isinstance(cache, str):
-            raise NotImplementedError
-        return cache
+        '''The :attr:`.Application.cache_server`'''
+        return self.cache.app.cache_server
+
+    def not_modified(self, version):
+        '''Set a weak ``ETag`` header from a content ``version`` and check it
+        against the ``If-None-Match`` request header.
+
+        :return: the :attr:`response` with status code 304 if the client
+            has the current version of the content, otherwise ``None``
+        '''
+        response = self.response
+        etag = weak_etag(version)
+        response['ETag'] = etag
+        if etag_match(self.environ.get('HTTP_IF_NONE_MATCH'), etag):
+            response.status_code = 304
+            response.content = ()
+            return response
 
     def has_permission(self, action, model):
         '''Check if this request has permission on ``model`` to perform a
@@ -98,25 +113,82 @@ class HtmlRouter(Router):
     the underlying model.
     '''
     response_content_types = TEXT_CONTENT_TYPES
+    response_cache = RouterParam(None)
+    '''Cache full responses of this router and its children for anonymous
+    requests. ``None`` uses the default timeout, ``False`` disables the
+    cache and a number sets the timeout in seconds. Used when the
+    :setting:`RESPONSE_CACHE_TIMEOUT` parameter is set.
+    '''
 
-    def get(self, request, html=None):
-        # render the inner html
-        if html is None:
-            html = self.get_html(request)
+    fragment_cache = RouterParam(None)
+    '''Cache the html returned by :meth:`get_html` for this router and its
+    children. ``True`` uses the default timeout of the cache server,
+    a number sets the timeout in seconds.
+    '''
+    fragment_tags = RouterParam(())
+    '''Tags for invalidating cached fragments via
+    :func:`.invalidate_fragments`. Tags are formatted with the url
+    arguments of the request.
+    '''
+    html_stream = RouterParam(None)
+    '''Stream html responses of this router and its children, the head of
+    the document is sent once :meth:`get_html` has returned and before the
+    body template is rendered. ``None`` uses the :setting:`HTML_STREAMING`
+    parameter.
+    '''
 
-        if isinstance(html, Html):
-            html = html.render(request)
+    def get(self, request, html=None):
+        # the client has the current version, no need to render
+        version = self.content_version(request)
+        if version is not None and request.not_modified(version):
+            return request.response
 
         # This request is for the inner template only
         if request.url_data.get('template') == 'ui':
-            request.response.content = html
+            request.response.content = self.inner_html(request, html)
             return request.response
 
-        context = {'html_main': html}
-        self.context(request, context)
         app = request.app
         template = self.get_html_body_template(app)
-        return app.html_response(request, template, context=context)
+        return app.html_response(request, template,
+                                 context=self.html_context(request, html),
+                                 stream=self.html_stream)
+
+    def inner_html(self, request, html=None):
+        '''Render the inner html, returned by :meth:`get_html` unless
+        given
+        '''
+        if html is None:
+            timeout = self.fragment_cache
+            if timeout:
+                html = fragment(self, request,
+                                lambda: self.get_html(request),
+                                None if timeout is True else timeout,
+                                self.fragment_tags)
+            else:
+                html = self.get_html(request)
+
+        if isinstance(html, Html):
+            html = html.render(request)
+        return html
+
+    def html_context(self, request, html=None):
+        '''The context for rendering the html body template
+        '''
+        context = {'html_main': self.inner_html(request, html)}
+        self.context(request, context)
+        return context
+
+    def content_version(self, request):
+        '''Version of the content served to ``request``.
+
+        By default it returns ``None``. When implemented, it should return a
+        value (for example a last update timestamp) which changes when the
+        content changes; it is used to set a weak ``ETag`` and to return a
+        304 response, without rendering, when the client has the current
+        version.
+        '''
+        return None
 
     def get_html(self, request):
         '''Must be implemented by subclasses.
@@ -223,10 +295,24 @@ class HeadMeta(object):
             return self.head.get_meta(entry, meta_key=meta_key)
 
 
+ERROR_MESSAGE = '{{lux:error-message}}'
+
+
 def error_handler(request, exc):
-    '''Default renderer for errors.'''
+    '''Default renderer for errors.
+
+    Outside debug mode, html error pages are rendered once for each status
+    code from the :attr:`~.Application.html_prototype` and cached in the
+    :attr:`~.Application.error_pages` dictionary, only the error message
+    is substituted for each request. Requests which match the
+    :setting:`ERROR_404_FAST_PATHS` or :setting:`ERROR_404_FAST_AGENTS`
+    expressions receive a plain text 404 response.
+    '''
     app = request.app
     response = request.response
+    if response.status_code == 404 and app.fast_404(request.environ):
+        response.content_type = 'text/plain'
+        return error_messages[404]
     if not response.content_type:
         content_type = request.get('default.content_type')
         if content_type:
@@ -242,10 +328,10 @@ def error_handler(request, exc):
     else:
         msg = error_messages.get(response.status_code) or str(exc)
         if is_html:
-            msg = app.render_template(['%s.html' % response.status_code,
-                                       'error.html'],
-                                      {'status_code': response.status_code,
-                                       'status_message': msg})
+            page = app.error_pages.get(response.status_code)
+            if page is None:
+                page = error_page(app, request, response.status_code)
+            return page.replace(ERROR_MESSAGE, msg)
     #
     if is_html:
         doc = request.html_document
@@ -257,3 +343,25 @@ def error_handler(request, exc):
                            'message': msg})
     else:
         return '\n'.join(msg) if isinstance(msg, (list, tuple)) else msg
+
+
+def error_page(app, request, status_code):
+    '''Render the html error page for ``status_code`` and store it in the
+    :attr:`~.Application.error_pages` of ``app``.
+
+    The page does not depend on ``request``, the message is replaced by a
+    placeholder substituted when the page is served. The document is a
+    clone of the :attr:`~.Application.html_prototype`, so it includes
+    what the ``on_html_prototype`` event adds, while the
+    ``on_html_document`` event is not fired since its handlers may add
+    request specific content, such as the url of the page.
+    '''
+    msg = app.render_template(['%s.html' % status_code, 'error.html'],
+                              {'status_code': status_code,
+                               'status_message': ERROR_MESSAGE})
+    doc = app.html_document(request, event=False)
+    doc.head.title = '%s %s' % (status_code, responses.get(status_code))
+    doc.body.append(msg)
+    page = doc.render(request)
+    app.error_pages[status_code] = page
+    return page
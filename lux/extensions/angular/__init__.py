@@ -25,7 +25,7 @@ Include ``lux.extensions.angular`` into the :setting:`EXTENSIONS` list in your
 .. _`ui-router`: https://github.com/angular-ui/ui-router
 '''
 import lux
-from lux import Parameter, RouterParam
+from lux import Parameter, RouterParam, JsContext
 
 from pulsar.apps.wsgi import MediaMixin, Html, route
 from pulsar.utils.httpurl import urlparse
@@ -69,20 +69,26 @@ class Extension(lux.Extension):
 
             doc.head.meta.append(Html('base', href="/"))
 
-            if not hasattr(root, '_angular_sitemap'):
-                root._angular_sitemap = {'states': [], 'pages': {}}
-                add_to_sitemap(root._angular_sitemap, app, doc, root)
-            doc.jscontext.update(root._angular_sitemap)
+            angular_sitemap(app, root)
+            add_ng_modules(doc, root._angular_modules)
+            doc.jscontext.update_encoded(root._angular_sitemap_json)
             doc.jscontext['page'] = router.state
         else:
             add_ng_modules(doc, router.uimodules)
 
+    def on_warm(self, app):
+        if app.config['HTML5_NAVIGATION']:
+            for router in app.wsgi_handler.middleware:
+                if html_router(router):
+                    angular_sitemap(app, angular_root(app, router))
+
     def context(self, request, context):
         router = html_router(request.app_handler)
         if request.config['HTML5_NAVIGATION'] and router:
+            # the html document builds the sitemap of the angular root
+            request.html_document
             root = angular_root(request.app, router)
-            pages = request.html_document.jscontext['pages']
-            page = pages.get(router.state)
+            page = root._angular_sitemap['pages'].get(router.state)
             context['html_main'] = self.uiview(request, context, page)
 
     def uiview(self, request, context, page):
@@ -128,6 +134,20 @@ def angular_compatible(app, router1, router2):
     return False
 
 
+def angular_sitemap(app, root):
+    '''Build the sitemap of an angular ``root`` router once only
+    '''
+    if not hasattr(root, '_angular_sitemap'):
+        sitemap = {'states': [], 'pages': {}}
+        modules = set()
+        add_to_sitemap(sitemap, app, modules, root)
+        root._angular_modules = tuple(modules)
+        root._angular_sitemap = sitemap
+        # The sitemap is encoded once only
+        root._angular_sitemap_json = JsContext.encode(sitemap)
+    return root._angular_sitemap
+
+
 def router_href(app, route):
     url = '/'.join(_angular_route(route))
     if url:
@@ -151,7 +171,8 @@ def _angular_route(route):
             yield val
 
 
-def add_to_sitemap(sitemap, app, doc, router, parent=None, angular=None):
+def add_to_sitemap(sitemap, app, modules, router, parent=None,
+                   angular=None):
     # path for the current router
     path = router_href(app, router.full_route)
 
@@ -172,11 +193,12 @@ def add_to_sitemap(sitemap, app, doc, router, parent=None, angular=None):
 
     sitemap['states'].append(name)
     sitemap['pages'][name] = page
-    add_ng_modules(doc, router.uimodules)
+    if router.uimodules:
+        modules.update(router.uimodules)
     #
     # Loop over children routes
     for child in router.routes:
-        add_to_sitemap(sitemap, app, doc, child, name, angular)
+        add_to_sitemap(sitemap, app, modules, child, name, angular)
 
     # Add redirect to folder page if required
     return
@@ -1,5 +1,9 @@
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
 from sqlalchemy.orm.exc import NoResultFound
 
+from lux import MemoryCache
+
 from lux.extensions.rest import (PasswordMixin, backends, normalise_email,
                                  AuthenticationError, READ)
 
@@ -8,8 +12,18 @@ from .views import Authorization
 
 class AuthMixin(PasswordMixin):
     '''Mixin to implement authentication backend based on
-    SQLAlchemy models
+    SQLAlchemy models.
+
+    The column values of users fetched by :meth:`get_user` are kept in an
+    identity cache of :setting:`USER_CACHE_SIZE` entries for
+    :setting:`USER_CACHE_TIMEOUT` seconds, a new detached instance is built
+    from them for each request. A user is removed from the cache when a
+    session changing it is committed, see :meth:`on_commit`.
+
+    The cache is in the memory of each process, changes committed by
+    other processes are seen once the cached entry expires.
     '''
+    _user_cache = None
 
     def get_user(self, request, user_id=None, username=None, email=None,
                  **kw):
@@ -17,24 +31,85 @@ class AuthMixin(PasswordMixin):
 
         Returns user or nothing
         '''
+        if user_id:
+            field, value = 'id', user_id
+        elif username:
+            field, value = 'username', username
+        elif email:
+            field, value = 'email', normalise_email(email)
+        else:
+            return
+
         odm = request.app.odm()
+        cache = self.user_cache(request.app)
+        if cache:
+            user = self.cached_user(odm.user, cache, field, value)
+            if user is not None:
+                return user
 
         with odm.begin() as session:
             query = session.query(odm.user)
             try:
-                if user_id:
-                    user = query.get(user_id)
-                elif username:
-                    user = query.filter_by(username=username).one()
-                elif email:
-                    user = query.filter_by(email=normalise_email(email)).one()
+                if field == 'id':
+                    user = query.get(value)
                 else:
-                    return
+                    user = query.filter_by(**{field: value}).one()
             except NoResultFound:
                 return
 
+        if user is not None and cache:
+            self.cache_user(cache, user)
         return user
 
+    def user_cache(self, app):
+        '''The :class:`.MemoryCache` of users, ``False`` if
+        :setting:`USER_CACHE_SIZE` is 0
+        '''
+        if self._user_cache is None:
+            size = app.config['USER_CACHE_SIZE']
+            self._user_cache = (
+                MemoryCache(app, 'users', app.config['USER_CACHE_TIMEOUT'],
+                            size) if size else False)
+        return self._user_cache
+
+    def cached_user(self, model, cache, field, value):
+        '''A new detached ``model`` instance built from the cached columns
+        of the user with ``field`` equal to ``value``
+        '''
+        if field != 'id':
+            # username and email map to the user id
+            user_id = cache.get((field, value))
+            if user_id is None:
+                return
+        else:
+            user_id = value
+        data = cache.get(('id', user_id))
+        if data is not None and data.get(field) == value:
+            user = model(**data)
+            make_transient_to_detached(user)
+            return user
+
+    def cache_user(self, cache, user):
+        state = inspect(user)
+        data = dict(((attr.key, state.dict[attr.key])
+                     for attr in state.mapper.column_attrs
+                     if attr.key in state.dict))
+        cache.set(('id', user.id), data)
+        cache.set(('username', user.username), user.id)
+        if user.email:
+            cache.set(('email', user.email), user.id)
+
+    def on_commit(self, app, changes):
+        '''Remove users changed by a committed session from the
+        identity cache
+        '''
+        cache = self.user_cache(app)
+        if cache:
+            model = app.odm().user
+            for target, operation in changes:
+                if isinstance(target, model):
+                    cache.delete(('id', target.id))
+
     def authenticate(self, request, user_id=None, username=None, email=None,
                      password=None, **kw):
         odm = request.app.odm()
@@ -97,6 +172,16 @@ class AuthMixin(PasswordMixin):
 
         return user
 
+    def set_password(self, request, user, password):
+        '''Set the password for ``user`` and commit changes'''
+        odm = request.app.odm()
+
+        with odm.begin() as session:
+            user.password = self.password(password)
+            session.add(user)
+
+        return user
+
     def create_superuser(self, request, **params):
         params['superuser'] = True
         params['active'] = True
@@ -10,9 +10,27 @@ When the :setting:`SERVE_STATIC_FILES` parameter is set to ``True``,
 this extension adds middleware for serving static files from
 :setting:`MEDIA_URL`.
 In addition, a :setting:`FAVICON` location can also be specified.
+
+When :setting:`MEDIA_PRECOMPRESSED` is ``True``, css, javascript, json, svg
+and html files are served from ``.br`` and ``.gz`` sidecar files, if
+the client accepts the encoding, rather than compressed for each response.
+Sidecar files are written by the ``compress_media`` command and by the
+static site build.
+
+Response Cache
+======================
+When :setting:`RESPONSE_CACHE_TIMEOUT` is a positive number, full responses
+served to anonymous clients are stored in the application
+:attr:`~.Application.cache_server` and served from there until they expire
+or are purged via the ``response_cache`` attribute of the application::
+
+    app.response_cache.purge('/blog/')
+    app.response_cache.purge()      # all paths
+
+By default only :class:`.HtmlRouter` responses are cached, routers opt
+in or out via the ``response_cache`` parameter.
 '''
 import os
-import hashlib
 
 from pulsar.apps import wsgi
 from pulsar.utils.httpurl import remove_double_slash, urlparse
@@ -21,6 +39,9 @@ import lux
 from lux import Parameter
 
 from .media import FileRouter, MediaRouter
+from .stats import StatsRouter
+from .cache import ResponseCache
+from .encoding import EncodingMiddleware
 
 
 class Extension(lux.Extension):
@@ -28,15 +49,46 @@ class Extension(lux.Extension):
         Parameter('GZIP_MIN_LENGTH', 200,
                   'If a positive integer, a response middleware is added so '
                   'that it encodes the response via the gzip algorithm.'),
-        Parameter('USE_ETAGS', False, ''),
+        Parameter('GZIP_LEVEL', 6,
+                  'The gzip compression level, from 1 to 9'),
+        Parameter('GZIP_THREAD_LENGTH', 0,
+                  'If a positive integer, responses longer than this number '
+                  'of bytes are compressed in a thread rather than in the '
+                  'event loop'),
+        Parameter('GZIP_MAX_LAG', 0,
+                  'If a positive number, the gzip compression level is '
+                  'reduced when the lag of the event loop approaches this '
+                  'number of seconds and it is set to 1 when it exceeds it'),
+        Parameter('GZIP_STREAMS', False,
+                  'Compress streamed responses, chunk by chunk'),
+        Parameter('USE_ETAGS', False,
+                  'Add an ETag header, computed while compressing the '
+                  'response, and respond with 304 Not Modified when it '
+                  'matches the If-None-Match request header'),
         Parameter('CLEAN_URL', False,
                   'When ``True``, requests on urls with consecutive slashes '
                   'are converted to valid url and redirected.'),
         Parameter('SERVE_STATIC_FILES', False,
                   'if ``True`` add middleware to serve static files.'),
+        Parameter('MEDIA_PRECOMPRESSED', False,
+                  'Serve media files from their precompressed ``.br`` and '
+                  '``.gz`` sidecar files, written by the ``compress_media`` '
+                  'command'),
         Parameter('FAVICON', None,
                   'Adds tag of type ``image/x-icon`` in the head section of'
-                  ' the Html document')]
+                  ' the Html document'),
+        Parameter('STATS_URL', None,
+                  'If set, the application runtime statistics are served '
+                  'as JSON from this url to superusers, or to everyone in '
+                  'debug mode. Statistics are collected when '
+                  ':setting:`EVENT_STATS` is ``True``.'),
+        Parameter('RESPONSE_CACHE_TIMEOUT', 0,
+                  'If a positive number, responses to anonymous GET requests '
+                  'are cached for this number of seconds'),
+        Parameter('RESPONSE_CACHE_VARY', ['Accept-Encoding'],
+                  'Request headers whose values select different cached '
+                  'responses for the same url. ``Accept-Encoding`` is '
+                  'always included')]
 
     def middleware(self, app):
         '''Add two middleware handlers if configured to do so.'''
@@ -45,20 +97,36 @@ class Extension(lux.Extension):
             middleware.append(wsgi.clean_path_middleware)
         if app.config['SERVE_STATIC_FILES']:
             path = app.config['MEDIA_URL']
-            middleware.append(MediaRouter(path, app.meta.media_dir,
-                                          show_indexes=app.debug))
+            middleware.append(MediaRouter(
+                path, app.meta.media_dir, show_indexes=app.debug,
+                precompressed=app.config['MEDIA_PRECOMPRESSED']))
+        if app.config['STATS_URL']:
+            middleware.append(StatsRouter(app.config['STATS_URL']))
+        timeout = app.config['RESPONSE_CACHE_TIMEOUT']
+        if timeout:
+            app.response_cache = ResponseCache(
+                app, timeout, app.config['RESPONSE_CACHE_VARY'])
+            middleware.append(app.response_cache)
         return middleware
 
     def response_middleware(self, app):
-        gzip = app.config['GZIP_MIN_LENGTH']
+        cfg = app.config
+        gzip = cfg['GZIP_MIN_LENGTH']
         middleware = []
-        if gzip:
-            middleware.append(wsgi.GZipMiddleware(gzip))
-        if app.config['USE_ETAGS']:
-            middleware.append(self.etag)
+        # response middleware are executed in reversed order, the response
+        # is cached once compressed
+        if getattr(app, 'response_cache', None):
+            middleware.append(app.response_cache.store)
+        etag = cfg['USE_ETAGS']
+        if gzip or etag:
+            middleware.append(EncodingMiddleware(
+                gzip, etag, level=cfg['GZIP_LEVEL'],
+                thread_length=cfg['GZIP_THREAD_LENGTH'],
+                max_lag=cfg['GZIP_MAX_LAG'],
+                streams=cfg['GZIP_STREAMS']))
         return middleware
 
-    def on_html_document(self, app, request, doc):
+    def on_html_prototype(self, app, doc):
         favicon = app.config['FAVICON']
         if favicon:
             parsed = urlparse(favicon)
@@ -71,18 +139,3 @@ class Extension(lux.Extension):
                     favicon = '%s%s' % (site_url, favicon)
             doc.head.links.append(favicon, rel="icon",
                                   type='image/x-icon')
-
-    def etag(self, environ, response):
-        if response.has_header('ETag'):
-            etag = response['ETag']
-        elif response.streaming:
-            etag = None
-        else:
-            etag = '"%s"' % hashlib.md5(response.content).hexdigest()
-        if etag is not None:
-            if (200 <= response.status_code < 300 and
-                    environ.get('HTTP_IF_NONE_MATCH') == etag):
-                response.not_modified()
-            else:
-                response['ETag'] = etag
-        return response
@@ -0,0 +1,189 @@
+import time
+from threading import Lock
+from hashlib import md5
+from functools import partial
+
+from pulsar.apps.wsgi import WsgiResponse
+
+from lux import DEFAULT_CONTENT_TYPES, HtmlRouter, wsgi_request
+
+from .encoding import BODY_FUTURE
+
+
+CACHE_KEY = 'lux.response_cache'
+UNCACHEABLE = ('private', 'no-store', 'no-cache')
+NOT_STORED = frozenset(('date', 'age', 'set-cookie'))
+PER_REQUEST = ('access-control-',)
+
+
+class ResponseCache:
+    '''Cache of full responses served to anonymous clients.
+
+    It is used both as a wsgi middleware, which serves responses from the
+    cache, and as a response middleware, via the :meth:`store` method, which
+    adds responses to the cache once all other response middleware (gzip
+    included) have been applied. Bodies compressed in a thread are stored
+    once the compression is done.
+
+    Only ``GET`` requests from clients without an ``Authorization`` header
+    or a session cookie are served from the cache. Responses are stored
+    if their status code is 200, they don't set cookies and their
+    ``Cache-Control`` header is not ``private``, ``no-store`` or
+    ``no-cache``.
+    Responses are cached for :class:`.HtmlRouter` by default. Any router
+    can opt in or out via the ``response_cache`` router parameter, which can
+    also specify a timeout in seconds.
+
+    Cache entries are keyed by path and stored in the
+    :attr:`.Application.cache_server`. Each entry holds a variant for each
+    query string, negotiated content type and value of the ``vary``
+    headers, together with the time it was stored. The ``Accept-Encoding``
+    header always selects a variant, since cached bodies may be compressed.
+    Cached responses are served with an ``Age`` header. The ``Date``,
+    ``Set-Cookie`` and ``Access-Control-*`` headers are not stored, the
+    latter depend on the ``Origin`` of a request and are added again by the
+    response middleware when a cached response is served.
+
+    Purging all paths records the purge time, with no expiry, in the cache
+    server. Variants stored before it are ignored. If the purge time is not
+    available, for example because it was evicted, it is set to the current
+    time so that no stale response is served. The purge time is read again
+    from the cache server at most every :attr:`purge_check` seconds.
+    '''
+    purge_check = 1
+
+    def __init__(self, app, timeout, vary=None):
+        self.app = app
+        self.timeout = timeout
+        vary = ['HTTP_%s' % h.upper().replace('-', '_') for h in vary or ()]
+        if 'HTTP_ACCEPT_ENCODING' not in vary:
+            vary.insert(0, 'HTTP_ACCEPT_ENCODING')
+        self.vary = tuple(vary)
+        self.cookie = app.config.get('SESSION_COOKIE_NAME')
+        self._purged = (0, 0)
+        self._lock = Lock()
+
+    def __call__(self, environ, start_response):
+        if not self.cacheable(environ):
+            return
+        path = environ.get('PATH_INFO') or '/'
+        key = self.key(path)
+        variant = self.variant(environ)
+        entry = (self.app.cache_server.get(key) or {}).get(variant)
+        if entry is None or entry[3] < self.purged_at():
+            environ[CACHE_KEY] = (key, variant)
+        else:
+            status, headers, body, created = entry
+            headers = list(headers)
+            headers.append(('Age', str(int(time.time() - created))))
+            return WsgiResponse(status, (body,), response_headers=headers,
+                                environ=environ)
+
+    def store(self, environ, response):
+        '''Response middleware which adds ``response`` to the cache
+        '''
+        target = environ.pop(CACHE_KEY, None)
+        body = environ.get(BODY_FUTURE) if response.is_streamed else None
+        if (target is None or response.status_code != 200 or
+                (response.is_streamed and body is None) or
+                response.cookies):
+            return
+        control = response.headers.get('Cache-Control', '').lower()
+        if any((value in control for value in UNCACHEABLE)):
+            return
+        request = wsgi_request(environ)
+        user = request.cache.user
+        if user is not None and not user.is_anonymous():
+            return
+        timeout = self.router_timeout(request.cache.app_handler)
+        if not timeout:
+            return
+        key, variant = target
+        # the purge time is set before the first entry is stored
+        self.purged_at()
+        headers = [(name, value) for name, value in response.get_headers()
+                   if self.stored_header(name)]
+        if body is None:
+            self.set(key, variant, headers, b''.join(response.content),
+                     timeout)
+        else:
+            body.add_done_callback(partial(self._body_done, key, variant,
+                                           headers, timeout))
+
+    def set(self, key, variant, headers, body, timeout):
+        '''Store the ``variant`` of a 200 response at ``key``
+
+        Variants of the same ``key`` are stored together, the update is
+        serialised across the threads of this process.
+        '''
+        cache = self.app.cache_server
+        with self._lock:
+            entries = dict(cache.get(key) or ())
+            entries[variant] = (200, headers, body, time.time())
+            cache.set(key, entries, timeout)
+
+    def purge(self, path=None):
+        '''Remove cached responses for ``path`` or for all paths
+        '''
+        cache = self.app.cache_server
+        if path is None:
+            now = time.time()
+            cache.set(self.purge_key, now, timeout=0)
+            self._purged = (now, now)
+        else:
+            cache.delete(self.key(path))
+
+    def purged_at(self):
+        '''Time of the last purge of all paths
+        '''
+        checked, purged = self._purged
+        now = time.time()
+        if now - checked >= self.purge_check:
+            cache = self.app.cache_server
+            purged = cache.get(self.purge_key)
+            if purged is None:
+                purged = now
+                if not cache.add(self.purge_key, purged, timeout=0):
+                    purged = cache.get(self.purge_key, purged)
+            self._purged = (now, purged)
+        return purged
+
+    def cacheable(self, environ):
+        if environ.get('REQUEST_METHOD') != 'GET':
+            return False
+        if environ.get('HTTP_AUTHORIZATION'):
+            return False
+        cookie = environ.get('HTTP_COOKIE')
+        if cookie and self.cookie and '%s=' % self.cookie in cookie:
+            return False
+        return True
+
+    def stored_header(self, name):
+        name = name.lower()
+        return name not in NOT_STORED and not name.startswith(PER_REQUEST)
+
+    @property
+    def purge_key(self):
+        return 'lux:response-purged:%s' % self.app.config_module
+
+    def key(self, path):
+        return 'lux:response:%s:%s' % (self.app.config_module, path)
+
+    def variant(self, environ):
+        content_types = wsgi_request(environ).content_types
+        bits = [environ.get('QUERY_STRING', ''),
+                content_types.best_match(DEFAULT_CONTENT_TYPES) or '']
+        bits.extend((environ.get(name, '') for name in self.vary))
+        return md5('\n'.join(bits).encode('utf-8')).hexdigest()
+
+    def router_timeout(self, router):
+        value = getattr(router, 'response_cache', None)
+        if value is None:
+            value = isinstance(router, HtmlRouter)
+        if value is True:
+            return self.timeout
+        return value or 0
+
+    def _body_done(self, key, variant, headers, timeout, future):
+        if not future.cancelled() and future.exception() is None:
+            self.set(key, variant, headers, future.result(), timeout)
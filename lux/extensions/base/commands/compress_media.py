@@ -0,0 +1,36 @@
+import os
+
+from pulsar import Setting
+
+import lux
+from lux.extensions.base.media import MediaRouter, compress_directory
+
+
+class Command(lux.Command):
+    help = ('Write compressed sidecar files of css, javascript, json, svg '
+            'and html media files, served when MEDIA_PRECOMPRESSED is True.')
+    option_list = (
+        Setting('directory', ('--directory',),
+                desc=('Compress files in this directory rather than in the '
+                      'media directories of the application')),
+        Setting('min_length', ('--min-length',),
+                type=int, default=200,
+                desc='Minimum size in bytes of files to compress'),
+    )
+
+    def run(self, options, **params):
+        written = []
+        for directory in self.directories(options):
+            written.extend(compress_directory(directory, options.min_length))
+        self.write('Written %d compressed files' % len(written))
+        return written
+
+    def directories(self, options):
+        if options.directory:
+            return [options.directory]
+        app = self.app
+        router = MediaRouter(app.config['MEDIA_URL'], app.meta.media_dir)
+        directories = [path for _, path in router.extension_paths(app)]
+        if app.meta.media_dir and os.path.isdir(app.meta.media_dir):
+            directories.append(app.meta.media_dir)
+        return directories
@@ -0,0 +1,209 @@
+import zlib
+import asyncio
+import hashlib
+
+from pulsar import chain_future
+from pulsar.apps import wsgi
+from pulsar.apps.wsgi.response import re_accepts_gzip, re_media_type
+
+from lux.utils.http import etag_match, encode_chunk, StreamChunk
+
+BODY_FUTURE = 'lux.body_future'
+
+try:
+    from greenlet import getcurrent
+except ImportError:
+    getcurrent = None
+
+
+class EncodingMiddleware(wsgi.GZipMiddleware):
+    '''Response middleware for gzip compression and ETags.
+
+    The body of the response is normally traversed once only: each chunk is
+    added to the digest of the ETag and to the gzip stream at the same time.
+
+    The ETag of a compressed response has the ``-gzip`` suffix, so that it
+    differs from the ETag of the identity encoding. Responses with an
+    ``ETag`` already set, for example by :meth:`.HtmlRouter.content_version`,
+    and streamed responses are not hashed.
+
+    Bodies longer than ``thread_length`` are compressed in the executor of
+    the event loop, zlib releases the GIL while compressing. When running on
+    a greenlet of the green pool, the greenlet waits for the compressed body,
+    otherwise the response is streamed with a :class:`.StreamChunk` of the
+    compressed body as its only chunk and the future of the body is stored
+    in the ``lux.body_future`` key of the WSGI environ, so that the body
+    can still be cached once compressed.
+
+    :param min_length: minimum length of responses to compress, if ``0``
+        responses are not compressed.
+    :param etag: add an ``ETag`` header and respond with 304 when it matches
+        the ``If-None-Match`` request header.
+    :param level: the compression level.
+    :param thread_length: if positive, bodies longer than this number of
+        bytes are compressed in a thread.
+    :param max_lag: if positive, the compression level is reduced when the
+        lag of the event loop approaches this number of seconds and it is
+        ``1`` when the lag exceeds it.
+    :param streams: compress streamed responses too, one chunk at a time.
+    '''
+    def __init__(self, min_length=200, etag=False, level=6, thread_length=0,
+                 max_lag=0, streams=False):
+        super().__init__(min_length)
+        self.etag = etag
+        self.level = level
+        self.thread_length = thread_length
+        self.max_lag = max_lag
+        self.streams = streams
+        self.loop_lag = LoopLag()
+
+    def __call__(self, environ, response):
+        compress = self.min_length and self.available(environ, response)
+        etag = response.headers.get('ETag')
+        digest = None
+        if (self.etag and etag is None and not response.is_streamed and
+                200 <= response.status_code < 300):
+            digest = hashlib.md5()
+        if compress or digest:
+            self.execute(environ, response, compress, digest)
+            if digest:
+                etag = '"%s%s"' % (digest.hexdigest(),
+                                   '-gzip' if compress else '')
+                response['ETag'] = etag
+        elif (self.streams and self.min_length and
+                self.stream_available(environ, response)):
+            self.compress_stream(response)
+        if (etag and 200 <= response.status_code < 300 and
+                etag_match(environ.get('HTTP_IF_NONE_MATCH'), etag)):
+            response.status_code = 304
+            response.content = ()
+        return response
+
+    def execute(self, environ, response, compress=True, digest=None):
+        content = response.content
+        if not compress:
+            for chunk in content:
+                digest.update(chunk)
+            return
+        level = self.compress_level()
+        if self.thread_length and response.length() > self.thread_length:
+            if getcurrent and getcurrent().parent:
+                from pulsar.apps.greenio import wait
+                body = wait(self.run_in_executor(gzip_body, content, level,
+                                                 digest))
+            else:
+                if digest:
+                    for chunk in content:
+                        digest.update(chunk)
+                future = self.run_in_executor(gzip_body, content, level)
+                environ[BODY_FUTURE] = future
+                body = future_body(future)
+        else:
+            body = gzip_body(content, level, digest)
+        response.headers.add_header('Vary', 'Accept-Encoding')
+        response.content = body
+        response.headers['Content-Encoding'] = 'gzip'
+
+    def stream_available(self, environ, response):
+        '''Check if a streamed response can be compressed
+        '''
+        if response.status_code != 200 or not response.is_streamed:
+            return False
+        headers = response.headers
+        if 'Content-Encoding' in headers:
+            return False
+        ctype = headers.get('Content-Type', '').lower()
+        if "msie" in environ.get('HTTP_USER_AGENT', '').lower():
+            if not ctype.startswith("text/") or "javascript" in ctype:
+                return False
+        if not re_accepts_gzip.search(environ.get('HTTP_ACCEPT_ENCODING',
+                                                  '')):
+            return False
+        return not re_media_type.match(ctype)
+
+    def compress_stream(self, response):
+        response.headers.add_header('Vary', 'Accept-Encoding')
+        response.content = gzip_stream(response.content,
+                                       self.compress_level(),
+                                       response.encoding or 'utf-8')
+        response.headers['Content-Encoding'] = 'gzip'
+
+    def compress_level(self):
+        '''The compression level, reduced when the event loop lags
+        '''
+        if self.max_lag:
+            self.loop_lag.start(asyncio.get_event_loop())
+            lag = self.loop_lag.lag
+            if lag >= self.max_lag:
+                return 1
+            elif lag >= 0.5*self.max_lag:
+                return max(1, self.level // 2)
+        return self.level
+
+    def run_in_executor(self, callable, *args):
+        return asyncio.get_event_loop().run_in_executor(None, callable, *args)
+
+
+class LoopLag:
+    '''Measure the lag of an event loop.
+
+    A callback is scheduled every ``interval`` seconds and the lag is the
+    delay between the time the callback was due and the time it runs.
+    Peaks decay by half at each interval, so that a single blocking call
+    is taken into account by the following responses.
+    '''
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.lag = 0
+        self._loop = None
+
+    def start(self, loop):
+        if loop is not self._loop:
+            self._loop = loop
+            self.lag = 0
+            self._schedule(loop)
+
+    def _schedule(self, loop):
+        loop.call_later(self.interval, self._tick, loop,
+                        loop.time() + self.interval)
+
+    def _tick(self, loop, due):
+        if loop is self._loop:
+            self.lag = max(loop.time() - due, 0.5*self.lag)
+            self._schedule(loop)
+
+
+def gzip_body(chunks, level=6, digest=None):
+    '''Compress an iterable over bytes into a gzip body
+    '''
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    body = []
+    for chunk in chunks:
+        if digest:
+            digest.update(chunk)
+        body.append(compressor.compress(chunk))
+    body.append(compressor.flush())
+    return b''.join(body)
+
+
+def gzip_stream(chunks, level=6, encoding='utf-8'):
+    '''Compress a stream of chunks, which can be :class:`.StreamChunk`,
+    into a gzip stream. Each chunk is flushed so that it reaches the client
+    without waiting for the following ones.
+    '''
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(chunk):
+        return (compressor.compress(encode_chunk(chunk, encoding)) +
+                compressor.flush(zlib.Z_SYNC_FLUSH))
+
+    for chunk in chunks:
+        if isinstance(chunk, StreamChunk):
+            yield StreamChunk(chain_future(chunk.future, callback=compress))
+        else:
+            yield compress(chunk)
+    yield compressor.flush()
+
+
+def future_body(future):
+    yield StreamChunk(future)
@@ -1,5 +1,6 @@
 import os
 import re
+import gzip
 import stat
 import mimetypes
 from itertools import chain
@@ -14,6 +15,18 @@ from pulsar import Http404, PermissionDenied
 from pulsar.apps import wsgi
 from pulsar.apps.wsgi import Html
 
+from lux.utils.http import accept_encodings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE = ('.css', '.js', '.json', '.svg', '.html')
+# Sidecar suffixes in order of preference
+SIDECARS = (('br', '.br'), ('gzip', '.gz'))
+
 
 def filesystem_path(app, base, bits):
     name = bits[0]
@@ -27,6 +40,51 @@ def filesystem_path(app, base, bits):
         return os.path.join(*bits)
 
 
+def compress_file(path, min_length=0):
+    '''Write the ``.gz`` sidecar, and the ``.br`` sidecar when the brotli
+    package is available, of the file at ``path``.
+
+    Sidecars newer than the file are not written again.
+    Return a list of written sidecars.
+    '''
+    mtime = os.stat(path).st_mtime
+    written = []
+    data = None
+    for encoding, suffix in SIDECARS:
+        if encoding == 'br' and not brotli:
+            continue
+        target = path + suffix
+        if os.path.isfile(target) and os.stat(target).st_mtime >= mtime:
+            continue
+        if data is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+            if len(data) < min_length:
+                return written
+        if encoding == 'br':
+            body = brotli.compress(data)
+        else:
+            body = gzip.compress(data, 9)
+        with open(target, 'wb') as f:
+            f.write(body)
+        os.utime(target, (mtime, mtime))
+        written.append(target)
+    return written
+
+
+def compress_directory(directory, min_length=0):
+    '''Write compressed sidecars for all :data:`COMPRESSIBLE` files in
+    ``directory`` and its subdirectories. Return a list of written sidecars.
+    '''
+    written = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if os.path.splitext(name)[1] in COMPRESSIBLE:
+                written.extend(compress_file(os.path.join(root, name),
+                                             min_length))
+    return written
+
+
 class FileRouter(wsgi.FileRouter):
     request_class = lux.WsgiRequest
 
@@ -36,9 +94,15 @@ class FileRouter(wsgi.FileRouter):
 
 class MediaRouter(wsgi.MediaRouter):
     '''A simple application for handling static files
+
+    When ``precompressed`` is ``True``, :data:`COMPRESSIBLE` files are served
+    from their ``.br`` or ``.gz`` sidecar, written by
+    :func:`compress_directory`, if the client accepts the encoding and the
+    sidecar is not older than the file.
     '''
     request_class = lux.WsgiRequest
     lux = True
+    precompressed = False
 
     def filesystem_path(self, request):
         '''Override :class:`~pulsar.apps.wsgi.router.MediaRouter`
@@ -49,6 +113,47 @@ class MediaRouter(wsgi.MediaRouter):
         else:
             return super(MediaRouter, self).filesystem_path(request)
 
+    def serve_file(self, request, fullpath, status_code=None):
+        if (status_code or not self.precompressed or
+                os.path.splitext(fullpath)[1] not in COMPRESSIBLE):
+            return super().serve_file(request, fullpath, status_code)
+        response = request.response
+        response.headers.add_header('Vary', 'Accept-Encoding')
+        statobj = os.stat(fullpath)
+        sidecar, encoding = self.sidecar(request, fullpath, statobj)
+        if not sidecar:
+            return super().serve_file(request, fullpath)
+        content_type, _ = mimetypes.guess_type(fullpath)
+        if content_type:
+            response.content_type = content_type
+        if not self.was_modified_since(
+                request.environ.get('HTTP_IF_MODIFIED_SINCE'),
+                statobj[stat.ST_MTIME],
+                statobj[stat.ST_SIZE]):
+            response.status_code = 304
+        else:
+            with open(sidecar, 'rb') as f:
+                response.content = f.read()
+            response['Content-Encoding'] = encoding
+            response['Last-Modified'] = http_date(statobj[stat.ST_MTIME])
+        return response
+
+    def sidecar(self, request, fullpath, statobj):
+        '''The compressed sidecar of ``fullpath`` to serve and its encoding
+        '''
+        accepted = accept_encodings(
+            request.environ.get('HTTP_ACCEPT_ENCODING'))
+        for encoding, suffix in SIDECARS:
+            if encoding in accepted:
+                path = fullpath + suffix
+                try:
+                    mtime = os.stat(path)[stat.ST_MTIME]
+                except OSError:
+                    continue
+                if mtime >= statobj[stat.ST_MTIME]:
+                    return path, encoding
+        return None, None
+
     def extension_paths(self, app):
         if self.lux:
             for name in sorted(chain(app.extensions, ('lux',))):
@@ -0,0 +1,36 @@
+from pulsar import PermissionDenied
+from pulsar.apps.wsgi import Json
+
+import lux
+
+
+class StatsRouter(lux.JsonRouter):
+    '''Serve the runtime :attr:`~.Application.stats` of the application
+    as JSON.
+
+    A ``DELETE`` request resets all statistics. Statistics are available
+    when the application runs in debug mode or to superusers only.
+    '''
+    def get(self, request):
+        self.check_permission(request)
+        return Json(request.app.stats.tojson()).http_response(request)
+
+    def delete(self, request):
+        self.check_permission(request)
+        request.app.stats.reset()
+        request.response.status_code = 204
+        return request.response
+
+    def check_permission(self, request):
+        app = request.app
+        if app.debug:
+            return
+        backend = getattr(app, 'auth_backend', None)
+        if backend is None:
+            raise PermissionDenied
+        if request.cache.user is None:
+            # the authentication middleware has not run yet
+            backend.request(request)
+        user = request.cache.user
+        if not (user and user.is_superuser()):
+            raise PermissionDenied
@@ -34,7 +34,7 @@ class OAuth1(object):
         owner_key = token.get('oauth_token')
         owner_secret = token.get('oauth_token_secret')
         cache = request.cache_server
-        cache.add(key=owner_key, value=owner_secret, time=600)
+        cache.add(owner_key, owner_secret, timeout=600)
         return oauth.authorization_url(self.auth_uri)
 
     def access_token(self, request, data, redirect_uri=None):
@@ -34,8 +34,20 @@ class Extension(lux.Extension):
     ]
 
     def on_config(self, app):
-        '''Initialise Object Data Mapper'''
+        '''Initialise Object Data Mapper and add the ``on_commit`` event,
+        fired with the models changed by a committed session
+        '''
         app.odm = Odm(app, app.config['DATASTORE'])
+        app.add_events(('on_commit',))
+
+    def on_warm(self, app):
+        # discover models and create engines before forking workers
+        app.odm()
+
+    def on_fork(self, app):
+        mapper = app.odm.local.mapper
+        if mapper is not None:
+            mapper.after_fork()
 
 
 class Odm(LocalMixin):
@@ -147,6 +147,26 @@ class Mapper:
         for engine in self.engines():
             engine.dispose()
 
+    def after_fork(self):
+        '''Re-create connection pools in a forked process.
+
+        Pools of sql engines are replaced without closing the connections
+        inherited from the parent process, which still uses them, while
+        nosql stores, bound to the event loop of the parent process, are
+        created again.
+        '''
+        for engine in self._engines.values():
+            try:
+                engine.dispose(close=False)
+            except TypeError:
+                # SQLAlchemy < 1.4.33, drop the pool without closing it
+                engine.pool = engine.pool.recreate()
+        for key, store in tuple(self._nosql_engines.items()):
+            self._nosql_engines[key] = create_store(store.dns)
+            for table, engine in tuple(self.binds.items()):
+                if engine is store:
+                    self.binds[table] = self._nosql_engines[key]
+
     # INTERNALS
     def _get_tables(self, engine):
         tables = []
@@ -252,28 +272,27 @@ class LuxSession(Session):
     """The sql alchemy session that lux uses.
 
     It extends the default session system with bind selection and
-    modification tracking.
+    modification tracking. Models inserted, updated or deleted by a
+    committed session are passed to the ``on_commit`` event of the
+    application as a list of ``(instance, operation)`` pairs.
     """
 
     def __init__(self, mapper, **options):
         #: The application that this session belongs to.
         self.mapper = mapper
-        # self.register()
+        self._model_changes = {}
         super().__init__(**options)
 
     @property
     def app(self):
         return self.mapper.app
 
-    def register(self):
-        if not hasattr(self, '_model_changes'):
-            self._model_changes = {}
-
-        event.listen(self, 'before_flush', self.record_ops)
-        event.listen(self, 'before_commit', self.record_ops)
-        event.listen(self, 'before_commit', self.before_commit)
-        event.listen(self, 'after_commit', self.after_commit)
-        event.listen(self, 'after_rollback', self.after_rollback)
+    @classmethod
+    def register(cls):
+        event.listen(cls, 'before_flush', cls.record_ops)
+        event.listen(cls, 'before_commit', cls.record_ops)
+        event.listen(cls, 'after_commit', cls.after_commit)
+        event.listen(cls, 'after_rollback', cls.after_rollback)
 
     @staticmethod
     def record_ops(session, flush_context=None, instances=None):
@@ -290,17 +309,6 @@ class LuxSession(Session):
                 key = state.identity_key if state.has_identity else id(target)
                 d[key] = (target, operation)
 
-    @staticmethod
-    def before_commit(session):
-        try:
-            d = session._model_changes
-        except AttributeError:
-            return
-
-        # if d:
-        #     before_models_committed.send(session.app,
-        #                                  changes=list(d.values()))
-
     @staticmethod
     def after_commit(session):
         try:
@@ -308,9 +316,12 @@ class LuxSession(Session):
         except AttributeError:
             return
 
-        # if d:
-        #     models_committed.send(session.app, changes=list(d.values()))
-        #     d.clear()
+        if d:
+            changes = list(d.values())
+            d.clear()
+            app = session.app
+            if app is not None:
+                app.fire('on_commit', changes)
 
     @staticmethod
     def after_rollback(session):
@@ -319,7 +330,10 @@ class LuxSession(Session):
         except AttributeError:
             return
 
-        # d.clear()
+        d.clear()
+
+
+LuxSession.register()
 
 
 def model_label(attrs):
@@ -63,6 +63,12 @@ class AuthBackend(lux.Extension):
         '''
         pass
 
+    def revoke_user(self, request, user):
+        '''Revoke the credentials issued to ``user``, for example when
+        the user changes password
+        '''
+        pass
+
     def session_expiry(self, request):
         session_expiry = request.config['SESSION_EXPIRY']
         if session_expiry:
@@ -91,6 +97,11 @@ class Extension(AuthBackend):
         Parameter('AUTH_SALT_SIZE', 8,
                   'Salt size for encription algorithm'),
         Parameter('SESSION_MESSAGES', True, 'Handle session messages'),
+        Parameter('USER_CACHE_SIZE', 1000,
+                  'Maximum number of users kept in the identity cache of '
+                  'authentication backends, 0 disables the cache'),
+        Parameter('USER_CACHE_TIMEOUT', 60,
+                  'Seconds a user is kept in the identity cache'),
         Parameter('SESSION_EXPIRY', 7*24*60*60,
                   'Expiry for a session in seconds.'),
         Parameter('CHECK_USERNAME', lambda u: True,
@@ -122,6 +133,7 @@ class Extension(AuthBackend):
                    'not authenticated'))]
 
     ngModules = ['lux.users']
+    context_keys = ('csrf_param', 'csrf_token')
 
     def on_config(self, app):
         self.backends = []
@@ -136,12 +148,14 @@ class Extension(AuthBackend):
             backend = backend()
             backend.setup(app.config, module, app.params)
             self.backends.append(backend)
-            app.bind_events(backend, exclude=('on_config',))
+            app.bind_events(backend, tuple(app.events),
+                            exclude=('on_config', 'on_commit'))
 
         for backend in self.backends:
             if hasattr(backend, 'on_config'):
                 backend.on_config(app)
 
+        self._methods = {}
         app.auth_backend = self
 
     def middleware(self, app):
@@ -187,6 +201,16 @@ class Extension(AuthBackend):
     def __call__(self, environ, start_response):
         return self.request(wsgi_request(environ))
 
+    def on_commit(self, app, changes):
+        '''Forward the ``on_commit`` event to the backends.
+
+        The event is added by the odm extension, possibly after backends
+        are bound to the application events, hence it is not bound to
+        them directly.
+        '''
+        for on_commit in self._backend_methods('on_commit'):
+            on_commit(app, changes)
+
     # AuthBackend Implementation
     def request(self, request):
         # Inject self as the authentication backend
@@ -199,34 +223,110 @@ class Extension(AuthBackend):
         return self._apply_all('authenticate', request, **kwargs)
 
     def login(self, request, user):
+        request.cache.auth_memo = None
         return self._apply_all('login', request, user)
 
     def create_token(self, request, user):
         return self._apply_all('create_token', request, user)
 
     def logout(self, request, user=None):
+        request.cache.auth_memo = None
         return self._apply_all('logout', request, user=user)
 
     def create_user(self, request, **kwargs):
         '''Create a standard user.'''
+        request.cache.auth_memo = None
         return self._apply_all('create_user', request, **kwargs)
 
     def create_superuser(self, request, **kwargs):
         '''Create a user with *superuser* permissions.'''
+        request.cache.auth_memo = None
         return self._apply_all('create_superuser', request, **kwargs)
 
     def get_user(self, request, **kwargs):
-        return self._apply_all('get_user', request, **kwargs)
+        '''Retrieve a user, the result is memoized for the ``request``
+        unless ``None``
+        '''
+        return self._memoized(
+            request, ('get_user',) + tuple(sorted(kwargs.items())),
+            lambda: self._apply_all('get_user', request, **kwargs))
 
     def has_permission(self, request, target, level):
-        has = self._apply_all('has_permission', request, target, level)
-        return True if has is None else has
+        '''Check if ``request`` has permission ``level`` over ``target``.
+
+        The result is memoized for the ``request`` and its user.
+        '''
+        return self._memoized(
+            request, ('has_permission', target, level),
+            lambda: self._has_permission(request, target, level))
 
-    def on_html_document(self, app, request, doc):
+    def set_password(self, request, user, password):
+        '''Set the password for ``user`` and revoke the credentials issued
+        to ``user`` before the change
+        '''
+        request.cache.auth_memo = None
+        result = self._apply_all('set_password', request, user, password)
+        self.revoke_user(request, user)
+        return result
+
+    def revoke_user(self, request, user):
+        '''Revoke the credentials issued to ``user`` by all backends'''
+        request.cache.auth_memo = None
+        for callable in self._backend_methods('revoke_user'):
+            callable(request, user)
+
+    def on_html_prototype(self, app, doc):
         add_ng_modules(doc, self.ngModules)
 
+    def context(self, request, context):
+        '''Add the CSRF parameter name and token to the template context,
+        only when a template uses them
+        '''
+        context['csrf_param'] = request.config.get('CSRF_PARAM')
+        context['csrf_token'] = self._apply_all('csrf_token', request)
+        return context
+
+    def _has_permission(self, request, target, level):
+        has = self._apply_all('has_permission', request, target, level)
+        return True if has is None else has
+
     def _apply_all(self, method, request, *args, **kwargs):
-        for backend in self.backends:
-            result = getattr(backend, method)(request, *args, **kwargs)
+        for callable in self._backend_methods(method):
+            result = callable(request, *args, **kwargs)
             if result is not None:
                 return result
+
+    def _backend_methods(self, method):
+        '''The ``method`` of backends which implement it, rather than
+        inheriting the no-op implementation from :class:`.AuthBackend`
+        '''
+        methods = self._methods.get(method)
+        if methods is None:
+            base = getattr(AuthBackend, method, None)
+            methods = tuple((getattr(backend, method)
+                             for backend in self.backends
+                             if getattr(type(backend), method, base)
+                             is not base))
+            self._methods[method] = methods
+        return methods
+
+    def _memoized(self, request, key, callable):
+        '''Result of ``callable`` memoized in the request cache for the
+        current user. ``None`` results are not memoized.
+        '''
+        cache = request.cache
+        memo = cache.auth_memo
+        if memo is None:
+            memo = cache.auth_memo = {}
+        user = cache.user
+        try:
+            entry = memo.get(key)
+        except TypeError:
+            # unhashable arguments
+            return callable()
+        if entry is not None and entry[0] is user:
+            return entry[1]
+        result = callable()
+        if result is not None:
+            memo[key] = (user, result)
+        return result
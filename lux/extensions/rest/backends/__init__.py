@@ -1,3 +1,4 @@
 from .token import TokenBackend
 from .browser import BrowserBackend
 from .session import SessionBackend
+from .cookie import CookieSessionBackend
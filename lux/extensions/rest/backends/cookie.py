@@ -0,0 +1,215 @@
+import os
+import hmac
+import json
+import time
+import zlib
+import hashlib
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from datetime import datetime, timedelta
+
+from lux import Parameter
+
+from ..user import MessageMixin
+from .session import SessionBackend
+from .token import user_revoked_key
+
+
+class CookieSession(MessageMixin):
+    '''A session stored in a signed cookie
+    '''
+    key_id = None
+
+    def __init__(self, id=None, user_id=None, expiry=None, messages=None,
+                 issued=None):
+        self.id = id or b64encode(os.urandom(12))
+        self.user_id = user_id
+        self.expiry = expiry
+        self.messages = messages or []
+        self.issued = issued or time.time()
+        self.user = None
+
+    def message(self, level, message):
+        self.messages.append({'level': level, 'message': message})
+
+    def remove_message(self, data):
+        try:
+            self.messages.remove(data)
+        except ValueError:
+            return False
+        return True
+
+    def get_messages(self):
+        return self.messages
+
+
+class CookieSessionBackend(SessionBackend):
+    '''Stateless :class:`.SessionBackend` storing the session in a cookie.
+
+    The session id, used to bind CSRF tokens, the user id, the time the
+    session was issued, the expiry and the messages are serialised in the
+    cookie, compressed with zlib when
+    larger than :setting:`SESSION_COOKIE_COMPRESS` bytes, and signed with
+    HMAC-SHA256. Requests are authenticated with a signature check only,
+    the user is loaded by the ``get_user`` method of the other
+    authentication backends.
+
+    The cookie value is ``<key id>.<format>.<payload>.<signature>``, the
+    key id selects the secret used for the signature, so that secrets can
+    be rotated via :setting:`SESSION_COOKIE_KEYS`. Cookies signed with an
+    old key are signed again with the current one.
+
+    A cookie can't be deleted from the client, :meth:`revoke_user` records
+    the revocation time in the :attr:`.Application.cache_server`, as the
+    :class:`.TokenBackend` does, and the user of sessions issued before it
+    is not loaded.
+    '''
+    _config = [
+        Parameter('SESSION_COOKIE_KEYS', [],
+                  'List of (key id, secret) pairs for signing session '
+                  'cookies. The first pair signs new cookies, the others '
+                  'verify cookies signed before a key rotation. If empty, '
+                  'the SECRET_KEY is used'),
+        Parameter('SESSION_COOKIE_MAX_SIZE', 4000,
+                  'Maximum size in bytes of a session cookie, older messages '
+                  'are dropped from sessions which exceed it'),
+        Parameter('SESSION_COOKIE_COMPRESS', 200,
+                  'Minimum size in bytes of session data compressed with '
+                  'zlib, 0 for no compression')
+    ]
+
+    def on_config(self, app):
+        cfg = app.config
+        self.secret_key = cfg['SECRET_KEY'].encode()
+        keys = cfg['SESSION_COOKIE_KEYS'] or [('0', cfg['SECRET_KEY'])]
+        self.keys = [(str(kid), secret.encode() if isinstance(secret, str)
+                      else secret) for kid, secret in keys]
+        self.verify_keys = dict(self.keys)
+        self.max_size = cfg['SESSION_COOKIE_MAX_SIZE']
+        self.compress = cfg['SESSION_COOKIE_COMPRESS']
+
+    def get_session(self, key):
+        '''Decode the session from the cookie value ``key``, ``None`` if the
+        signature is not valid or the session has expired
+        '''
+        try:
+            kid, fmt, payload, signature = key.split('.')
+        except ValueError:
+            return
+        secret = self.verify_keys.get(kid)
+        if not secret:
+            return
+        expected = self.signature(secret, '%s.%s.%s' % (kid, fmt, payload))
+        if not hmac.compare_digest(expected.encode('utf-8'),
+                                   signature.encode('utf-8')):
+            return
+        try:
+            data = b64decode(payload)
+            if fmt == 'z':
+                data = zlib.decompress(data)
+            data = json.loads(data.decode('utf-8'))
+        except Exception:
+            return
+        expiry = data.get('e', 0)
+        if expiry < time.time():
+            return
+        session = CookieSession(data.get('i'), data.get('u'),
+                                datetime.fromtimestamp(expiry),
+                                data.get('m'), data.get('a', 0))
+        session.key_id = kid
+        return session
+
+    def session_key(self, session):
+        return session.id if session else None
+
+    def session_user(self, request, session):
+        if session.user_id is not None and session.user is None:
+            revoked_at = request.app.cache_server.get(
+                user_revoked_key(request.app, session.user_id))
+            if revoked_at is not None and session.issued < revoked_at:
+                return
+            session.user = request.cache.auth_backend.get_user(
+                request, user_id=session.user_id)
+        return session.user
+
+    def session_create(self, request, user=None, expiry=None):
+        if not expiry:
+            expiry = datetime.now() + timedelta(
+                seconds=request.config['SESSION_EXPIRY'])
+        session = CookieSession(user_id=user.id if user else None,
+                                expiry=expiry)
+        session.user = user
+        return session
+
+    def session_save(self, session):
+        '''Sessions are saved in the cookie by :meth:`response`'''
+        pass
+
+    def revoke_user(self, request, user):
+        '''Reject sessions issued to ``user`` so far
+        '''
+        request.app.cache_server.set(user_revoked_key(request.app, user),
+                                     time.time(),
+                                     request.config['SESSION_EXPIRY'] or 0)
+
+    def response(self, request, response):
+        '''Set the session cookie when the session has changed or was
+        signed with an old key
+        '''
+        session = request.cache.session
+        if session and response.can_set_cookies():
+            instance = session._session
+            if session._dirty or instance.key_id != self.keys[0][0]:
+                value = self.encode_session(instance)
+                if value:
+                    response.set_cookie(
+                        request.config['SESSION_COOKIE_NAME'], value=value,
+                        httponly=True, expires=instance.expiry)
+                else:
+                    request.app.logger.error(
+                        'Session too large for a cookie')
+        return response
+
+    def encode_session(self, session):
+        '''Signed cookie value of ``session``, ``None`` if it exceeds
+        :setting:`SESSION_COOKIE_MAX_SIZE` without messages
+        '''
+        kid, secret = self.keys[0]
+        data = {'i': session.id,
+                'a': session.issued,
+                'e': int(time.mktime(session.expiry.timetuple()))}
+        if session.user_id is not None:
+            data['u'] = session.user_id
+        messages = list(session.messages)
+        while True:
+            if messages:
+                data['m'] = messages
+            else:
+                data.pop('m', None)
+            payload = json.dumps(data, separators=(',', ':')).encode('utf-8')
+            fmt = 'j'
+            if self.compress and len(payload) >= self.compress:
+                compressed = zlib.compress(payload)
+                if len(compressed) < len(payload):
+                    payload, fmt = compressed, 'z'
+            value = '%s.%s.%s' % (kid, fmt, b64encode(payload))
+            value = '%s.%s' % (value, self.signature(secret, value))
+            if not self.max_size or len(value) <= self.max_size:
+                session.messages = messages
+                session.key_id = kid
+                return value
+            elif not messages:
+                return
+            # drop the oldest message
+            messages.pop(0)
+
+    def signature(self, secret, value):
+        return b64encode(hmac.new(secret, value.encode('utf-8'),
+                                  hashlib.sha256).digest())
+
+
+def b64encode(data):
+    return urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def b64decode(data):
+    return urlsafe_b64decode(data + '=' * (-len(data) % 4))
@@ -1,6 +1,10 @@
 import time
 import json
-
+import atexit
+import asyncio
+import logging
+from threading import Lock
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
 from pulsar import PermissionDenied, Http404
@@ -9,15 +13,166 @@ from pulsar.utils.importer import module_attribute
 
 import lux
 from lux import Parameter, Router
+from lux.core.wrappers import wsgi_request
 from lux.forms import Form
 from lux.utils.crypt import get_random_string, digest
 
+from ..user import Anonymous, AuthenticationError
 from .token import jwt
 from .browser import BrowserBackend
 
 
 REASON_BAD_TOKEN = "CSRF token missing or incorrect"
 
+logger = logging.getLogger('lux.sessions')
+
+
+class LazySession:
+    '''The session of a request, created on first write.
+
+    Attributes and methods of the session are available from this object.
+    Reading the ``user`` or the messages of a request without a session
+    does not create one, while setting attributes or storing messages
+    creates the session via :meth:`SessionBackend.session_create` and
+    marks it as dirty. Only dirty sessions are saved by
+    :meth:`SessionBackend.response`, sessions created during the request
+    are flagged as new.
+
+    A :class:`LazySession` is ``False`` until the session exists.
+    '''
+    writes = frozenset(('message', 'success', 'info', 'warning', 'error',
+                        'remove_message'))
+    empty = {'user': None,
+             'expiry': None,
+             'get_messages': lambda: ()}
+
+    def __init__(self, backend, request, session=None, dirty=False):
+        self.__dict__.update(_backend=backend, _request=request,
+                             _session=session, _dirty=dirty, _new=False)
+
+    def __repr__(self):
+        return 'LazySession(%r)' % self._session
+
+    def __bool__(self):
+        return self._session is not None
+
+    def __getattr__(self, name):
+        session = self._session
+        if session is None:
+            if name in self.empty:
+                return self.empty[name]
+            session = self._load()
+        if name in self.writes:
+            self.__dict__['_dirty'] = True
+        return getattr(session, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+        self.__dict__['_dirty'] = True
+
+    def _load(self):
+        '''The session, created if not available yet'''
+        session = self._session
+        if session is None:
+            session = self._backend.session_create(self._request)
+            self.__dict__.update(_session=session, _dirty=True, _new=True)
+        return session
+
+
+class SessionWriteBuffer:
+    '''Write-behind buffer of dirty sessions.
+
+    Sessions added to the buffer are saved in batches, via
+    :meth:`SessionBackend.session_save_many`, ``interval`` seconds after
+    the first one was added or as soon as ``max_size`` sessions are
+    buffered. Repeated updates of a session are coalesced into one write.
+    Batches are saved in the executor of the event loop, a batch which
+    fails is buffered again and retried after ``interval`` seconds. The
+    buffer is flushed when the process exits.
+    '''
+    def __init__(self, backend, interval, max_size=100):
+        self.backend = backend
+        self.interval = interval
+        self.max_size = max_size
+        self.writes = 0
+        self.batches = 0
+        self._sessions = OrderedDict()
+        self._flushing = {}
+        self._scheduled = False
+        self._loop = None
+        self._lock = Lock()
+        atexit.register(self.flush)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, key):
+        '''A buffered session from its ``key``, ``None`` if not buffered'''
+        with self._lock:
+            session = self._sessions.get(key)
+            return self._flushing.get(key) if session is None else session
+
+    def add(self, session):
+        '''Buffer a dirty ``session``'''
+        key = self.backend.session_key(session)
+        with self._lock:
+            self._sessions[key] = session
+            self.writes += 1
+            full = len(self._sessions) >= self.max_size
+            schedule = not (full or self._scheduled)
+            self._scheduled = self._scheduled or schedule
+        if full:
+            self.schedule(0)
+        elif schedule:
+            self.schedule(self.interval)
+
+    def schedule(self, delay):
+        '''Flush the buffer in the executor of the event loop after
+        ``delay`` seconds. It can be called from any thread.
+        '''
+        loop = self._loop
+        if loop is None:
+            loop = self._loop = asyncio.get_event_loop()
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(loop.call_later, delay,
+                                      loop.run_in_executor, None, self.flush)
+
+    def flush(self):
+        '''Save all buffered sessions and return the number of sessions
+        saved
+        '''
+        with self._lock:
+            sessions = self._sessions
+            self._sessions = OrderedDict()
+            self._flushing.update(sessions)
+            self._scheduled = False
+        if not sessions:
+            return 0
+        try:
+            self.backend.session_save_many(list(sessions.values()))
+        except Exception:
+            logger.exception('Could not save %d sessions', len(sessions))
+            with self._lock:
+                # put back sessions not updated in the meantime
+                for key, session in sessions.items():
+                    self._sessions.setdefault(key, session)
+                schedule = not self._scheduled
+                self._scheduled = True
+            if schedule:
+                self.schedule(self.interval)
+            return 0
+        finally:
+            with self._lock:
+                for key in sessions:
+                    self._flushing.pop(key, None)
+        self.batches += 1
+        return len(sessions)
+
+    def tojson(self):
+        return {'buffered': len(self),
+                'writes': self.writes,
+                'batches': self.batches}
+
 
 class SessionBackend(BrowserBackend):
     '''Mixin for :class:`.AuthBackend` via sessions.
@@ -28,8 +183,15 @@ class SessionBackend(BrowserBackend):
         Parameter('CSRF_EXPIRY', 60*60,
                   'Cross Site Request Forgery token expiry in seconds.'),
         Parameter('CSRF_PARAM', 'authenticity_token',
-                  'CSRF parameter name in forms')
+                  'CSRF parameter name in forms'),
+        Parameter('SESSION_WRITE_BEHIND', 0,
+                  'If positive, changed sessions are buffered for this '
+                  'number of seconds and saved in batches'),
+        Parameter('SESSION_WRITE_BATCH', 100,
+                  'Maximum number of sessions in the write-behind buffer '
+                  'before they are saved')
     ]
+    _write_buffer = None
 
     ForgotPasswordRouter = None
     dismiss_message = None
@@ -75,6 +237,18 @@ class SessionBackend(BrowserBackend):
     def session_save(self, session):
         raise NotImplementedError
 
+    def session_user(self, request, session):
+        '''The user of ``session``, ``None`` for anonymous sessions
+        '''
+        return session.user
+
+    def session_save_many(self, sessions):
+        '''Save several ``sessions`` at once. Backends should override
+        this method with a single multi-row statement.
+        '''
+        for session in sessions:
+            self.session_save(session)
+
     def session_create(self, request, user=None, expiry=None):
         '''Create a new session
         '''
@@ -103,39 +277,88 @@ class SessionBackend(BrowserBackend):
 
     # MIDDLEWARE
     def request(self, request):
-        key = self.config['SESSION_COOKIE_NAME']
+        '''Load the session from the session cookie.
+
+        Requests without a valid cookie do not access the session store,
+        the session is created on first write, see :class:`LazySession`.
+        '''
+        key = request.config['SESSION_COOKIE_NAME']
         session_key = request.cookies.get(key)
         session = None
         if session_key:
-            session = self.get_session(session_key.value)
-        if not session:
-            session = self.session_create(request)
-        request.cache.session = session
-        if session.user:
-            request.cache.user = session.user
+            buffer = self.write_buffer(request.app)
+            if buffer:
+                session = buffer.get(session_key.value)
+            if session is None:
+                session = self.get_session(session_key.value)
+        request.cache.session = LazySession(self, request, session)
+        user = self.session_user(request, session) if session else None
+        if user:
+            request.cache.user = user
         if not request.cache.user:
             request.cache.user = self.anonymous()
 
     def response(self, request, response):
+        '''Set the session cookie and save the session when it has
+        changed during the request.
+
+        With :setting:`SESSION_WRITE_BEHIND` updates of existing sessions
+        are added to the :meth:`write_buffer`. New sessions are saved
+        immediately, so that the following requests find them, and when the
+        user has logged in or out the buffer is flushed first.
+        '''
         session = request.cache.session
         if session:
+            instance = session._session
             if response.can_set_cookies():
                 key = request.app.config['SESSION_COOKIE_NAME']
                 session_key = request.cookies.get(key)
-                id = self.session_key(session)
+                id = self.session_key(instance)
                 if not session_key or session_key.value != id:
                     response.set_cookie(key, value=str(id), httponly=True,
-                                        expires=session.expiry)
-
-            self.session_save(session)
+                                        expires=instance.expiry)
+
+            if session._dirty:
+                buffer = self.write_buffer(request.app)
+                if not buffer:
+                    self.session_save(instance)
+                elif request.cache.session_flush:
+                    buffer.flush()
+                    self.session_save(instance)
+                elif session._new:
+                    self.session_save(instance)
+                else:
+                    buffer.add(instance)
         return response
 
+    def write_buffer(self, app):
+        '''The :class:`SessionWriteBuffer` of this backend, ``False`` if
+        :setting:`SESSION_WRITE_BEHIND` is 0
+        '''
+        if self._write_buffer is None:
+            cfg = app.config
+            interval = cfg['SESSION_WRITE_BEHIND']
+            self._write_buffer = (
+                SessionWriteBuffer(self, interval, cfg['SESSION_WRITE_BATCH'])
+                if interval else False)
+        return self._write_buffer
+
+    def response_middleware(self, app):
+        return [self._response]
+
+    def anonymous(self):
+        return Anonymous()
+
     # CSRF
     def csrf_token(self, request):
         session = request.cache.session
-        if session:
+        if session is not None:
             assert self.jwt, 'Requires jwt package'
-            return self.jwt.encode({'session': self.session_key(session),
+            # the token is specific to the session, the response must not
+            # be shared
+            request.response['Cache-Control'] = 'private'
+            return self.jwt.encode({'session':
+                                    self.session_key(session._load()),
                                     'exp': time.time() + self.csrf_expiry},
                                    self.secret_key)
 
@@ -150,7 +373,9 @@ class SessionBackend(BrowserBackend):
         except Exception:
             raise PermissionDenied(REASON_BAD_TOKEN)
         else:
-            if token['session'] != self.session_key(request.cache.session):
+            session = request.cache.session
+            if (not session or
+                    token['session'] != self.session_key(session._session)):
                 raise PermissionDenied(REASON_BAD_TOKEN)
 
     def password_recovery(self, request, email):
@@ -174,7 +399,9 @@ class SessionBackend(BrowserBackend):
                 raise AuthenticationError('Invalid username or password')
         if not user.is_active():
             return self.inactive_user_login(request, user)
-        request.cache.session = self.session_create(request, user)
+        request.cache.session = LazySession(
+            self, request, self.session_create(request, user), True)
+        request.cache.session_flush = True
         request.cache.user = user
         return user
 
@@ -195,7 +422,9 @@ class SessionBackend(BrowserBackend):
         session = request.cache.session
         user = user or request.cache.user
         if user and user.is_authenticated():
-            request.cache.session = self.session_create(request)
+            request.cache.session = LazySession(
+                self, request, self.session_create(request), True)
+            request.cache.session_flush = True
             request.cache.user = self.anonymous()
 
     def get_or_create_registration(self, request, user, **kw):
@@ -238,12 +467,16 @@ class SessionBackend(BrowserBackend):
         request.cache.session.info(message)
 
     # INTERNALS
+    def _response(self, environ, response):
+        return self.response(wsgi_request(environ), response)
+
     def _dismiss_message(self, request):
         response = request.response
         if response.content_type in lux.JSON_CONTENT_TYPES:
             session = request.cache.session
             form = Form(request, data=request.body_data())
             data = form.rawdata['message']
-            body = {'success': session.remove_message(data)}
+            body = {'success': bool(session) and
+                    session.remove_message(data)}
             response.content = json.dumps(body)
             return response
@@ -1,9 +1,10 @@
 import time
+from hashlib import md5
 
 from pulsar import HttpException, MethodNotAllowed, ImproperlyConfigured
 from pulsar.apps.wsgi import Json
 
-from lux import Parameter
+from lux import Parameter, MemoryCache
 from ..views import RestRouter, AuthenticationError
 
 try:
@@ -15,6 +16,14 @@ from .. import AuthBackend
 from ..forms import LoginForm
 
 
+def user_revoked_key(app, user):
+    '''Cache key of the time the credentials issued to ``user``, a user or
+    a user id, were revoked
+    '''
+    return 'lux:user-revoked:%s:%s' % (app.config_module,
+                                       getattr(user, 'id', user))
+
+
 class Http401(HttpException):
 
     def __init__(self, auth, msg=''):
@@ -27,6 +36,17 @@ class TokenBackend(AuthBackend):
 
     Requires pyjwt_ package.
 
+    Verified claims are kept, until they expire, in a least recently used
+    cache of :setting:`JWT_CACHE_SIZE` tokens so that requests with a
+    token already seen skip the signature verification. Tokens are revoked
+    via :meth:`revoke_token` and :meth:`revoke_user`.
+
+    Revocations are stored in the :attr:`.Application.cache_server` and
+    they are best-effort: with the default ``memory://`` cache they only
+    apply to the process which revoked the token and they are lost when
+    evicted. Use a cache server shared by all processes, with enough
+    entries, when revocation must be enforced.
+
     .. _pyjwt: https://pypi.python.org/pypi/PyJWT
     .. _JWT: http://self-issued.info/docs/draft-ietf-oauth-json-web-token.html
     '''
@@ -34,7 +54,11 @@ class TokenBackend(AuthBackend):
         Parameter('AUTHORIZATION_URL', '/authorizations',
                   'Url for authorizations',
                   True),
+        Parameter('JWT_CACHE_SIZE', 1000,
+                  'Maximum number of verified JSON Web Tokens kept in '
+                  'memory, 0 disables the cache'),
     ]
+    _token_cache = None
 
     def on_config(self, app):
         if not jwt:
@@ -54,20 +78,105 @@ class TokenBackend(AuthBackend):
             auth_type, key = auth.split(None, 1)
             auth_type = auth_type.lower()
             if auth_type == 'bearer':
-                try:
-                    data = jwt.decode(key, self.secret_key)
-                except jwt.ExpiredSignature:
-                    request.app.logger.info('JWT token has expired')
-                    # In this case we want the client to perform
-                    # a new authentication. Raise 401
-                    raise Http401('Token')
-                except Exception:
-                    request.app.logger.exception('Could not load user')
-                else:
+                data = self.token_claims(request, key)
+                if data:
                     user = self.get_user(request, **data)
                     if user:
                         request.cache.user = user
 
+    def token_claims(self, request, token):
+        '''The verified claims of a JWT ``token`` or ``None`` if the token
+        is not valid or it was revoked
+        '''
+        cache = self.token_cache(request.app)
+        data = cache.get(token) if cache else None
+        if data is None:
+            try:
+                data = jwt.decode(token, self.secret_key)
+            except jwt.ExpiredSignature:
+                request.app.logger.info('JWT token has expired')
+                # In this case we want the client to perform
+                # a new authentication. Raise 401
+                raise Http401('Token')
+            except Exception:
+                request.app.logger.exception('Could not load user')
+                return
+            if cache:
+                timeout = self.token_timeout(data)
+                if timeout is None or timeout > 0:
+                    cache.set(token, data, timeout)
+        if not self.revoked(request, token, data):
+            return data
+
+    def token_cache(self, app):
+        '''The :class:`.MemoryCache` of verified claims, ``False`` if
+        :setting:`JWT_CACHE_SIZE` is 0
+        '''
+        if self._token_cache is None:
+            size = app.config['JWT_CACHE_SIZE']
+            self._token_cache = (MemoryCache(app, 'jwt', max_entries=size)
+                                 if size else False)
+        return self._token_cache
+
+    def token_timeout(self, data):
+        exp = data.get('exp')
+        if exp:
+            return exp - time.time()
+
+    def logout(self, request, user=None):
+        '''Revoke the bearer token of ``request``, if any
+        '''
+        auth = request.get('HTTP_AUTHORIZATION')
+        if auth:
+            bits = auth.split(None, 1)
+            if len(bits) == 2 and bits[0].lower() == 'bearer':
+                self.revoke_token(request, bits[1])
+
+    def revoke_token(self, request, token):
+        '''Revoke a JWT ``token`` until it expires
+        '''
+        cache = self.token_cache(request.app)
+        if cache:
+            cache.delete(token)
+        try:
+            data = jwt.decode(token, self.secret_key)
+        except Exception:
+            return
+        timeout = self.token_timeout(data)
+        if timeout is None or timeout > 0:
+            request.app.cache_server.set(self.revoked_key(request, token),
+                                         True, timeout or 0)
+
+    def revoke_user(self, request, user):
+        '''Revoke all tokens issued to ``user`` so far, for example when
+        the user changes password. Tokens issued before the revocation time,
+        compared with the sub-second ``iat`` claim, are rejected
+        '''
+        expiry = request.config['SESSION_EXPIRY'] or 0
+        request.app.cache_server.set(self.revoked_key(request, user=user),
+                                     time.time(), expiry)
+
+    def revoked(self, request, token, data):
+        '''Check if ``token``, with claims ``data``, was revoked
+        '''
+        cache = request.app.cache_server
+        if cache.get(self.revoked_key(request, token)):
+            return True
+        user_id = data.get('user_id')
+        if user_id is not None:
+            revoked_at = cache.get(self.revoked_key(request, user=user_id))
+            if revoked_at is not None:
+                return data.get('iat', 0) < revoked_at
+        return False
+
+    def revoked_key(self, request, token=None, user=None):
+        if token is not None:
+            if isinstance(token, str):
+                token = token.encode('utf-8')
+            return 'lux:jwt-revoked:%s:%s' % (request.app.config_module,
+                                              md5(token).hexdigest())
+        return user_revoked_key(request.app, user)
+
     def response(self, environ, response):
         name = 'Access-Control-Allow-Origin'
         if name not in response.headers:
@@ -96,12 +205,13 @@ class TokenBackend(AuthBackend):
         '''Create the token
         '''
         payload = self.jwt_payload(request, user)
-        return self.encode_payload(self.jwt_payload(request, user))
+        return self.encode_payload(request, payload)
 
     def jwt_payload(self, request, user):
         expiry = self.session_expiry(request)
         payload = {'user_id': user.id,
-                   'superuser': user.is_superuser()}
+                   'superuser': user.is_superuser(),
+                   'iat': time.time()}
         if expiry:
             payload['exp'] = int(time.mktime(expiry.timetuple()))
         return payload
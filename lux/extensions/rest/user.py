@@ -175,7 +175,7 @@ class PasswordMixin:
         else:
             return UNUSABLE_PASSWORD
 
-    def set_password(self, user, password):
+    def set_password(self, request, user, password):
         '''Set the password for ``user``.
         This method should commit changes.'''
         pass
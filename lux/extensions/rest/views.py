@@ -259,7 +259,7 @@ class ForgotPassword(WebFormRouter):
                 if form.is_valid():
                     auth = request.cache.auth_backend
                     password = form.cleaned_data['password']
-                    auth.set_password(user, password)
+                    auth.set_password(request, user, password)
                     session.info('Password successfully changed')
                     auth.auth_key_used(key)
                 else:
@@ -333,5 +333,5 @@ def change_password(request, form_class):
     if form.is_valid():
         auth = request.cache.auth_backend
         password = form.cleaned_data['password']
-        auth.set_password(user, password)
+        auth.set_password(request, user, password)
     return form
@@ -42,12 +42,13 @@ import shutil
 from datetime import datetime
 
 from pulsar import ImproperlyConfigured
-from pulsar.apps.wsgi import FileRouter, WsgiHandler, MediaRouter
+from pulsar.apps.wsgi import FileRouter, WsgiHandler
 from pulsar.utils.httpurl import urlparse
 from pulsar.utils.slugify import slugify
 
 import lux
-from lux import Parameter, Router
+from lux import Parameter
+from lux.extensions.base.media import MediaRouter, compress_directory
 
 from .builder import Builder, DirBuilder, ContextBuilder, DirContent
 from .contents import Content, Article
@@ -126,8 +127,10 @@ class Extension(lux.Extension):
             file404 = os.path.join(path, '404.html')
             if not os.path.isfile(file404):
                 file404 = None
-            media = MediaRouter('', path, default_suffix='html',
-                                raise_404=(not file404))
+            media = MediaRouter(
+                '', path, default_suffix='html', raise_404=(not file404),
+                lux=False,
+                precompressed=app.config.get('MEDIA_PRECOMPRESSED', False))
             middleware.append(media)
             if file404:
                 middleware.append(FileRouter('<path:path>',
@@ -150,20 +153,14 @@ class Extension(lux.Extension):
                 middleware.build(app, location)
         #
         self.copy_redirects(app, location)
+        #
+        if config.get('MEDIA_PRECOMPRESSED'):
+            compress_directory(location)
 
-    def on_html_document(self, app, request, doc):
-        '''Add api Urls
+    def on_html_prototype(self, app, doc):
+        '''Add build information
         '''
-        app = request.app
-        jscontext = doc.jscontext
-        jscontext.update(self.build_info(app))
-        return
-        if request.config['STATIC_API']:
-            apiUrls = jscontext.get('apiUrls', {})
-            for middleware in app.handler.middleware:
-                if isinstance(middleware, Router):
-                    middleware.add_api_urls(request, apiUrls)
-            jscontext['apiUrls'] = apiUrls
+        doc.jscontext.update(self.build_info(app))
 
     def context(self, request, context):
         if request.cache.building_static:
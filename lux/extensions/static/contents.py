@@ -15,6 +15,7 @@ from pulsar.utils.pep import to_string
 from pulsar.apps.wsgi import Links
 
 from lux import JSON_CONTENT_TYPES
+from lux.core.engines import compile_template
 from lux.utils import iso8601
 from lux.extensions.ui import CssLibraries
 
@@ -113,6 +114,7 @@ class Content(object):
     template = None
     template_engine = None
     _json_dict = None
+    _compiled = None
     _loc = None
     '''Template engine to render this content. Overwritten my metadata.
     If not available, the application default engine is used'''
@@ -269,14 +271,17 @@ class Content(object):
         '''
         if self.is_html:
             context = self.context(context)
-            content = self._engine(self._content, context)
+            if self._compiled is None:
+                self._compiled = compile_template(
+                    self._engine, self._content, name=self._src,
+                    loader=self._app.template_loader)
+            content = self._compiled(context)
             if self.template:
-                template = self._app.template_full_path(self.template)
+                loader = self._app.template_loader
+                template = loader.full_path(self.template)
                 if template:
                     context[self.key('main')] = content
-                    with open(template, 'r') as file:
-                        template_str = file.read()
-                    raw = self._engine(template_str, context)
+                    raw = loader.get(self.template, self._engine)(context)
                     reader = get_reader(self._app, template)
                     ct = reader.process(raw, template)
                     content = ct._content
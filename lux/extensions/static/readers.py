@@ -2,6 +2,7 @@ import os
 import imp
 import mimetypes
 from itertools import chain
+from importlib.util import find_spec
 
 from pulsar.apps.wsgi import AsyncString
 
@@ -9,9 +10,16 @@ from .contents import (Content, METADATA_PROCESSORS, slugify, is_html,
                        SkipBuild, register_reader)
 from .urlwrappers import MultiValue
 
-try:
-    from markdown import Markdown
-except ImportError:
+if find_spec('markdown'):
+    def Markdown(**params):
+        '''Create a :class:`markdown.Markdown` instance.
+
+        The markdown package is imported the first time a Markdown
+        instance is needed rather than when the static extension is loaded.
+        '''
+        from markdown import Markdown
+        return Markdown(**params)
+else:
     Markdown = False
 
 Restructured = False
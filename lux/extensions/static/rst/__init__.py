@@ -7,10 +7,6 @@ from pulsar import ImproperlyConfigured
 
 from ..routers import JsonContent, JsonFile, HtmlContent, HtmlFile, normpath
 from ..contents import Content
-try:
-    from .builder import LuxSphinx
-except ImportError:
-    LuxSphinx = None
 
 
 class SphinxContent(Content):
@@ -58,7 +54,10 @@ class SphinxMixin(object):
         self.write(app, request, location, response)
 
     def build_sphinx(self, app, location):
-        if not LuxSphinx:
+        # sphinx is imported only when needed, it is slow to import
+        try:
+            from .builder import LuxSphinx
+        except ImportError:
             raise ImproperlyConfigured('Sphinx not installed')
         path = self.html_router.path()[1:]
         if path:
@@ -91,7 +91,7 @@ class Extension(lux.Extension):
         Parameter('NAVBAR_COLLAPSE_WIDTH', 768,
                   'Width when to collapse the navbar')]
 
-    def on_html_document(self, app, request, doc):
+    def on_html_prototype(self, app, doc):
         navbar = doc.jscontext.get('navbar') or {}
         navbar['collapseWidth'] = app.config['NAVBAR_COLLAPSE_WIDTH']
         doc.jscontext['navbar'] = navbar
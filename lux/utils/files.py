@@ -1,8 +1,33 @@
 import os
+import stat
+import tempfile
 import itertools
 
 
-__all__ = ['File', 'Filehandler', 'Disk']
+__all__ = ['File', 'Filehandler', 'Disk', 'private_directory']
+
+
+def private_directory(name, base=None):
+    '''Directory of the current user for ``name`` in ``base``, the system
+    temporary directory by default.
+
+    The directory is created with mode ``0o700`` if it does not exist.
+    Raise ``PermissionError`` if it exists but it is not a directory owned
+    by the current user or it is accessible by other users.
+    '''
+    getuid = getattr(os, 'getuid', None)
+    if getuid:
+        name = '%s-%s' % (name, getuid())
+    path = os.path.join(base or tempfile.gettempdir(), name)
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    st = os.lstat(path)
+    if (not stat.S_ISDIR(st.st_mode) or st.st_mode & 0o077 or
+            (getuid and st.st_uid != getuid())):
+        raise PermissionError('%s is not a private directory' % path)
+    return path
 
 
 class File(object):
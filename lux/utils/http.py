@@ -1,5 +1,7 @@
 import time
+from hashlib import md5
 
+from pulsar import chain_future
 from pulsar.utils.httpurl import urlparse
 
 
@@ -15,6 +17,76 @@ def same_origin(url1, url2):
         return False
 
 
+def weak_etag(version):
+    '''A weak ETag from a content ``version``, any object with a string
+    representation which changes when the content changes
+    '''
+    return 'W/"%s"' % md5(str(version).encode('utf-8')).hexdigest()
+
+
+def etag_match(if_none_match, etag):
+    '''Check if ``etag`` matches the value of an ``If-None-Match`` header.
+
+    The weak comparison is used, as required for ``If-None-Match``.
+    '''
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    etag = etag[2:] if etag.startswith('W/') else etag
+    for value in if_none_match.split(','):
+        value = value.strip()
+        if value.startswith('W/'):
+            value = value[2:]
+        if value == etag:
+            return True
+    return False
+
+
+def accept_encodings(accept_encoding):
+    '''Set of content codings accepted by the client, from the value of
+    an ``Accept-Encoding`` header. Codings with ``q=0`` are excluded.
+    '''
+    encodings = set()
+    for value in (accept_encoding or '').split(','):
+        bits = value.split(';')
+        coding = bits[0].strip().lower()
+        if not coding:
+            continue
+        for param in bits[1:]:
+            name, _, q = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    if float(q) <= 0:
+                        break
+                except ValueError:
+                    break
+        else:
+            encodings.add(coding)
+    return encodings
+
+
+class StreamChunk:
+    '''A chunk of a streamed response which is available once ``future``
+    is done.
+
+    Pulsar encodes the chunks of streamed responses before writing them,
+    :meth:`encode` returns a future which results in the encoded chunk.
+    '''
+    __slots__ = ('future',)
+
+    def __init__(self, future):
+        self.future = future
+
+    def encode(self, encoding):
+        return chain_future(self.future,
+                            callback=lambda data: encode_chunk(data, encoding))
+
+
+def encode_chunk(data, encoding='utf-8'):
+    return data if isinstance(data, bytes) else data.encode(encoding)
+
+
 class RateLimit(object):
     '''A Rate Limit decorator
     '''
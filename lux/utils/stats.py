@@ -0,0 +1,160 @@
+'''Lightweight latency statistics.
+
+Latencies are collected in a fixed number of logarithmic buckets so that
+memory usage does not grow with the number of samples.
+'''
+from bisect import bisect_left
+from collections import deque
+from functools import wraps
+from timeit import default_timer
+
+
+__all__ = ['LatencyStats', 'RollingStats', 'Stats', 'timed']
+
+
+# bucket upper bounds in seconds, from 10 microseconds to about 42 seconds
+BUCKETS = tuple(0.00001 * 2 ** n for n in range(23))
+PERCENTILES = (50, 90, 99)
+
+
+class LatencyStats:
+    '''Number of calls, cumulative time and latency distribution
+    '''
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.reset()
+
+    def __repr__(self):
+        return 'LatencyStats(count=%d, total=%.6f)' % (self.count, self.total)
+    __str__ = __repr__
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, elapsed):
+        '''Add a sample, ``elapsed`` time is in seconds
+        '''
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        self.buckets[bisect_left(BUCKETS, elapsed)] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        for index, count in enumerate(other.buckets):
+            self.buckets[index] += count
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p):
+        '''Upper bound of the latency (in seconds) below which ``p`` percent
+        of samples fall.
+        '''
+        if not self.count:
+            return 0.0
+        target = self.count * p / 100.0
+        cumulative = 0
+        for index, count in enumerate(self.buckets):
+            cumulative += count
+            if cumulative >= target:
+                return (min(BUCKETS[index], self.max)
+                        if index < len(BUCKETS) else self.max)
+        return self.max
+
+    def tojson(self):
+        data = {'count': self.count,
+                'total': self.total,
+                'mean': self.mean,
+                'max': self.max}
+        for p in PERCENTILES:
+            data['p%s' % p] = self.percentile(p)
+        return data
+
+
+class RollingStats:
+    ''':class:`.LatencyStats` over a rolling time window.
+
+    The window is made of ``windows`` slots of ``interval`` seconds each,
+    samples older than the window are discarded.
+    '''
+    __slots__ = ('interval', 'slots', '_start')
+
+    def __init__(self, interval=60, windows=10):
+        self.interval = interval
+        self.slots = deque(maxlen=windows)
+        self._start = None
+
+    def __repr__(self):
+        return repr(self.merged())
+    __str__ = __repr__
+
+    def reset(self):
+        self.slots.clear()
+        self._start = None
+
+    def add(self, elapsed):
+        self._rotate()
+        self.slots[-1].add(elapsed)
+
+    def merged(self):
+        '''A :class:`.LatencyStats` with all samples in the window
+        '''
+        self._rotate()
+        stats = LatencyStats()
+        for slot in self.slots:
+            stats.merge(slot)
+        return stats
+
+    def tojson(self):
+        return self.merged().tojson()
+
+    def _rotate(self):
+        now = default_timer()
+        if self._start is None:
+            self.slots.append(LatencyStats())
+            self._start = now
+        else:
+            elapsed = int((now - self._start) // self.interval)
+            if elapsed:
+                for _ in range(min(elapsed, self.slots.maxlen)):
+                    self.slots.append(LatencyStats())
+                self._start += elapsed * self.interval
+
+
+class Stats(dict):
+    '''A dictionary of :class:`.LatencyStats` by name
+    '''
+    def __missing__(self, name):
+        self[name] = stats = LatencyStats()
+        return stats
+
+    def reset(self):
+        for stats in self.values():
+            stats.reset()
+
+    def tojson(self):
+        return dict(((name, stats.tojson()) for name, stats in self.items()))
+
+
+def timed(stats, callable):
+    '''Wrap ``callable`` so that the latency of each call is added to
+    ``stats``, a :class:`.LatencyStats`.
+    '''
+    @wraps(callable)
+    def _(*args, **kwargs):
+        start = default_timer()
+        try:
+            return callable(*args, **kwargs)
+        finally:
+            stats.add(default_timer() - start)
+
+    return _
@@ -0,0 +1,187 @@
+from lux.utils import test
+from lux.extensions.rest import PasswordMixin, UserMixin, backends
+
+
+class User(UserMixin):
+
+    def __init__(self, id):
+        self.id = id
+
+    def is_active(self):
+        return True
+
+
+class Session:
+
+    def __init__(self, id, user=None, expiry=None):
+        self.id = id
+        self.user = user
+        self.expiry = expiry
+        self.messages = []
+
+    def message(self, level, message):
+        self.messages.append((level, message))
+
+    def get_messages(self):
+        return self.messages
+
+
+class MemorySessionBackend(PasswordMixin, backends.SessionBackend):
+    '''Session backend storing sessions in a dictionary'''
+    def on_config(self, app):
+        super().on_config(app)
+        self.sessions = {}
+        self.saved = []
+
+    def get_session(self, key):
+        return self.sessions.get(key)
+
+    def session_key(self, session):
+        return session.id if session else None
+
+    def session_save(self, session):
+        self.saved.append(session.id)
+
+    def session_create(self, request, user=None, expiry=None):
+        session = Session(str(len(self.sessions) + 1), user, expiry)
+        self.sessions[session.id] = session
+        return session
+
+
+class TestSessions(test.TestCase):
+    config_file = 'tests.auth'
+    config_params = {
+        'DATASTORE': 'sqlite://',
+        'AUTHENTICATION_BACKENDS': ['tests.auth.session.MemorySessionBackend']}
+
+    def request(self, app, cookie=None):
+        extra = {'HTTP_COOKIE': 'LUX=%s' % cookie} if cookie else {}
+        request = app.wsgi_request(extra=extra)
+        app.auth_backend.request(request)
+        return request
+
+    def test_lazy_session(self):
+        app = self.application()
+        backend = app.auth_backend.backends[0]
+        # anonymous requests do not create sessions
+        request = self.request(app)
+        session = request.cache.session
+        self.assertFalse(session)
+        self.assertEqual(session.user, None)
+        self.assertEqual(session.get_messages(), ())
+        response = backend.response(request, request.response)
+        self.assertFalse(backend.sessions)
+        self.assertFalse(response.cookies)
+        # a message creates the session
+        request = self.request(app)
+        request.cache.session.info('Hello')
+        backend.response(request, request.response)
+        self.assertEqual(list(backend.sessions), ['1'])
+        self.assertEqual(backend.saved, ['1'])
+        self.assertTrue(request.response.cookies)
+        # the session is saved only when changed
+        request = self.request(app, '1')
+        self.assertTrue(request.cache.session)
+        backend.response(request, request.response)
+        self.assertEqual(backend.saved, ['1'])
+        # login creates a new session
+        request = self.request(app, '1')
+        backend.login(request, User(1))
+        backend.response(request, request.response)
+        self.assertEqual(backend.saved, ['1', '2'])
+        request = self.request(app, '2')
+        self.assertEqual(request.cache.user.id, 1)
+
+    def test_csrf_context(self):
+        app = self.application()
+        request = self.request(app)
+        context = app.context(request)
+        # the token is created when a template uses it
+        self.assertFalse(request.cache.session)
+        self.assertEqual(context['csrf_param'], 'authenticity_token')
+        self.assertTrue(context['csrf_token'])
+        self.assertTrue(request.cache.session)
+
+    def test_write_behind(self):
+        app = self.application(SESSION_WRITE_BEHIND=60)
+        backend = app.auth_backend.backends[0]
+        buffer = backend.write_buffer(app)
+        # new sessions are saved straight away
+        request = self.request(app)
+        request.cache.session.info('Hello')
+        backend.response(request, request.response)
+        self.assertEqual(backend.saved, ['1'])
+        self.assertEqual(len(buffer), 0)
+        for message in ('World', 'Again'):
+            request = self.request(app, '1')
+            request.cache.session.info(message)
+            backend.response(request, request.response)
+        # updates are coalesced and not saved yet
+        self.assertEqual(len(buffer), 1)
+        self.assertEqual(buffer.writes, 2)
+        self.assertEqual(backend.saved, ['1'])
+        self.assertEqual(buffer.get('1').messages,
+                         [('info', 'Hello'), ('info', 'World'),
+                          ('info', 'Again')])
+        # a failed flush keeps the sessions in the buffer
+        save = backend.session_save
+        backend.session_save = None
+        buffer._scheduled = False
+        self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(len(buffer), 1)
+        self.assertTrue(buffer._scheduled)
+        backend.session_save = save
+        # login flushes the buffer
+        request = self.request(app, '1')
+        backend.login(request, User(1))
+        backend.response(request, request.response)
+        self.assertEqual(backend.saved, ['1', '1', '2'])
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(buffer.flush(), 0)
+
+
+class TestCookieSessions(test.TestCase):
+    config_file = 'tests.auth'
+    config_params = {
+        'DATASTORE': 'sqlite://',
+        'AUTHENTICATION_BACKENDS': [
+            'lux.extensions.rest.backends.CookieSessionBackend'],
+        'SESSION_COOKIE_KEYS': [('k2', 'new secret'), ('k1', 'old secret')],
+        'SESSION_COOKIE_MAX_SIZE': 300}
+
+    def test_cookie_session(self):
+        app = self.application()
+        backend = app.auth_backend.backends[0]
+        request = app.wsgi_request()
+        session = backend.session_create(request, User(5))
+        for n in range(20):
+            session.info('message %d' % n)
+        value = backend.encode_session(session)
+        self.assertTrue(value.startswith('k2.'))
+        self.assertTrue(len(value) <= 300)
+        # oldest messages are dropped
+        self.assertTrue(len(session.messages) < 20)
+        self.assertEqual(session.messages[-1]['message'], 'message 19')
+        loaded = backend.get_session(value)
+        self.assertEqual(loaded.id, session.id)
+        self.assertEqual(loaded.user_id, 5)
+        self.assertEqual(loaded.messages, session.messages)
+        # tampered cookies and unknown keys are rejected
+        tampered = value[:-1] + ('B' if value[-1] == 'A' else 'A')
+        self.assertEqual(backend.get_session(tampered), None)
+        self.assertEqual(backend.get_session(value[:-1] + '\xe9'), None)
+        self.assertEqual(backend.get_session('k3' + value[2:]), None)
+        # cookies signed with an old key are signed again
+        backend.keys.reverse()
+        value = backend.encode_session(session)
+        backend.keys.reverse()
+        request = app.wsgi_request(extra={'HTTP_COOKIE': 'LUX=%s' % value})
+        app.auth_backend.request(request)
+        self.assertEqual(request.cache.session.key_id, 'k1')
+        response = backend.response(request, request.response)
+        self.assertTrue(response.cookies['LUX'].value.startswith('k2.'))
+        # sessions issued before the user is revoked are anonymous
+        app.auth_backend.revoke_user(request, User(5))
+        session = backend.get_session(value)
+        self.assertEqual(session.user_id, 5)
+        self.assertEqual(backend.session_user(request, session), None)
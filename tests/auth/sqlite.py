@@ -3,6 +3,7 @@ import json
 from pulsar.apps.test import test_timeout
 
 from lux.utils import test
+from lux.extensions.rest.backends import TokenBackend
 
 
 class TestSqlite(test.AppTestCase):
@@ -14,6 +15,28 @@ class TestSqlite(test.AppTestCase):
         self.assertTrue(backend)
         self.assertTrue(backend.backends)
 
+    def test_backend_methods(self):
+        backend = self.app.auth_backend
+        self.assertEqual(len(backend._backend_methods('get_user')), 1)
+        self.assertEqual(len(backend._backend_methods('has_permission')), 1)
+        self.assertEqual(backend._backend_methods('foo'), ())
+
+    def test_request_memo(self):
+        backend = self.app.auth_backend
+        request = self.app.wsgi_request()
+        user = backend.create_user(request,
+                                   username='memo',
+                                   email='memo@pippo.com',
+                                   password='pluto')
+        user1 = backend.get_user(request, username='memo')
+        self.assertEqual(user1.id, user.id)
+        self.assertEqual(backend.get_user(request, username='memo'), user1)
+        self.assertTrue(request.cache.auth_memo)
+        self.assertEqual(backend.get_user(request, username='xxmemo'), None)
+        self.assertEqual(len(request.cache.auth_memo), 1)
+        backend.login(request, user1)
+        self.assertFalse(request.cache.auth_memo)
+
     def test_get_user_none(self):
         backend = self.app.auth_backend
 
@@ -110,3 +133,100 @@ class TestSqlite(test.AppTestCase):
                          'application/json; charset=utf-8')
         data = json.loads(response.content[0].decode('utf-8'))
         self.assertTrue('token' in data)
+
+    def test_token_cache(self):
+        backend = self.app.auth_backend.backends[0]
+        request = self.app.wsgi_request()
+        user = backend.create_user(request,
+                                   username='jwtcache',
+                                   email='jwtcache@pippo.com',
+                                   password='pluto')
+        token = backend.create_token(request, user)
+        cache = backend.token_cache(self.app)
+        hits = cache.hits
+        data = backend.token_claims(request, token)
+        self.assertEqual(data['user_id'], user.id)
+        self.assertEqual(backend.token_claims(request, token), data)
+        self.assertEqual(cache.hits, hits + 1)
+        backend.revoke_token(request, token)
+        self.assertEqual(backend.token_claims(request, token), None)
+        token = backend.create_token(request, user)
+        self.assertTrue(backend.token_claims(request, token))
+        self.app.auth_backend.revoke_user(request, user)
+        self.assertEqual(backend.token_claims(request, token), None)
+        # tokens issued after the revocation are valid
+        token = backend.create_token(request, user)
+        self.assertTrue(backend.token_claims(request, token))
+        # changing the password revokes them
+        self.app.auth_backend.set_password(request, user, 'pippo')
+        self.assertEqual(backend.token_claims(request, token), None)
+
+    def test_token_revoked_request(self):
+        backend = self.app.auth_backend
+        request = self.app.wsgi_request()
+        user = backend.create_user(request,
+                                   username='jwtrevoked',
+                                   email='jwtrevoked@pippo.com',
+                                   password='pluto')
+        token_backend = backend.backends[0]
+        tokens = [backend.create_token(request, user),
+                  TokenBackend.create_token(token_backend, request, user)]
+
+        def authenticated(token):
+            auth = 'Bearer %s' % token.decode('utf-8')
+            request = self.app.wsgi_request(
+                extra={'HTTP_AUTHORIZATION': auth})
+            backend.request(request)
+            return request.cache.user
+
+        for token in tokens:
+            self.assertEqual(authenticated(token).id, user.id)
+        backend.revoke_user(request, user)
+        for token in tokens:
+            self.assertTrue(authenticated(token).is_anonymous())
+
+    def test_user_cache(self):
+        backend = self.app.auth_backend
+        request = self.app.wsgi_request()
+        user = backend.create_user(request,
+                                   username='cached',
+                                   email='cached@pippo.com',
+                                   password='pluto')
+        cache = backend.backends[0].user_cache(self.app)
+        user1 = backend.get_user(request, user_id=user.id)
+        hits = cache.hits
+        request = self.app.wsgi_request()
+        cached = backend.get_user(request, username='cached')
+        self.assertEqual(cached.id, user1.id)
+        # each request gets its own instance
+        self.assertNotEqual(cached, user1)
+        request = self.app.wsgi_request()
+        cached = backend.get_user(request, email='cached@pippo.com')
+        self.assertEqual(cached.username, 'cached')
+        self.assertEqual(cache.hits, hits + 4)
+        # committed changes invalidate the cache
+        backend.set_password(request, cached, 'pippo')
+        request = self.app.wsgi_request()
+        user2 = backend.get_user(request, username='cached')
+        self.assertEqual(backend.backends[0].decript(user2.password), 'pippo')
+
+
+class TestOdmAfterRest(test.TestCase):
+    config_file = 'tests.auth'
+    config_params = {'DATASTORE': 'sqlite://',
+                     'EXTENSIONS': ['lux.extensions.base',
+                                    'lux.extensions.rest',
+                                    'lux.extensions.auth',
+                                    'lux.extensions.odm']}
+
+    def test_on_commit(self):
+        app = self.application()
+        backend = app.auth_backend.backends[0]
+        handlers = [handler.extension for handler in app.events['on_commit']]
+        self.assertTrue(app.auth_backend in handlers)
+        self.assertFalse(backend in handlers)
+        cache = backend.user_cache(app)
+        cache.set(('id', 1), {'id': 1, 'username': 'pippo'})
+        user = app.odm().user(id=1, username='pippo')
+        app.fire('on_commit', [(user, 'update')])
+        self.assertEqual(cache.get(('id', 1)), None)
@@ -0,0 +1,210 @@
+import os
+import time
+import shutil
+import tempfile
+
+import lux
+from lux import create_cache, MemoryCache, FileCache, SharedMemoryCache
+from lux.utils import test
+
+
+class CacheTests(test.TestCase):
+    config_file = 'tests.config'
+
+    def check_cache(self, cache):
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.get('a', 5), 5)
+        cache.set('a', {'foo': 1})
+        self.assertEqual(cache.get('a'), {'foo': 1})
+        self.assertFalse(cache.add('a', 3))
+        self.assertTrue(cache.add('b', 3))
+        self.assertEqual(cache.incr('b'), 4)
+        self.assertEqual(cache.incr('c', 2), 2)
+        self.assertTrue(cache.delete('a'))
+        self.assertFalse(cache.delete('a'))
+        # expiry
+        cache.set('d', 1, timeout=0.01)
+        time.sleep(0.02)
+        self.assertEqual(cache.get('d'), None)
+        self.assertTrue(cache.add('d', 2))
+        # eviction of least recently used
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        for n in range(cache.max_entries):
+            cache.set(n, n)
+        cache.get(0)
+        cache.set('z', 1)
+        self.assertEqual(len(cache), cache.max_entries)
+        self.assertEqual(cache.get(0), 0)
+        self.assertEqual(cache.get(1), None)
+        stats = cache.stats()
+        self.assertTrue(stats['hits'])
+        self.assertTrue(stats['misses'])
+        self.assertTrue(stats['evictions'])
+
+    def test_app_cache(self):
+        app = self.application()
+        self.assertIsInstance(app.cache_server, MemoryCache)
+        request = app.wsgi_request()
+        self.assertEqual(request.cache_server, app.cache_server)
+
+    def test_unknown_scheme(self):
+        self.assertRaises(lux.ImproperlyConfigured, create_cache, None,
+                          'foo://')
+
+    def test_memory(self):
+        cache = create_cache(None, 'memory://?max_entries=5&timeout=60')
+        self.assertIsInstance(cache, MemoryCache)
+        self.assertEqual(cache.timeout, 60)
+        self.check_cache(cache)
+
+    def test_file(self):
+        directory = tempfile.mkdtemp()
+        try:
+            cache = create_cache(None, 'file://%s?max_entries=5' % directory)
+            self.assertIsInstance(cache, FileCache)
+            self.check_cache(cache)
+        finally:
+            shutil.rmtree(directory)
+        # without a path the cache is stored in a private directory
+        cache = create_cache(None, 'file://')
+        self.assertEqual(os.stat(cache.directory).st_mode & 0o077, 0)
+
+    def test_shared_memory(self):
+        cache = create_cache(None, 'shm://luxtest%s?max_entries=5' %
+                             os.getpid())
+        self.assertIsInstance(cache, SharedMemoryCache)
+        try:
+            self.check_cache(cache)
+        finally:
+            cache.connection.close()
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(cache.path + suffix):
+                    os.remove(cache.path + suffix)
+
+    def test_response_cache(self):
+        app = self.application(RESPONSE_CACHE_TIMEOUT=60)
+        calls = []
+
+        class Page(lux.HtmlRouter):
+
+            def get(self, request):
+                calls.append(request)
+                response = request.response
+                response.content_type = 'text/html'
+                response.content = 'Hello'
+                return response
+
+        app.handler.middleware.append(Page('page'))
+        app.handler.middleware.append(Page('private', response_cache=False))
+
+        def get(path, **extra):
+            request, sr = self.request_start_response(
+                app, path=path, HTTP_ACCEPT='text/html', **extra)
+            response = app(request.environ, sr)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(b''.join(response.content), b'Hello')
+            return response
+
+        get('/page')
+        get('/page')
+        self.assertEqual(len(calls), 1)
+        get('/page', HTTP_AUTHORIZATION='Bearer foo')
+        self.assertEqual(len(calls), 2)
+        app.response_cache.purge('/page')
+        get('/page')
+        self.assertEqual(len(calls), 3)
+        get('/private')
+        get('/private')
+        self.assertEqual(len(calls), 5)
+        # cached responses have an age
+        response = get('/page')
+        self.assertEqual(len(calls), 5)
+        self.assertEqual(response['Age'], '0')
+        # purge all paths
+        app.response_cache.purge()
+        get('/page')
+        get('/page')
+        self.assertEqual(len(calls), 6)
+        # an evicted purge time does not serve stale responses
+        app.cache_server.delete(app.response_cache.purge_key)
+        app.response_cache._purged = (0, 0)
+        get('/page')
+        self.assertEqual(len(calls), 7)
+
+    def test_response_cache_per_request_headers(self):
+        app = self.application(RESPONSE_CACHE_TIMEOUT=60,
+                               RESPONSE_CACHE_VARY=[])
+        calls = []
+
+        class Page(lux.HtmlRouter):
+
+            def get(self, request):
+                calls.append(request)
+                response = request.response
+                response.content_type = 'text/html'
+                response.content = 'Hello'
+                origin = request.get('HTTP_ORIGIN')
+                if origin:
+                    response['Access-Control-Allow-Origin'] = origin
+                return response
+
+        app.handler.middleware.append(Page('page'))
+
+        def get(**extra):
+            request, sr = self.request_start_response(
+                app, path='/page', HTTP_ACCEPT='text/html', **extra)
+            response = app(request.environ, sr)
+            self.assertEqual(response.status_code, 200)
+            return response
+
+        get(HTTP_ORIGIN='http://a.example.com')
+        response = get(HTTP_ORIGIN='http://b.example.com')
+        self.assertEqual(len(calls), 1)
+        origin = response.headers.get('Access-Control-Allow-Origin')
+        self.assertNotEqual(origin, 'http://a.example.com')
+        key = app.response_cache.key('/page')
+        for entry in app.cache_server.get(key).values():
+            names = [name.lower() for name, _ in entry[1]]
+            self.assertFalse('access-control-allow-origin' in names)
+        # the accept encoding selects a variant even if not configured
+        self.assertEqual(app.response_cache.vary, ('HTTP_ACCEPT_ENCODING',))
+        get(HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(len(calls), 2)
+
+    def test_fragment_cache(self):
+        app = self.application()
+        calls = []
+
+        class Post(lux.HtmlRouter):
+
+            @lux.cache_fragment(60, tags=('blog', 'post:{slug}'))
+            def get_html(self, request):
+                calls.append(request)
+                return 'post %s' % request.urlargs['slug']
+
+        router = Post('<slug>')
+
+        def get(slug):
+            request = app.wsgi_request(path='/%s' % slug, app_handler=router,
+                                       urlargs={'slug': slug})
+            return router.get_html(request)
+
+        self.assertEqual(get('foo'), 'post foo')
+        self.assertEqual(get('foo'), 'post foo')
+        self.assertEqual(get('bla'), 'post bla')
+        self.assertEqual(len(calls), 2)
+        lux.invalidate_fragments(app, 'post:foo')
+        self.assertEqual(get('foo'), 'post foo')
+        self.assertEqual(get('bla'), 'post bla')
+        self.assertEqual(len(calls), 3)
+        lux.invalidate_fragments(app, 'blog')
+        self.assertEqual(get('bla'), 'post bla')
+        self.assertEqual(len(calls), 4)
+        # an evicted invalidation time does not serve stale fragments
+        self.assertEqual(get('bla'), 'post bla')
+        self.assertEqual(len(calls), 4)
+        app.cache_server.delete('lux:fragment-tag:%s:post:bla' %
+                                app.config_module)
+        self.assertEqual(get('bla'), 'post bla')
+        self.assertEqual(len(calls), 5)
@@ -26,10 +26,27 @@ class CommandTests(test.TestCase):
     def test_serve(self):
         command = self.fetch_command('serve')
         self.assertTrue(command.help)
-        self.assertEqual(len(command.option_list), 0)
+        self.assertEqual(len(command.option_list), 1)
         app = command(['-b', ':9000'], start=False)
         self.assertEqual(app, command.app)
 
+    def test_serve_warm(self):
+        app = self.application()
+        self.assertEqual(app.warm(), app)
+        self.assertTrue(app.handler)
+        self.assertEqual(app.wsgi_handler, app.handler)
+        fired = []
+        app.on_fork = lambda app: fired.append(app)
+        app.bind_events(app, ('on_fork',))
+        # same process, nothing to do
+        app.post_fork()
+        self.assertEqual(fired, [])
+        # a process forked from the warmed one
+        app._warm_pid = -1
+        app.post_fork()
+        self.assertEqual(fired, [app])
+        self.assertEqual(app._warm_pid, os.getpid())
+
     def test_generate_key(self):
         command = self.fetch_command('generate_secret_key')
         self.assertTrue(command.help)
@@ -46,3 +63,31 @@ class CommandTests(test.TestCase):
         command([])
         data = command.app.stdout.getvalue()
         self.assertTrue(data)
+
+    def test_stats(self):
+        from lux import CommandError
+        command = self.fetch_command('stats')
+        self.assertTrue(command.help)
+        self.assertRaises(CommandError, command, [])
+
+    def test_command_manifest(self):
+        from lux.core.manifest import CommandManifest
+        app = self.application()
+        extensions = app.config['EXTENSIONS']
+        manifest = CommandManifest(app.config_module, extensions)
+        commands = manifest.commands()
+        self.assertEqual(commands, app.commands)
+        self.assertTrue('serve' in commands['lux'])
+        locations = manifest.locations()
+        self.assertEqual(manifest.load(locations), commands)
+        # stale manifest
+        locations[0][2] = 0
+        self.assertEqual(manifest.load(locations), None)
+        # manifest used without checking locations while the stamp matches
+        manifest = CommandManifest(app.config_module, extensions,
+                                   stamp='v1')
+        self.assertEqual(manifest.commands(), commands)
+        manifest.locations = None
+        self.assertEqual(manifest.commands(), commands)
+        self.assertTrue(os.path.basename(os.path.dirname(manifest.path))
+                        .startswith('lux'))
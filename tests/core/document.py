@@ -0,0 +1,95 @@
+from pulsar import Http404
+
+from lux.utils import test
+
+
+class DocumentTests(test.TestCase):
+    config_file = 'tests.config'
+
+    def test_prototype(self):
+        app = self.application(HTML_LINKS=['bla.css'], FAVICON='icon.ico')
+        prototype = app.html_prototype
+        self.assertEqual(prototype, app.html_prototype)
+        links = prototype.head.links.children
+        self.assertEqual(len(links), 1)
+        self.assertTrue('icon.ico' in links[0])
+
+    def test_clone(self):
+        app = self.application(HTML_LINKS=['bla.css'])
+        request = app.wsgi_request()
+        doc1 = app.html_document(request)
+        doc2 = app.html_document(request)
+        self.assertNotEqual(doc1, doc2)
+        self.assertNotEqual(doc1.head, app.html_prototype.head)
+        self.assertEqual(doc1.meta.head, doc1.head)
+        doc1.head.scripts.require.append('foo')
+        doc1.jscontext['foo'] = 'bla'
+        doc1.head.links.append('foo.css')
+        self.assertFalse('foo' in doc2.head.scripts.require)
+        self.assertFalse('foo' in doc2.jscontext)
+        self.assertFalse('foo' in app.html_prototype.jscontext)
+        self.assertEqual(len(doc2.head.links.children), 1)
+        self.assertEqual(len(doc1.head.links.children), 2)
+        self.assertTrue('bla.css' in doc2.head.links.children[-1])
+
+    def test_jscontext(self):
+        import json
+        from lux.core import JsContext
+        ctx = JsContext(foo='bla', navbar={'collapseWidth': 768},
+                        menu={'items': [1]})
+        ctx.freeze()
+        clone = ctx.copy()
+        clone['page'] = 'home'
+        clone['navbar']['theme'] = 'inverse'
+        # nested values are not shared
+        dict(clone.items())['menu']['items'].append(2)
+        clone.update_encoded(JsContext.encode({'states': ['home']}))
+        data = json.loads(clone.dumps())
+        self.assertEqual(data, {'foo': 'bla',
+                                'navbar': {'collapseWidth': 768,
+                                           'theme': 'inverse'},
+                                'menu': {'items': [1, 2]},
+                                'page': 'home',
+                                'states': ['home']})
+        self.assertEqual(json.loads(ctx.dumps()),
+                         {'foo': 'bla', 'navbar': {'collapseWidth': 768},
+                          'menu': {'items': [1]}})
+
+    def test_html_streaming(self):
+        import lux
+        app = self.application(HTML_STREAMING=True)
+        calls = []
+
+        class Page(lux.HtmlRouter):
+
+            def get_html(self, request):
+                calls.append(request)
+                request.html_document.jscontext['page'] = 'foo'
+                return 'Hello'
+
+        router = Page('page')
+        request = app.wsgi_request(path='/page', app_handler=router,
+                                   extra={'HTTP_ACCEPT': 'text/html'})
+        response = router.get(request)
+        self.assertTrue(response.is_streamed)
+        # the inner html is resolved before the response is returned
+        self.assertEqual(len(calls), 1)
+        chunks = iter(response.content)
+        head = next(chunks)
+        self.assertTrue(head.startswith('<!DOCTYPE html>'))
+        self.assertTrue('</head>' in head)
+        self.assertTrue('"page": "foo"' in head)
+        body = next(chunks)
+        self.assertTrue('Hello' in body)
+        self.assertEqual(next(chunks), '</body>\n</html>')
+        # errors are raised before the status and headers are sent
+
+        class Missing(lux.HtmlRouter):
+
+            def get_html(self, request):
+                raise Http404
+
+        router = Missing('missing')
+        request = app.wsgi_request(path='/missing', app_handler=router,
+                                   extra={'HTTP_ACCEPT': 'text/html'})
+        self.assertRaises(Http404, router.get, request)
@@ -0,0 +1,157 @@
+import os
+import gzip
+import asyncio
+import shutil
+import hashlib
+import tempfile
+
+import lux
+from lux.utils import test
+from lux.utils.http import etag_match, weak_etag, accept_encodings
+from lux.extensions.base.cache import ResponseCache, CACHE_KEY
+from lux.extensions.base.encoding import EncodingMiddleware
+from lux.extensions.base.media import MediaRouter
+
+
+class EncodingTests(test.TestCase):
+    config_file = 'tests.config'
+
+    def response(self, app, content, **extra):
+        request = app.wsgi_request(extra=extra)
+        request.response.content_type = 'text/html'
+        request.response.content = content
+        return request, request.response
+
+    def test_etag_match(self):
+        self.assertTrue(etag_match('"a"', '"a"'))
+        self.assertTrue(etag_match('W/"a"', '"a"'))
+        self.assertTrue(etag_match('"b", W/"a"', 'W/"a"'))
+        self.assertTrue(etag_match('*', '"a"'))
+        self.assertFalse(etag_match('"b"', '"a"'))
+        self.assertFalse(etag_match(None, '"a"'))
+        self.assertTrue(weak_etag(1).startswith('W/"'))
+
+    def test_single_pass(self):
+        app = self.application()
+        content = (b'Hello ' * 100, b'World')
+        middleware = EncodingMiddleware(200, True)
+        request, response = self.response(app, content,
+                                          HTTP_ACCEPT_ENCODING='gzip')
+        middleware(request.environ, response)
+        body = b''.join(content)
+        etag = '"%s-gzip"' % hashlib.md5(body).hexdigest()
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content[0]), body)
+        # not modified
+        request, response = self.response(app, content,
+                                          HTTP_ACCEPT_ENCODING='gzip',
+                                          HTTP_IF_NONE_MATCH=etag)
+        middleware(request.environ, response)
+        self.assertEqual(response.status_code, 304)
+        # no compression
+        request, response = self.response(app, content)
+        middleware(request.environ, response)
+        self.assertEqual(response['ETag'],
+                         '"%s"' % hashlib.md5(body).hexdigest())
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_content_version(self):
+        app = self.application()
+        calls = []
+
+        class Page(lux.HtmlRouter):
+
+            def content_version(self, request):
+                return 'v1'
+
+            def get_html(self, request):
+                calls.append(request)
+                return 'Hello'
+
+        router = Page('page')
+        request = app.wsgi_request(
+            extra={'HTTP_IF_NONE_MATCH': weak_etag('v1')})
+        response = router.get(request)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], weak_etag('v1'))
+        self.assertFalse(calls)
+
+    def test_precompressed_media(self):
+        self.assertEqual(accept_encodings('gzip, br;q=0, deflate;q=0.5'),
+                         set(('gzip', 'deflate')))
+        app = self.application()
+        directory = tempfile.mkdtemp()
+        try:
+            body = b'body {color: red;}\n' * 20
+            with open(os.path.join(directory, 'site.css'), 'wb') as f:
+                f.write(body)
+            cmd = self.fetch_command('compress_media')
+            written = cmd(['--directory', directory])
+            self.assertTrue(os.path.join(directory, 'site.css.gz') in written)
+            self.assertFalse(cmd(['--directory', directory]))
+            router = MediaRouter('media', directory, lux=False,
+                                 precompressed=True)
+
+            def get(encoding=None):
+                extra = {}
+                if encoding:
+                    extra['HTTP_ACCEPT_ENCODING'] = encoding
+                request = app.wsgi_request(path='/media/site.css',
+                                           urlargs={'path': 'site.css'},
+                                           extra=extra)
+                return router.get(request)
+
+            response = get('gzip')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+            self.assertEqual(response.content_type, 'text/css')
+            self.assertEqual(gzip.decompress(response.content[0]), body)
+            response = get()
+            self.assertFalse(response.has_header('Content-Encoding'))
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+            self.assertEqual(response.content[0], body)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_thread_compression(self):
+        app = self.application()
+        body = b'Hello World ' * 1000
+        middleware = EncodingMiddleware(200, thread_length=1000)
+        cache = ResponseCache(app, 60)
+        request, response = self.response(app, (body,),
+                                          HTTP_ACCEPT_ENCODING='gzip')
+        request.cache.app_handler = lux.HtmlRouter('/')
+        request.environ[CACHE_KEY] = (cache.key('/'), 'gzip')
+        middleware(request.environ, response)
+        cache.store(request.environ, response)
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        chunks = list(response.content)
+        self.assertEqual(len(chunks), 1)
+        compressed = yield from chunks[0].encode('utf-8')
+        self.assertEqual(gzip.decompress(compressed), body)
+        # the compressed body is cached
+        yield from asyncio.sleep(0)
+        entry = app.cache_server.get(cache.key('/'))['gzip']
+        self.assertEqual(entry[2], compressed)
+
+    def test_stream_compression(self):
+        app = self.application()
+        content = (('Hello %d ' % n).encode() for n in range(100))
+        middleware = EncodingMiddleware(200, streams=True)
+        request, response = self.response(app, content,
+                                          HTTP_ACCEPT_ENCODING='gzip')
+        middleware(request.environ, response)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        body = gzip.decompress(b''.join(response.content))
+        self.assertEqual(body, b''.join((('Hello %d ' % n).encode()
+                                         for n in range(100))))
+
+    def test_compress_level(self):
+        middleware = EncodingMiddleware(200, level=6, max_lag=0.1)
+        self.assertEqual(middleware.compress_level(), 6)
+        middleware.loop_lag.lag = 0.06
+        self.assertEqual(middleware.compress_level(), 3)
+        middleware.loop_lag.lag = 0.2
+        self.assertEqual(middleware.compress_level(), 1)
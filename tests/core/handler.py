@@ -0,0 +1,133 @@
+from lux.utils import test
+from lux.core.app import WsgiGreen
+from lux.core.handler import LuxHandler, RouteIndex
+
+from pulsar import Future
+from pulsar.apps.wsgi import Router
+
+
+def middleware(environ, start_response):
+    pass
+
+
+class CustomRouter(Router):
+
+    def resolve(self, path, urlargs=None):
+        pass
+
+
+class GreenPool:
+
+    def __init__(self):
+        self.tasks = []
+
+    def submit(self, func, *args):
+        future = Future()
+        self.tasks.append((func, args))
+        return future
+
+
+class RouteIndexTests(test.TestCase):
+    config_file = 'tests.config'
+
+    def test_candidates(self):
+        api = Router('api/', Router('users'))
+        about = Router('about', Router('team'))
+        blog = Router('blog/<slug>')
+        custom = CustomRouter('custom')
+        root = Router('/')
+        index = RouteIndex([middleware, api, about, blog, custom, root])
+        self.assertEqual(len(index), 6)
+        self.assertEqual(index.candidates('/api/users'),
+                         [middleware, api, custom, root])
+        self.assertEqual(index.candidates('/about/team'),
+                         [middleware, about, custom, root])
+        self.assertEqual(index.candidates('/blog/foo'),
+                         [middleware, blog, custom, root])
+        self.assertEqual(index.candidates('/foo'),
+                         [middleware, custom, root])
+
+    def test_application_handler(self):
+        app = self.application()
+        handler = app.handler
+        self.assertIsInstance(handler, LuxHandler)
+        self.assertIsNotNone(handler.route_index)
+        self.assertTrue(handler.route_index.valid(handler.middleware))
+        handler.middleware = list(handler.middleware)
+        request = app.wsgi_request(path='/')
+        handler.get_middleware(request.environ)
+        self.assertTrue(handler.route_index.valid(handler.middleware))
+        # replacing an entry in place invalidates the index
+        handler.middleware[0] = middleware
+        self.assertFalse(handler.route_index.valid(handler.middleware))
+        candidates = handler.get_middleware(request.environ)
+        self.assertEqual(candidates[0], middleware)
+        self.assertTrue(handler.route_index.valid(handler.middleware))
+
+
+class GreenPoolTests(test.TestCase):
+    config_file = 'tests.config'
+
+    def test_green_pool(self):
+        app = self.application()
+        pool = GreenPool()
+        green = WsgiGreen(app, pool, 1, max_size=2, max_queue=1)
+        environ = app.wsgi_request().environ
+        green(environ, None)
+        green(environ, None)
+        self.assertEqual(green.size, 2)
+        waiter = green(environ, None)
+        self.assertEqual(len(green.queue), 1)
+        response = green(environ, None)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(pool.tasks), 2)
+        data = green.tojson()
+        self.assertEqual(data['active'], 2)
+        self.assertEqual(data['queued'], 1)
+        self.assertEqual(data['saturation'], 1)
+        self.assertEqual(data['rejected'], 1)
+        # a request completes and the waiting one is submitted
+        green._done(None)
+        self.assertEqual(len(pool.tasks), 3)
+        self.assertFalse(green.queue)
+        self.assertFalse(waiter.done())
+        green.shrink_interval = 0
+        green._done(None)
+        green._done(None)
+        self.assertEqual(green.size, 1)
+
+
+class ErrorPageTests(test.TestCase):
+    config_file = 'tests.config'
+
+    def test_error_pages(self):
+        app = self.application(ERROR_404_FAST_PATHS=r'\.php$')
+        app.get_handler()
+        self.assertTrue(404 in app.error_pages)
+        self.assertTrue(500 in app.error_pages)
+
+        def get(path):
+            request, sr = self.request_start_response(
+                app, path=path, HTTP_ACCEPT='text/html')
+            response = app(request.environ, sr)
+            self.assertEqual(response.status_code, 404)
+            return response
+
+        response = get('/foo')
+        self.assertEqual(response.content_type, 'text/html')
+        body = response.content[0].decode('utf-8')
+        self.assertTrue('Cannot find what you are looking for.' in body)
+        self.assertTrue('404 Not Found' in body)
+        response = get('/index.php')
+        self.assertEqual(response.content_type, 'text/plain')
+
+    def test_error_pages_failure(self):
+        app = self.application()
+
+        def render_template(*args, **kwargs):
+            raise RuntimeError('template engine not available')
+
+        app.render_template = render_template
+        # pages which fail to render are rendered when first served
+        app.get_handler()
+        self.assertFalse(app.error_pages)
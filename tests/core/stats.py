@@ -0,0 +1,81 @@
+import json
+
+from lux.utils import test
+from lux.utils.stats import LatencyStats, Stats
+
+
+class StatsTests(test.TestCase):
+    config_file = 'tests.config'
+
+    def test_latency_stats(self):
+        stats = LatencyStats()
+        self.assertEqual(stats.percentile(50), 0)
+        for n in range(100):
+            stats.add(0.001 if n < 90 else 0.1)
+        self.assertEqual(stats.count, 100)
+        self.assertAlmostEqual(stats.total, 1.09)
+        self.assertTrue(stats.percentile(50) < 0.002)
+        self.assertEqual(stats.percentile(99), 0.1)
+        data = stats.tojson()
+        self.assertEqual(data['count'], 100)
+        self.assertEqual(data['max'], 0.1)
+
+    def test_stats_registry(self):
+        stats = Stats()
+        stats['foo'].add(0.1)
+        self.assertEqual(stats['foo'].count, 1)
+        stats.reset()
+        self.assertEqual(stats['foo'].count, 0)
+
+    def test_compiled_events(self):
+        app = self.application()
+        self.assertTrue(app._dispatch)
+        self.assertEqual(app._dispatch.get('on_form', ()), ())
+        self.assertFalse(app.stats)
+
+    def test_event_stats(self):
+        app = self.application(EVENT_STATS=True, STATS_URL='/_stats')
+
+        class Extension:
+
+            def on_html_document(self, app, request, doc):
+                doc.jscontext['foo'] = 'bla'
+
+        app.bind_events(Extension())
+        doc = app.html_document(app.wsgi_request())
+        self.assertEqual(doc.jscontext['foo'], 'bla')
+        names = [name for name in app.stats
+                 if name.startswith('on_html_document:')]
+        self.assertTrue(names)
+        request = self.request(app, path='/_stats',
+                               HTTP_ACCEPT='application/json')
+        data = json.loads(request.response.content[0].decode('utf-8'))
+        self.assertTrue(data)
+
+    def test_rolling_stats(self):
+        from lux.utils.stats import RollingStats
+        stats = RollingStats(interval=60, windows=2)
+        stats.add(0.1)
+        stats.add(0.2)
+        self.assertEqual(stats.merged().count, 2)
+        self.assertEqual(stats.tojson()['max'], 0.2)
+        stats.reset()
+        self.assertEqual(stats.merged().count, 0)
+
+    def test_middleware_stats(self):
+        from lux.core.handler import ProfilingHandler
+        app = self.application(MIDDLEWARE_STATS=True, STATS_URL='/_stats')
+        self.assertIsInstance(app.handler, ProfilingHandler)
+        request, sr = self.request_start_response(
+            app, path='/_stats', HTTP_ACCEPT='application/json')
+        self.assertEqual(app(request.environ, sr).status_code, 403)
+        app.stats.reset()
+        app.debug = True
+        request = self.request(app, path='/_stats',
+                               HTTP_ACCEPT='application/json')
+        self.assertEqual(request.response.status_code, 200)
+        stats = app.stats
+        self.assertTrue(stats['extension:lux.extensions.base'].merged().count)
+        routes = [name for name in stats if name.startswith('route:')]
+        self.assertEqual(len(routes), 1)
+        self.assertEqual(stats[routes[0]].merged().count, 1)
@@ -0,0 +1,167 @@
+import os
+import time
+import shutil
+import tempfile
+
+from lux.utils import test
+
+
+class TemplateTests(test.TestCase):
+    config_file = 'tests.config'
+
+    def test_template_index(self):
+        app = self.application()
+        loader = app.template_loader
+        self.assertTrue(loader.paths)
+        self.assertTrue('home.html' in loader)
+        self.assertFalse('foo/bla.html' in loader)
+        path = app.template_full_path('home.html')
+        self.assertTrue(path.endswith('home.html'))
+        self.assertEqual(path, loader.full_path(['foo.html', 'home.html']))
+
+    def test_template_source(self):
+        app = self.application()
+        self.assertTrue(app.template('home.html'))
+        self.assertEqual(app.template('foo/bla.html'), '')
+
+    def test_compiled_template_cache(self):
+        app = self.application()
+        engine = app.template_engine()
+        t1 = app.template_loader.get('error.html', engine)
+        t2 = app.template_loader.get('error.html', engine)
+        self.assertEqual(t1, t2)
+        text = app.render_template('error.html', {'status_code': 404})
+        self.assertTrue('404' in text)
+
+    def test_debug_dependencies(self):
+        from lux.core.loader import TemplateLoader
+        directory = tempfile.mkdtemp()
+
+        def write(name, text):
+            with open(os.path.join(directory, name), 'w') as fp:
+                fp.write(text)
+            # make sure the modification time changes
+            os.utime(os.path.join(directory, name),
+                     (time.time(), time.time() + len(text)))
+
+        try:
+            write('base.html', '[{% block main %}{% endblock %}]')
+            write('child.html', '{% extends "base.html" %}'
+                                '{% block main %}{% include "inc.html" %}'
+                                '{% endblock %}')
+            write('inc.html', 'a')
+            app = self.application()
+            loader = TemplateLoader(app, [directory])
+            loader.debug = True
+            engine = app.template_engine('lux')
+            self.assertEqual(loader.get('child.html', engine)({}), '[a]')
+            self.assertEqual(loader.source('inc.html'), 'a')
+            write('inc.html', 'bb')
+            write('base.html', '<{% block main %}{% endblock %}>')
+            self.assertEqual(loader.get('child.html', engine)({}), '<bb>')
+            self.assertEqual(loader.source('inc.html'), 'bb')
+        finally:
+            shutil.rmtree(directory)
+
+    def test_lux_engine(self):
+        app = self.application()
+        engine = app.template_engine('lux')
+        text = engine('{% for x in items %}{{ x.name|upper }},'
+                      '{% else %}empty{% endfor %}',
+                      {'items': [{'name': 'a'}, {'name': 'b'}]})
+        self.assertEqual(text, 'A,B,')
+        text = engine('{% for x in items %}{{ x }}{% else %}empty{% endfor %}',
+                      {})
+        self.assertEqual(text, 'empty')
+        text = engine('{% if n > 1 %}many{% elif n %}one{% else %}none'
+                      '{% endif %}', {'n': 1})
+        self.assertEqual(text, 'one')
+        self.assertEqual(engine('{{ foo.bla }}{# comment #}', {}), '')
+        # comprehensions see the context and loop variables
+        self.assertEqual(engine('{{ [x for x in items if x > n] }}',
+                                {'items': [1, 2, 3], 'n': 1}), '[2, 3]')
+        self.assertEqual(engine('{% for a in items %}'
+                                '{{ [a*b for b in items] }}{% endfor %}',
+                                {'items': [1, 2]}), '[1, 2][2, 4]')
+        # only safe builtins
+        self.assertEqual(engine('{{ open }}{{ len(items) }}',
+                                {'items': [1]}), '1')
+
+    def test_lux_engine_inheritance(self):
+        engine = self.application().template_engine('lux')
+        sources = {'base.html': '<title>{% block title %}lux{% endblock %}'
+                                '</title>{% block main %}{% endblock %}',
+                   'child.html': '{% extends "base.html" %}'
+                                 '{% block main %}{{ text }}'
+                                 '{% include "inc.html" %}{% endblock %}',
+                   'inc.html': '!'}
+
+        class Loader:
+
+            def get(self, name, engine, parent=None):
+                return engine.compile(sources[name], name, self)
+
+        child = Loader().get('child.html', engine)
+        self.assertEqual(child({'text': 'hi'}), '<title>lux</title>hi!')
+
+    def test_lux_engine_errors(self):
+        from lux.core.compiler import TemplateError
+        engine = self.application().template_engine('lux')
+        self.assertRaises(TemplateError, engine.compile, '{% if x %}')
+        self.assertRaises(TemplateError, engine.compile, '{{ x|foo }}')
+        self.assertRaises(TemplateError, engine.compile, '{% endblock %}')
+        self.assertRaises(TemplateError, engine.compile,
+                          '{% if x %}{% else %}{% elif y %}{% endif %}')
+        # names starting with an underscore are not available
+        self.assertRaises(TemplateError, engine.compile, '{{ __builtins__ }}')
+        self.assertRaises(TemplateError, engine.compile, '{% set _w = 1 %}')
+
+    def test_lux_engine_attributes(self):
+        engine = self.application().template_engine('lux')
+        self.assertEqual(engine('{{ x.__class__ }}{{ x._y }}{{ x.upper() }}',
+                                {'x': 'a'}), 'A')
+        self.assertEqual(engine('{{ "{0.__class__}".format(x) }}',
+                                {'x': 'a'}), '')
+
+    def test_layered_context(self):
+        from lux.core import TemplateContext
+        app = self.application()
+        request = app.wsgi_request()
+        context = app.context(request, {'foo': 'bla'})
+        self.assertIsInstance(context, TemplateContext)
+        self.assertEqual(context['foo'], 'bla')
+        self.assertEqual(context['EXTENSIONS'], app.config['EXTENSIONS'])
+        context['EXTENSIONS'] = []
+        self.assertEqual(context['EXTENSIONS'], [])
+        self.assertNotEqual(app.config['EXTENSIONS'], [])
+        self.assertRaises(KeyError, lambda: context['xxxx'])
+
+    def test_lazy_context_keys(self):
+        from lux.core import TemplateContext
+        calls = []
+
+        class Extension:
+
+            def context(self, request, context):
+                calls.append(request)
+                context['nav'] = 'hello'
+
+        context = TemplateContext('request', {}, {'foo': 1},
+                                  {'nav': Extension()})
+        self.assertEqual(context['foo'], 1)
+        self.assertFalse(calls)
+        self.assertTrue('nav' in context)
+        self.assertEqual(context['nav'], 'hello')
+        self.assertEqual(context.get('nav'), 'hello')
+        self.assertEqual(calls, ['request'])
+        self.assertEqual(sorted(context), ['foo', 'nav'])
+        # derived contexts keep the request and the layers
+        child = context.new_child({'bla': 2})
+        self.assertIsInstance(child, TemplateContext)
+        self.assertEqual(child.request, 'request')
+        self.assertEqual(child['bla'], 2)
+        self.assertEqual(child['nav'], 'hello')
+        self.assertEqual(child.parents['foo'], 1)
+        self.assertFalse('bla' in child.parents)
+        self.assertEqual(calls, ['request'])
+        self.assertEqual(dict(TemplateContext.fromkeys(('a',), 0)), {'a': 0})